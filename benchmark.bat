@@ -0,0 +1,4 @@
+SET CurrentDir=%~dp0
+SET PYTHONPATH=%CurrentDir%
+
+C:\Python311\python.exe -m hidenrga.tools.benchmark %*
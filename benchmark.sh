@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# Runs the simulator benchmarks, e.g. ./benchmark.sh --baseline baseline.json
+CurrentDir=$(dirname "$0")
+export PYTHONPATH="$CurrentDir"
+
+python3 -m hidenrga.tools.benchmark "$@"
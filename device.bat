@@ -1,5 +1,5 @@
 SET CurrentDir=%~dp0
 SET PYTHONPATH=%CurrentDir%
 
-C:\Python311\scripts\lewis-control.exe device
+C:\Python311\python.exe -m hidenrga.tools.control -r localhost:10000 %*
 
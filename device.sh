@@ -3,5 +3,5 @@
 CurrentDir=$(dirname "$0")
 export PYTHONPATH="$CurrentDir"
 
-lewis-control -r localhost:10000 device
-
+# Lists the device's API; with items, e.g. current_gas=He current_gas_pressure=4E-5, sets and gets them in one batch.
+python3 -m hidenrga.tools.control -r localhost:10000 "$@"
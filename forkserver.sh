@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# Starts simulator instances from one pre-warmed process, e.g. ./forkserver.sh --instances 50 --timing
+CurrentDir=$(dirname "$0")
+export PYTHONPATH="$CurrentDir"
+
+python3 -m hidenrga.tools.forkserver "$@"
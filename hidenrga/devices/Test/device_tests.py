@@ -7,7 +7,15 @@ parent = os.path.dirname(current)
 sys.path.append(parent)
 
 import device
+import accumulation
+import history
+import live
+import logqueue
 
+import logging
+import numpy as np
+import tempfile
+import time
 import unittest
 
 
@@ -61,6 +69,415 @@ class TestHidenRGASimulator(unittest.TestCase):
         self._simulator.current_row_stop = 30
         self.Ascan()
         
+    def test_scan_leaves_tuning_alone(self):
+        self._simulator.mass = 4
+        self._simulator.electron_energy = 70
+        self._simulator.noise = 0
+        self._simulator.cycles = 1
+        self._simulator.current_scan = "Ascans"
+        self._simulator.report = 0b10101
+        self._simulator.scan_output = "mass"
+        self._simulator.current_row = 0
+        self._simulator.current_row_step = 1.0
+        self._simulator.current_row_start = 1
+        self._simulator.current_row_stop = 30
+        self._simulator.dwell = 5
+        self._simulator.start("Ascans")
+        scanned_masses = set()
+        while self._simulator.stat:
+            position = self._simulator.scanning_at
+            if position is not None:
+                scanned_masses.add(position.mass)
+            self.assertEqual(self._simulator.mass, 4)
+            self.assertEqual(self._simulator.electron_energy, 70)
+            time.sleep(0.01)
+        self._simulator.join(None)
+        self.assertGreater(len(scanned_masses), 5)
+        self.assertIsNone(self._simulator.scanning_at)
+
+    def mass_scan_data(self, simulator):
+        simulator.F1 = True
+        simulator.current_gas = "H2O"
+        simulator.current_gas_pressure = 4E-7
+        simulator.dwell = 0
+        simulator.noise = 0
+        simulator.cycles = 2
+        simulator.current_scan = "Ascans"
+        # Bit 2 (mass) | Bit 0 (pressure)
+        simulator.report = 0b101
+        simulator.scan_output = "mass"
+        simulator.current_row = 0
+        simulator.current_row_step = 0.5
+        simulator.current_row_start = 1
+        simulator.current_row_stop = 30
+        simulator.start("Ascans")
+        simulator.join(None)
+        return simulator.data(True)
+
+    def test_acquisition_process(self):
+        expected = self.mass_scan_data(device.SimulatedHidenRGA())
+        simulator = device.SimulatedHidenRGA(acquisition_process=True)
+        try:
+            self.assertEqual(self.mass_scan_data(simulator), expected)
+        finally:
+            simulator.acquisition_process = False
+
+    def test_acquisition_process_stop(self):
+        expected = self.mass_scan_data(device.SimulatedHidenRGA())
+        simulator = device.SimulatedHidenRGA(acquisition_process=True)
+        try:
+            self.mass_scan_data(simulator)
+            for abort in [True, False]:
+                simulator.cycles = 0
+                simulator.dwell = 1
+                simulator.start("Ascans")
+                time.sleep(0.2)
+                simulator.stop(abort)
+                simulator.join(5)
+                self.assertFalse(simulator.stat)
+                self.assertTrue(simulator._acquisition.alive)
+            self.assertEqual(self.mass_scan_data(simulator), expected)
+        finally:
+            simulator.acquisition_process = False
+
+    def test_noiseless_spectra_cached(self):
+        first = self.mass_scan_data(self._simulator)
+        self.assertEqual(self._simulator.spectra.misses, 1)
+        self._simulator.cycles = 2
+        self._simulator.start("Ascans")
+        self._simulator.join(None)
+        self.assertEqual(self._simulator.data(True), first)
+        self.assertEqual(self._simulator.spectra.misses, 1)
+        self._simulator.current_gas_pressure = 5E-7
+        self._simulator.start("Ascans")
+        self._simulator.join(None)
+        self.assertEqual(self._simulator.spectra.misses, 2)
+
+    def test_noiseless_map_cached(self):
+        self._simulator.noise = 0
+        self._simulator.electron_energy = 10
+        self._simulator.cycles = 3
+        self._simulator.current_scan = "Ascans"
+        self._simulator.report = 0
+        self._simulator.scan_output = "electron-energy"
+        self._simulator.scan_input = "Bscans"
+        self._simulator.current_row = 0
+        self._simulator.current_row_step = 1
+        self._simulator.current_row_start = 20
+        self._simulator.current_row_stop = 99
+        self._simulator.current_scan = "Bscans"
+        self._simulator.report = 0b101
+        self._simulator.scan_output = "mass"
+        self._simulator.scan_input = "Faraday"
+        self._simulator.current_row = 0
+        self._simulator.current_row_step = 1
+        self._simulator.current_row_start = 1
+        self._simulator.current_row_stop = 10
+        self._simulator.start("Ascans")
+        self._simulator.join(None)
+        # One row per outer energy is built in the first cycle and reused in the others.
+        self.assertEqual(self._simulator.spectra.misses, 80)
+        self.assertEqual(self._simulator.spectra.hits, 160)
+
+    def mid_data(self, simulator):
+        simulator.noise = 0
+        simulator.emission = 500
+        simulator.cycles = 3
+        simulator.current_scan = "Ascans"
+        # Bit 2 (mass) | Bit 0 (pressure)
+        simulator.report = 0b101
+        simulator.mid_channels = [[2, 0], [4, 0, "SEM"], [18], [28, None, "Faraday", -12], [44]]
+        simulator.start("Ascans")
+        simulator.join(None)
+        return simulator.data(True)
+
+    def test_mid(self):
+        data = self.mid_data(self._simulator)
+        print("")
+        print(data)
+        self.assertEqual(data.count("[{2: "), 3)
+        self.assertEqual(data.count("28: 1e-12,"), 3)
+        self.assertTrue(data.endswith("44: 0.0,}]!"))
+        self._simulator.emok = False
+        self._simulator.start("Ascans")
+        self._simulator.join(None)
+        self.assertEqual(self._simulator.data(True), "[{*P114*")
+
+    def test_detector_ranges(self):
+        simulator = self._simulator
+        faraday = simulator.acquisition_configuration("Faraday")
+        sem = simulator.acquisition_configuration("SEM")
+        # Autoranging from low to high, within the ranges each detector has.
+        self.assertEqual(faraday.ranges, (-12, -9))
+        self.assertEqual(sem.ranges, (-12, -11))
+        self.assertAlmostEqual(sem.noise_scale * 1000, faraday.noise_scale)
+        self.assertIsNone(simulator.acquisition_configuration("Bscans").detector)
+        # Readings saturate at the full scale of the highest range.
+        simulator.high = -12
+        data = self.mid_data(simulator)
+        self.assertEqual(data.count("{2: 1e-12,4: 1e-12,18: 1e-12,28: 1e-12,"), 3)
+        # With no range between low and high, the detector stays on the current range.
+        simulator.high = -13
+        self.assertEqual(simulator.acquisition_configuration("Faraday").ranges, (-9, -9))
+
+    def test_mid_acquisition_process(self):
+        simulators = [device.SimulatedHidenRGA(), device.SimulatedHidenRGA(acquisition_process=True)]
+        try:
+            for simulator in simulators:
+                simulator.F1 = True
+                simulator.dwell = 0
+                simulator.current_gas = "N2"
+                simulator.current_gas_pressure = 8E-4
+            self.assertEqual(self.mid_data(simulators[1]), self.mid_data(simulators[0]))
+        finally:
+            simulators[1].acquisition_process = False
+
+    def accumulated_data(self, simulator, cycles, accumulate, report):
+        simulator.emission = 500
+        simulator.cycles = cycles
+        simulator.current_scan = "Ascans"
+        simulator.report = report
+        simulator.accumulate = accumulate
+        simulator.scan_input = "Faraday"
+        simulator.current_row_start = 1
+        simulator.current_row_stop = 30
+        simulator.start("Ascans")
+        simulator.join(None)
+        return simulator.data(True)
+
+    def test_accumulate(self):
+        self._simulator.noise = 0
+        # Bit 2 (mass) | Bit 0 (pressure)
+        expected = self.accumulated_data(self._simulator, 2, 0, 0b101)
+        # Without noise, the mean of a block is each cycle's value; the last block is cut short.
+        self.assertEqual(self.accumulated_data(self._simulator, 5, 3, 0b101), expected)
+        # Well within the detector's full scale, so no reading saturates.
+        self._simulator.noise = 1E-12
+        # Bit 1 (standard deviation) as well.
+        data = self.accumulated_data(self._simulator, 4, 4, 0b111)
+        self.assertEqual(data.count("["), 1)
+        points = data[data.index("{") + 1:data.index("}")].split(":")[1:]
+        self.assertEqual(len(points), 30)
+        for point in points:
+            mean, deviation = point.split(",")[:2]
+            self.assertGreater(float(deviation), 0)
+        self._simulator.accumulate_method = "median"
+        self.assertEqual(self._simulator.accumulate_method, "sum")
+        self._simulator.scan_input = "Bscans"
+        self._simulator.start("Ascans")
+        self.assertFalse(self._simulator.stat)
+
+        cycles = np.random.default_rng(1).normal(size=(5, 3))
+        accumulator = accumulation.Accumulator(5)
+        for values in cycles:
+            self.assertFalse(accumulator.complete)
+            accumulator.add(values)
+        self.assertTrue(accumulator.complete)
+        means, deviations = accumulator.take()
+        np.testing.assert_allclose(means, cycles.mean(axis=0))
+        np.testing.assert_allclose(deviations, cycles.std(axis=0, ddof=1))
+        accumulator = accumulation.Accumulator(3, "ema")
+        mean, variance = cycles[0], 0
+        for values in cycles:
+            accumulator.add(values)
+        for values in cycles[1:]:
+            mean, variance = mean + 0.5 * (values - mean), 0.5 * (variance + 0.5 * (values - mean) ** 2)
+        means, deviations = accumulator.take()
+        np.testing.assert_allclose(means, mean)
+        np.testing.assert_allclose(deviations, np.sqrt(variance))
+
+    def test_accumulate_acquisition_process(self):
+        simulators = [device.SimulatedHidenRGA(), device.SimulatedHidenRGA(acquisition_process=True)]
+        try:
+            for simulator in simulators:
+                simulator.F1 = True
+                simulator.dwell = 0
+                simulator.noise = 0
+                simulator.current_gas = "N2"
+                simulator.current_gas_pressure = 8E-4
+            self.assertEqual(self.accumulated_data(simulators[1], 5, 2, 0b111),
+                             self.accumulated_data(simulators[0], 5, 2, 0b111))
+        finally:
+            simulators[1].acquisition_process = False
+
+    def test_states(self):
+        simulator = self._simulator
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Idle")
+        with self.assertLogs(simulator.log, "WARNING") as logs:
+            for repeat in range(5):
+                simulator.emok = False
+                simulator.emok = True
+            simulator.emok = False
+        # Latched once, the repeats within TRIP_LOG_INTERVAL are only counted.
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(simulator.trip_error().code, 114)
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Tripped")
+        simulator.degas = 2
+        self.assertEqual(simulator.degas, 0)
+        simulator.emok = True
+        self.assertIsNone(simulator.trip_error())
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Idle")
+
+        simulator.degas = 2
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Degas")
+        simulator.start("Ascans")
+        self.assertFalse(simulator.stat)
+        simulator.process(2)
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Idle")
+
+        simulator.wait = True
+        simulator.start("Ascans")
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Scanning")
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Paused")
+        simulator.wait = False
+        simulator.join(None)
+        simulator.process(0.1)
+        self.assertEqual(simulator.state, "Idle")
+
+    def test_log_queue(self):
+        handlers = logging.getLogger().handlers[:]
+        levels = logqueue.parse_levels("gasses=DEBUG,device=WARNING")
+        self.assertEqual(levels, {"hidenrga.gasses": logging.DEBUG, "lewis.DeviceBase": logging.WARNING})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "hidenrga1.log")
+            try:
+                logqueue.start(path, levels)
+                self._simulator.log.info("Not written")
+                self._simulator.log.warning("Written")
+                logging.getLogger("hidenrga.gasses").debug("Species %s", "H2")
+            finally:
+                logqueue.stop()
+                for name in levels:
+                    logging.getLogger(name).setLevel(logging.NOTSET)
+            with open(path) as log:
+                text = log.read()
+        self.assertNotIn("Not written", text)
+        self.assertIn("Written", text)
+        self.assertIn("Species H2", text)
+        self.assertEqual(logging.getLogger().handlers, handlers)
+
+    def test_history(self):
+        self._simulator.noise = 0
+        with tempfile.TemporaryDirectory() as directory:
+            self._simulator.history_dir = directory
+            try:
+                started = time.time()
+                self.accumulated_data(self._simulator, 3, 0, 0b101)
+                self.assertEqual(len(self._simulator._history), 3)
+                cycle = self._simulator.history_read(-1)
+                self.assertEqual(cycle["point"].tolist(), list(range(1, 31)))
+                self.assertEqual(cycle["cycle"].tolist(), [2] * 30)
+                self.assertFalse(cycle["value"].flags.writeable)
+                self.assertEqual(self._simulator.history_cycle(0)["value"], cycle["value"].tolist())
+                self.assertEqual(self._simulator.history_find(started, time.time()), [0, 1, 2])
+                self.assertEqual(self._simulator.history_find(started - 10, started - 5), [])
+                # A trip ends the cycle with the trip code.
+                self._simulator.emok = False
+                self._simulator.start("Ascans")
+                self._simulator.join(None)
+                cycle = self._simulator.history_read(-1)
+                self.assertEqual(len(cycle["trip"]), 1)
+                self.assertNotEqual(cycle["trip"][0], 0)
+                self.assertTrue(np.isnan(cycle["value"][0]))
+            finally:
+                self._simulator.history_dir = None
+            # Reopened, the store carries on from the cycles it holds.
+            store = history.HistoryStore(directory)
+            self.assertEqual(len(store), 4)
+            store.close()
+            # The oldest cycles roll out; a cycle is never split across the end of the store.
+            store = history.HistoryStore(os.path.join(directory, "small"), capacity=50, index_capacity=4)
+            for index in range(6):
+                store.append(index, index, index + 0.5, np.arange(30.0), np.zeros(30), np.zeros(30, dtype=np.int32),
+                             np.full(30, float(index)), np.zeros(30))
+            self.assertEqual(list(store.sequences()), [5])
+            self.assertEqual(store.read(5)["cycle"].tolist(), [5] * 30)
+            self.assertIsNone(store.read(4))
+            self.assertEqual(list(store.find(4.6, 10)), [5])
+            store.close()
+
+    def test_cycles(self):
+        self._simulator.noise = 0
+        self.assertIsNone(self._simulator.latest_cycle())
+        self._simulator.cycles = 3
+        self._simulator.current_scan = "Ascans"
+        self._simulator.scan_input = "Faraday"
+        self._simulator.current_row_start = 1
+        self._simulator.current_row_stop = 30
+        self._simulator.dwell = 1
+        self._simulator.start("Ascans")
+        cycles = list(self._simulator.iter_cycles(timeout=5))
+        self._simulator.join(None)
+        self.assertEqual([cycle.cycle for cycle in cycles], [0, 1, 2])
+        latest = self._simulator.latest_cycle()
+        self.assertIs(latest, cycles[-1])
+        self.assertEqual(latest.points.tolist(), list(range(1, 31)))
+        self.assertFalse(latest.values.flags.writeable)
+        self.assertFalse(latest.tripped.any())
+        np.testing.assert_array_equal(cycles[0].values, latest.values)
+        # Nothing more once the scan has ended.
+        self.assertEqual(list(self._simulator.iter_cycles(timeout=5)), [])
+
+    def test_live(self):
+        self._simulator.noise = 0
+        name = "hidenrga-test-" + str(os.getpid())
+        self._simulator.live_name = name
+        try:
+            spectrum = live.LiveSpectrum.open(name)
+            snapshot = spectrum.snapshot()
+            self.assertEqual(len(snapshot.points), 0)
+            self.assertEqual(snapshot.total_pressure, self._simulator.total_pressure)
+            self.assertEqual((snapshot.emok, snapshot.filok, snapshot.ptrip), (True, True, False))
+            self.accumulated_data(self._simulator, 2, 0, 0b101)
+            latest = self._simulator.latest_cycle()
+            version = spectrum.begin()
+            np.testing.assert_array_equal(spectrum.values, latest.values)
+            self.assertFalse(spectrum.changed(version))
+            snapshot = spectrum.snapshot()
+            self.assertEqual(snapshot.points.tolist(), list(range(1, 31)))
+            self.assertEqual((snapshot.sequence, snapshot.cycle), (latest.sequence, latest.cycle))
+            self.assertTrue(snapshot.emok)
+            # Status changes are published straight away, and move the version on.
+            self._simulator.filok = False
+            self.assertTrue(spectrum.changed(version))
+            self.assertFalse(spectrum.snapshot().filok)
+            spectrum.close()
+        finally:
+            self._simulator.live_name = None
+        self.assertRaises(FileNotFoundError, live.LiveSpectrum.open, name)
+
+    def test_trend(self):
+        self._simulator.emission = 500
+        self._simulator.trend_mass = 4
+        self._simulator.trend_rate = 1000
+        self._simulator.trend_output_rate = 100
+        self.addCleanup(self._simulator.stop_trend)
+        self._simulator.start_trend()
+        time.sleep(0.2)
+        self._simulator.start("Ascans")
+        self.assertFalse(self._simulator.stat)
+        self._simulator.stop_trend()
+        self.assertEqual(self._simulator.trend_trip, 0)
+        rows = self._simulator.trend_data()
+        self.assertGreater(len(rows), 10)
+        self.assertTrue(all(len(row) == 2 for row in rows))
+        self.assertAlmostEqual(rows[1][0] - rows[0][0], 0.01)
+        self._simulator.trend_output_rate = 0
+        self.assertEqual(self._simulator.trend_output_rate, 100)
+        self._simulator.start_trend()
+        time.sleep(0.1)
+        self._simulator.stop_trend()
+        self._simulator.trend_decimation = "minmax"
+        rows = self._simulator.trend_data()
+        self.assertTrue(all(len(row) == 3 and row[1] <= row[2] for row in rows))
+
     def test_non_contiguous_mass(self):
         print("")
         print("test_non_contiguous_mass")
@@ -145,6 +562,36 @@ class TestHidenRGASimulator(unittest.TestCase):
         self._simulator.current_scan = "Ascans"
         self.Ascan()
         
+    def test_nested_leftovers_cleared(self):
+        self._simulator.noise = 0
+        self._simulator.cycles = 1
+        self._simulator.current_scan = "Ascans"
+        self._simulator.report = 0
+        self._simulator.scan_output = "electron-energy"
+        self._simulator.scan_input = "Bscans"
+        self._simulator.current_row = 0
+        self._simulator.current_row_step = 1
+        self._simulator.current_row_start = 70
+        self._simulator.current_row_stop = 70
+        self._simulator.current_scan = "Bscans"
+        self._simulator.report = 0b101
+        self._simulator.scan_output = "mass"
+        self._simulator.scan_input = "Faraday"
+        self._simulator.current_row = 0
+        self._simulator.current_row_step = 1
+        self._simulator.current_row_start = 1
+        self._simulator.current_row_stop = 5
+        # Hold the scan after the inner row, before the outer value is queued, and read the inner row.
+        self._simulator.wait = True
+        self._simulator.start("Ascans")
+        while self._simulator.scans["Bscans"].data_queue.qsize() < 5:
+            time.sleep(0.01)
+        self.assertEqual(self._simulator.data(True).count(":"), 5)
+        self._simulator.wait = False
+        self._simulator.join(None)
+        self.assertEqual(self._simulator.data(), "*C110*")
+        self.assertTrue(self._simulator.scans["Ascans"].data_queue.empty())
+
     def test_non_contiguous_mass_and_energy(self):
         print("")
         print("test_non_contiguous_mass_and_energy")
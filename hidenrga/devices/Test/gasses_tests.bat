@@ -0,0 +1 @@
+C:\Python310\python gasses_tests.py
\ No newline at end of file
@@ -0,0 +1,170 @@
+import sys
+import os
+import time
+
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import gasses
+import peakshape
+
+import numpy as np
+
+import unittest
+
+
+class TestGasses(unittest.TestCase):
+
+    def setUp(self):
+        self._gasses = gasses.Gasses()
+
+    def test_snapshot_is_immutable(self):
+        before = self._gasses.state
+        self._gasses.set_partial_pressure("H2O", 2E-5)
+        after = self._gasses.state
+        self.assertEqual(before.partial_pressure("H2O"), 0)
+        self.assertEqual(after.partial_pressure("H2O"), 2E-5)
+        self.assertEqual(after.version, before.version + 1)
+        with self.assertRaises(TypeError):
+            after.partial_pressures["H2O"] = 1E-5
+
+    def test_signal_uses_given_snapshot(self):
+        self._gasses.set_partial_pressure("H2O", 2E-5)
+        state = self._gasses.state
+        signal = self._gasses.signal(18, 70, state)
+        self._gasses.set_partial_pressure("H2O", 4E-5)
+        self.assertEqual(self._gasses.signal(18, 70, state), signal)
+        self.assertAlmostEqual(self._gasses.signal(18, 70), 2 * signal)
+
+    def test_total_pressure(self):
+        self._gasses.set_partial_pressure("N2", 8E-4)
+        self._gasses.set_partial_pressure("O2", 2E-4)
+        self.assertAlmostEqual(self._gasses.state.total_pressure, 1E-3)
+        self._gasses.set_partial_pressure("O2", 0)
+        self.assertAlmostEqual(self._gasses.state.total_pressure, 8E-4)
+
+    def test_bulk_insert_keeps_peaks_sorted(self):
+        self._gasses.insert_many([(50, gasses.GasSpecies("X1", 10)), (3, gasses.GasSpecies("X2", 10)),
+                                  (28, gasses.GasSpecies("X3", 10))])
+        masses = self._gasses.masses
+        self.assertTrue((masses[1:] >= masses[:-1]).all())
+        self.assertEqual([self._gasses.masses_map[index] for index in range(len(masses)) if masses[index] == 28],
+                         ["N2", "CO", "CO2", "X3"])
+
+    def test_species_not_shared(self):
+        other = gasses.Gasses()
+        self._gasses.gas("He").mass = 5
+        self.assertEqual(other.gas("He").mass, 4)
+        self.assertEqual(gasses.Gasses().gas("He").mass, 4)
+
+    def test_cracking_pattern(self):
+        self._gasses.set_partial_pressure("CO2", 1E-5)
+        base = self._gasses.signal(44, 70)
+        for mass, intensity in [(28, 0.098), (16, 0.096), (12, 0.087), (45, 0.011)]:
+            self.assertAlmostEqual(self._gasses.signal(mass, 70) / base, intensity, delta=0.003)
+        self.assertEqual(self._gasses.signal(20, 70), 0)
+
+    def test_spectrum_sums_species_at_each_mass(self):
+        self._gasses.set_partial_pressure("N2", 8E-4)
+        self._gasses.set_partial_pressure("CO", 1E-6)
+        masses, heights = self._gasses.spectrum(70)
+        self.assertAlmostEqual(heights[list(masses).index(28)], self._gasses.signal(28, 70))
+
+    def test_signal_only_from_peaks_in_window(self):
+        self._gasses.set_partial_pressure("CO", 1E-6)
+        self.assertEqual(self._gasses.signal(27.25, 70), 0)
+        self.assertGreater(self._gasses.signal(27.3, 70), 0)
+        self.assertEqual(self._gasses.signal(100, 70), 0)
+
+    def test_efficiency_table(self):
+        self._gasses.set_partial_pressure("He", 1E-5)
+        He = self._gasses.gas("He")
+        for electron_energy in [24.63, 33.33, 70, 99.97, 150]:
+            self.assertAlmostEqual(self._gasses.signal(4, electron_energy) / 1E-5,
+                                   He.ionisation_efficiency(electron_energy), delta=1E-5)
+        for electron_energy in [0, -10, 24]:
+            self.assertEqual(self._gasses.signal(4, electron_energy), 0)
+        minimum, table = self._gasses.efficiency_table()
+        self.assertIs(self._gasses.efficiency_table()[1], table)
+        self._gasses.energy_range = (10, 50)
+        self.assertEqual(self._gasses.efficiency_table()[0], 10)
+        self._gasses.insert(60, gasses.GasSpecies("X1", 10))
+        self.assertEqual(self._gasses.efficiency_table()[1].shape[0], table.shape[0] + 1)
+
+    def test_energy_signals(self):
+        self._gasses.set_partial_pressure("N2", 8E-4)
+        self._gasses.set_partial_pressure("CO", 1E-6)
+        electron_energies = np.arange(-5, 130, 0.7)
+        for mass in [14, 28, 28.2, 40]:
+            expected = [self._gasses.signal(mass, electron_energy) for electron_energy in electron_energies]
+            np.testing.assert_allclose(self._gasses.energy_signals(mass, electron_energies), expected, rtol=1E-12)
+
+    def test_signal_surface(self):
+        self._gasses.set_partial_pressure("N2", 8E-4)
+        self._gasses.set_partial_pressure("H2O", 2E-5)
+        surface = self._gasses.surface()
+        masses = np.arange(10, 30, 0.13)
+        for electron_energy in [30.05, 70]:
+            expected = [self._gasses.signal(mass, electron_energy) for mass in masses]
+            sampled = surface.sample(masses, electron_energy)
+            self.assertLess(np.max(np.abs(sampled - expected)), 0.012 * max(expected))
+        self.assertEqual(surface.sample(28, 70), self._gasses.signal(28, 70))
+        self.assertEqual(surface.sample(np.full((2, 3), 28), 70).shape, (2, 3))
+        self.assertLessEqual(surface.nbytes, surface.MAX_BYTES)
+        self.assertIs(self._gasses.surface(), surface)
+        self._gasses.set_partial_pressure("H2O", 0)
+        self.assertIsNot(self._gasses.surface(), surface)
+
+    def test_surface_repeated_map(self):
+        self._gasses.set_partial_pressure("N2", 8E-4)
+        self._gasses.set_partial_pressure("H2O", 2E-5)
+        self._gasses.set_partial_pressure("CO2", 2E-6)
+        surface = self._gasses.surface()
+        masses = np.arange(1, 199, 0.25)
+        electron_energies = np.arange(20, 100, 10)
+        for electron_energy in electron_energies:
+            surface.sample(masses, electron_energy)
+        builds = surface.builds
+        start = time.perf_counter()
+        for electron_energy in electron_energies:
+            surface.sample(masses, electron_energy)
+        sampled = time.perf_counter() - start
+        start = time.perf_counter()
+        for electron_energy in electron_energies:
+            [self._gasses.signal(mass, electron_energy) for mass in masses]
+        direct = time.perf_counter() - start
+        # The whole mass range is kept, so a wide map repeats without rebuilding any chunk.
+        self.assertEqual(surface.builds, builds)
+        self.assertLess(sampled, direct)
+
+    def test_peak_shape(self):
+        self._gasses.set_partial_pressure("He", 4E-5)
+        self.assertEqual(self._gasses.signal(4.8, 70), 0)
+        self._gasses.peak_shape = peakshape.PeakShape(delta_m=-50)
+        self.assertGreater(self._gasses.signal(4.8, 70), 0)
+        self._gasses.peak_shape = peakshape.PeakShape(delta_m=50)
+        self.assertEqual(self._gasses.signal(4.3, 70), 0)
+        self._gasses.peak_shape = peakshape.PeakShape(tailing=0.1)
+        self.assertGreater(self._gasses.signal(3, 70), 0)
+        self.assertEqual(self._gasses.signal(4.8, 70), 0)
+        sigmas = peakshape.PeakShape(resolution=100).sigmas([4, 104])
+        self.assertAlmostEqual(sigmas[0] / sigmas[1], 10)
+
+    def test_active_peaks_follow_zero_crossings(self):
+        self._gasses.set_partial_pressure("N2", 8E-4)
+        self._gasses.set_partial_pressure("CO2", 2E-6)
+        self.assertEqual(self._gasses.active_species(), {"N2", "CO2"})
+        self._gasses.set_partial_pressure("H2O", 2E-5)
+        self._gasses.set_partial_pressure("N2", 0)
+        self._gasses.set_partial_pressure("CO2", 4E-6)
+        incremental = self._gasses.active()
+        rebuilt = gasses.Gasses()
+        rebuilt.replace_state(self._gasses.state)
+        self.assertEqual(incremental.names, {"H2O", "CO2"})
+        self.assertEqual(list(incremental.masses), list(rebuilt.active().masses))
+        self.assertEqual(list(incremental.weights), list(rebuilt.active().weights))
+
+
+if __name__ == '__main__':
+    unittest.main()
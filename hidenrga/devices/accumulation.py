@@ -0,0 +1,96 @@
+##################################################
+#
+# Cycle accumulation for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Accumulation averages each point of a row over blocks of scan cycles, so only
+the mean and standard deviation of a block are reported instead of every cycle.
+"""
+import numpy as np
+
+METHODS = ("sum", "ema")
+
+
+class Accumulator:
+    """
+    Running statistics of every point of one row.
+    "sum" keeps sums and sums of squares, restarted for each block of cycles;
+    "ema" keeps exponential moving averages with a span of one block, carried across blocks.
+    """
+
+    def __init__(self, cycles, method="sum"):
+        self._cycles = cycles
+        self._method = method
+        self._alpha = 2.0 / (cycles + 1)
+        self._count = 0
+        self._shift = None
+        self._sums = None
+        self._squares = None
+
+    @property
+    def count(self):
+        """ Cycles added since the last block was reported. """
+        return self._count
+
+    def add(self, values):
+        """
+        Adds one cycle of the row's values.
+        """
+        values = np.asarray(values, dtype=float)
+        if self._method == "ema":
+            if self._sums is None:
+                self._sums = values.copy()
+                self._squares = np.zeros(len(values))
+            else:
+                deviations = values - self._sums
+                self._sums += self._alpha * deviations
+                self._squares = (1 - self._alpha) * (self._squares + self._alpha * deviations * deviations)
+        else:
+            if self._count == 0:
+                # Sums of deviations from the block's first cycle, so the variance does not
+                # cancel against the square of a mean that is much larger than the noise.
+                self._shift = values.copy()
+                self._sums = np.zeros(len(values))
+                self._squares = np.zeros(len(values))
+            else:
+                deviations = values - self._shift
+                self._sums += deviations
+                self._squares += deviations * deviations
+        self._count += 1
+
+    @property
+    def complete(self):
+        return self._count >= self._cycles
+
+    def take(self):
+        """
+        Returns the mean and standard deviation of each point and starts the next block.
+        A block cut short by the end of the scan is reported over the cycles it has.
+        """
+        if self._method == "ema":
+            means = self._sums.copy()
+            deviations = np.sqrt(self._squares)
+        else:
+            count = self._count
+            means = self._shift + self._sums / count
+            variances = np.zeros(len(means))
+            if count > 1:
+                variances = np.maximum(self._squares - self._sums * self._sums / count, 0) / (count - 1)
+            deviations = np.sqrt(variances)
+        self._count = 0
+        return means, deviations
@@ -0,0 +1,390 @@
+##################################################
+#
+# Out of process acquisition for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Runs the scan engine of a SimulatedHidenRGA in a child process, so that
+acquisition does not compete with the stream interface for the GIL.
+
+The scan set-up, device parameters, gas state and stop/wait commands go to
+the child over a pipe. The child's scanners write their queue traffic into a
+ResultRing in shared memory, and the lewis process moves it into its own
+scanner queues, from which data() formats replies as before. It does so a
+block of records at a time: each queue gets all of its values from a block
+in one vectorised conversion and one put, and the reader sleeps on an event
+while the ring is empty.
+"""
+from multiprocessing import shared_memory
+import multiprocessing
+import threading
+import time
+
+import numpy as np
+
+try:
+    from . import scanner  # "emulator" case
+except ImportError:
+    import scanner  # "__main__" case
+
+try:
+    from . import logqueue  # "emulator" case
+except ImportError:
+    import logqueue  # "__main__" case
+
+# Record kinds. Each put() on a scanner queue in the child becomes one record,
+# except a MIDRecord, which becomes MID_START, a VALUE per channel, an optional TRIP and MID_END,
+# and an Averaged value, which becomes a DEVIATION followed by its MEAN.
+TIME, POINT, INT_POINT, VALUE, TRIP, END, MID_START, MID_END, DEVIATION, MEAN = range(10)
+RECORD = np.dtype([("kind", np.uint8), ("scan", np.uint8), ("value", np.float64)])
+
+# Device attributes the child's scan engine reads, mirrored from the lewis process.
+# peak_shape is set through its property, which passes it on to the child's gas library;
+# _trip_code is the lewis process's evaluation of the interlocks, so only it logs trips.
+PARAMETERS = ("_mass", "_electron_energy", "_emission", "_range_units", "_noise", "_dwell",
+              "_low", "_high", "_current", "_emok", "_filok", "_ptrip", "_overtemp", "_inhibit", "_trip_code",
+              "_cycles", "_signal_surface", "peak_shape")
+
+
+class ResultRing:
+    """
+    Single producer, single consumer ring of records in shared memory.
+    The header holds the total number of records written and read; each side only ever
+    writes its own count, after the records it covers, so no lock is needed.
+    A third header word is set by the reader before it sleeps on the ready event. The writer
+    then signals the event once a block of records is waiting, at the end of a scan or MID
+    cycle, or straight away if it is only writing slowly, e.g. with a dwell time.
+    """
+    _HEADER = 3 * np.dtype(np.int64).itemsize
+    WAIT_TIMEOUT = 0.1  # Bounds a missed wake-up, and how long an exited writer goes unnoticed
+    SIGNAL_RECORDS = 256  # Records a fast writer lets build up before waking the reader
+    SLOW_WRITE = 0.001  # Seconds between writes beyond which every record wakes the reader
+
+    def __init__(self, name=None, capacity=65536, ready=None):
+        create = name is None
+        size = self._HEADER + capacity * RECORD.itemsize
+        self._memory = shared_memory.SharedMemory(name=name, create=create, size=size)
+        self._capacity = capacity
+        self._ready = ready
+        self._last_write = 0
+        self._counts = np.ndarray((3,), np.int64, self._memory.buf)
+        self._records = np.ndarray((capacity,), RECORD, self._memory.buf, offset=self._HEADER)
+        if create:
+            self._counts[:] = 0
+
+    @property
+    def name(self):
+        return self._memory.name
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def write(self, kind, scan_index, value):
+        written = int(self._counts[0])
+        while written - int(self._counts[1]) >= self._capacity:
+            time.sleep(0.001)  # Full, wait for the reader
+        self._records[written % self._capacity] = (kind, scan_index, value)
+        self._counts[0] = written + 1
+        now = time.monotonic()
+        if self._counts[2] and self._ready is not None and (
+                kind == END or kind == MID_END or now - self._last_write >= self.SLOW_WRITE or
+                written + 1 - self._counts[1] >= self.SIGNAL_RECORDS):
+            self._counts[2] = 0
+            self._ready.set()
+        self._last_write = now
+
+    def wait(self):
+        """
+        Sleeps until a record is written, or WAIT_TIMEOUT.
+        """
+        self._ready.clear()
+        self._counts[2] = 1
+        if self._counts[0] == self._counts[1]:
+            self._ready.wait(self.WAIT_TIMEOUT)
+        self._counts[2] = 0
+
+    def pending(self):
+        """
+        Returns a view of the unread records, up to the end of the buffer.
+        The records are not copied; call consumed() once they have been used.
+        """
+        read = int(self._counts[1])
+        unread = int(self._counts[0]) - read
+        start = read % self._capacity
+        return self._records[start:start + min(unread, self._capacity - start)]
+
+    def consumed(self, count):
+        self._counts[1] += count
+
+    def close(self, unlink=False):
+        del self._counts
+        del self._records
+        self._memory.close()
+        if unlink:
+            self._memory.unlink()
+
+
+class RingQueue:
+    """
+    Stands in for one of a Scanner's queues in the acquisition process.
+    """
+
+    def __init__(self, ring, kind, scan_index):
+        self._ring = ring
+        self._kind = kind
+        self._scan_index = scan_index
+
+    def put(self, item):
+        if isinstance(item, scanner.MIDRecord):
+            self._ring.write(MID_START, self._scan_index, item.elapsed)
+            for value in item.values:
+                self._ring.write(VALUE, self._scan_index, value)
+            if item.trip is not None:
+                self._ring.write(TRIP, self._scan_index, item.trip.code)
+            self._ring.write(MID_END, self._scan_index, 0)
+        elif isinstance(item, scanner.Averaged):
+            self._ring.write(DEVIATION, self._scan_index, item.std)
+            self._ring.write(MEAN, self._scan_index, item.mean)
+        elif hasattr(item, "code"):
+            self._ring.write(TRIP, self._scan_index, item.code)
+        elif self._kind == POINT and isinstance(item, int):
+            self._ring.write(INT_POINT, self._scan_index, item)
+        else:
+            self._ring.write(self._kind, self._scan_index, item)
+
+    def empty(self):
+        return True
+
+    def task_done(self):
+        pass
+
+
+def describe_scans(scans):
+    """ Picklable description of the device's scans, in the order used for record scan indices. """
+    return [(name, scan.scan_input, scan.scan_output, scan.report,
+             [(row.start, row.stop, row.step) for row in scan.rows], scan.mid_channels,
+             scan.accumulate, scan.accumulate_method)
+            for name, scan in scans.items()]
+
+
+def build_scans(description, ring):
+    scans = {}
+    for index, (name, scan_input, scan_output, report, rows, mid_channels, accumulate,
+                accumulate_method) in enumerate(description):
+        scan = scanner.Scanner(scan_output, RingQueue(ring, TIME, index), RingQueue(ring, POINT, index),
+                               RingQueue(ring, VALUE, index))
+        scan.scan_input = scan_input
+        scan.report = report
+        for row_index, (start, stop, step) in enumerate(rows):
+            scan.current_row = row_index
+            scan.current_row_start = start
+            scan.current_row_stop = stop
+            scan.current_row_step = step
+        scan.current_row = 0
+        scan.mid_channels = mid_channels
+        scan.accumulate = accumulate
+        scan.accumulate_method = accumulate_method
+        scans[name] = scan
+    return scans
+
+
+def _worker(connection, ring_name, capacity, ready):
+    """
+    Entry point of the acquisition process. Runs a device of its own, fed by the pipe.
+    """
+    try:
+        from .device import SimulatedHidenRGA  # "emulator" case
+    except ImportError:
+        from device import SimulatedHidenRGA  # "__main__" case
+    logqueue.configure("acquisition")
+    ring = ResultRing(ring_name, capacity, ready)
+    device = SimulatedHidenRGA()
+
+    def finish(scan_thread):
+        # Joins this scan's own thread: device.join() is also called by stop commands.
+        scan_thread.join()
+        ring.write(END, 0, 0)
+
+    while True:
+        try:
+            command, argument = connection.recv()
+        except EOFError:
+            break  # The lewis process has gone
+        try:
+            if command == "parameters":
+                for name, value in argument.items():
+                    setattr(device, name, value)
+                device._reconfigure()
+            elif command == "gas":
+                device._gasses.replace_state(argument)
+            elif command == "start":
+                description, current_scan = argument
+                device._scans = build_scans(description, ring)
+                device.start(current_scan)
+                threading.Thread(target=finish, args=(device._scan_thread,), name="finish", daemon=True).start()
+            elif command == "stop":
+                device.stop(argument)
+            elif command == "wait":
+                device.wait = argument
+            elif command == "close":
+                device.stop(True)
+                break
+        except Exception as Error:
+            device.log.error("Acquisition command " + str(command) + " failed: " + str(Error))
+    ring.close()
+
+
+class AcquisitionProcess:
+    """
+    The lewis process side of the acquisition process.
+    """
+
+    def __init__(self, capacity=65536):
+        context = multiprocessing.get_context("spawn")
+        ready = context.Event()
+        self._ring = ResultRing(None, capacity, ready)
+        self._connection, child_connection = context.Pipe()
+        self._lock = threading.Lock()  # Stream interface and lewis-control threads both send
+        self._mid = None  # [scan index, elapsed, values, trip code] of a MIDRecord being reassembled
+        self._deviation = None  # Of an Averaged value whose mean is in the next block
+        self._process = context.Process(target=_worker, name="acquisition",
+                                        args=(child_connection, self._ring.name, capacity, ready), daemon=True)
+        self._process.start()
+        child_connection.close()
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    @property
+    def alive(self):
+        return self._process.is_alive()
+
+    def send(self, command, argument=None):
+        """
+        Returns False if the command could not be sent because the acquisition process has exited.
+        """
+        with self._lock:
+            try:
+                self._connection.send((command, argument))
+            except (BrokenPipeError, ConnectionResetError):
+                return False
+        return True
+
+    def update(self, device):
+        return self.send("parameters", {name: getattr(device, name) for name in PARAMETERS})
+
+    def start(self, device, current_scan):
+        return (self.update(device) and self.send("gas", device.gas_state) and
+                self.send("start", (describe_scans(device.scans), current_scan)))
+
+    def pump(self, scans, trip_error):
+        """
+        Moves records from the ring into the scanners' queues until the scan has ended.
+        """
+        scans = list(scans.values())
+        self._mid = None
+        self._deviation = None
+        while True:
+            records = self._ring.pending()
+            if len(records) == 0:
+                if not self._process.is_alive():
+                    return
+                self._ring.wait()
+                continue
+            ends = np.flatnonzero(records["kind"] == END)
+            count = len(records) if len(ends) == 0 else int(ends[0])
+            if self._mid is not None or (records["kind"][:count] == MID_START).any():
+                self._deliver_mid(records[:count], scans, trip_error)
+            else:
+                self._deliver(records[:count], scans, trip_error)
+            if len(ends) != 0:
+                self._ring.consumed(count + 1)
+                return
+            self._ring.consumed(count)
+
+    def _deliver(self, records, scans, trip_error):
+        """
+        Puts a block of row scan records into the scanners' queues, a whole queue's worth at a time.
+        Each scan's data values go in last, so a reader that finds a value queued also finds its scan point.
+        """
+        kinds = records["kind"]
+        values = records["value"]
+        for scan_index in np.unique(records["scan"]):
+            scan = scans[scan_index]
+            mine = records["scan"] == scan_index
+            times = mine & (kinds == TIME)
+            if times.any():
+                scan.time_queue.put_many(values[times].astype(np.int64).tolist())
+            points = mine & ((kinds == POINT) | (kinds == INT_POINT))
+            if points.any():
+                items = values[points].tolist()
+                for index in np.flatnonzero(kinds[points] == INT_POINT):
+                    items[index] = int(items[index])
+                scan.scan_queue.put_many(items)
+            data = mine & ((kinds == VALUE) | (kinds == TRIP) | (kinds == MEAN))
+            if data.any():
+                items = values[data].tolist()
+                for index in np.flatnonzero(kinds[data] == TRIP):
+                    items[index] = trip_error(int(items[index]))
+                means = np.flatnonzero(kinds[data] == MEAN)
+                if len(means) != 0:
+                    deviations = values[mine & (kinds == DEVIATION)].tolist()
+                    if kinds[mine][0] == MEAN:
+                        deviations.insert(0, self._deviation)
+                    for index, deviation in zip(means, deviations):
+                        items[index] = scanner.Averaged(items[index], deviation)
+                scan.data_queue.put_many(items)
+            if kinds[mine][-1] == DEVIATION:
+                self._deviation = float(values[mine][-1])
+
+    def _deliver_mid(self, records, scans, trip_error):
+        """
+        Reassembles MIDRecords from a block of MID scan records, one cycle at a time.
+        A cycle may continue into the next block.
+        """
+        kinds = records["kind"]
+        values = records["value"]
+        position = 0
+        while position < len(records):
+            if self._mid is None:
+                if kinds[position] == MID_START:
+                    self._mid = [int(records["scan"][position]), int(values[position]), [], None]
+                position += 1
+                continue
+            ends = np.flatnonzero(kinds[position:] == MID_END)
+            end = len(records) if len(ends) == 0 else position + int(ends[0])
+            cycle = slice(position, end)
+            self._mid[2].extend(values[cycle][kinds[cycle] == VALUE].tolist())
+            trips = values[cycle][kinds[cycle] == TRIP]
+            if len(trips) != 0:
+                self._mid[3] = int(trips[0])
+            if end < len(records):
+                scan_index, elapsed, mid_values, code = self._mid
+                scan = scans[scan_index]
+                trip = None if code is None else trip_error(code)
+                scan.data_queue.put(scanner.MIDRecord(elapsed, scan.mid_channels, mid_values, trip))
+                self._mid = None
+                end += 1
+            position = end
+
+    def close(self):
+        if self._process.is_alive() and self.send("close"):
+            self._process.join(5)
+        self._connection.close()
+        self._ring.close(unlink=True)
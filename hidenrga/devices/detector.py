@@ -0,0 +1,111 @@
+##################################################
+#
+# Detector model for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+The SEM and Faraday detectors, and the acquisition configuration that turns a
+block of noiseless partial pressures into readings with a few precomputed
+coefficients instead of per point tests of the input, units and dwell.
+"""
+import math
+
+import numpy as np
+
+# NB, The Hiden device uses Torr as the output unit.
+# But this project uses Pascal (the SI unit) as the unit wherever possible.
+PASCAL_TO = {"Torr": 0.00750062, "Amps": 1E-5}
+DEFAULT_EMISSION = 500  # uA
+DEFAULT_DWELL = 100  # ms
+
+
+class Detector:
+    """
+    An ion detector. Its ranges are powers of ten of the full scale ion current in Amps.
+    """
+
+    def __init__(self, name, gain, min_range, max_range):
+        self.name = name
+        self.gain = gain
+        self.min_range = min_range
+        self.max_range = max_range
+
+    def ranges(self, low, high, current):
+        """
+        Returns the lowest and highest range used. The detector autoranges from low to high, within
+        the ranges it has; if that leaves none, it stays on the current range.
+        """
+        bottom = max(low, self.min_range)
+        top = min(high, self.max_range)
+        if bottom > top:
+            bottom = top = min(max(current, self.min_range), self.max_range)
+        return bottom, top
+
+
+# The SEM multiplies the ion current, so its readings are much less noisy but it saturates sooner.
+DETECTORS = {"Faraday": Detector("Faraday", 1, -14, -9), "SEM": Detector("SEM", 1000, -17, -11)}
+
+
+class Configuration:
+    """
+    Coefficients of one acquisition input, resolved from the device parameters when they change.
+    readings() applies them to a whole row, or to the channels of a MID scan when stacked.
+    """
+
+    def __init__(self, scan_input, emission, range_units, dwell, low, high, current, fixed_range=None):
+        self.scan_input = scan_input
+        self.detector = DETECTORS.get(scan_input)
+        # Multi-variant scan, the input is another scan such as Bscans.
+        self.nested = scan_input[1:len(scan_input)] == "scans"
+        self.emission_factor = emission / DEFAULT_EMISSION
+        self.unit_scale = PASCAL_TO.get(range_units, 1.0)
+        per_amp = self.unit_scale / PASCAL_TO["Amps"]
+        self.noise_scale = 1.0
+        self.ranges = None
+        self.full_scale = math.inf
+        if self.detector is not None:
+            self.noise_scale = 1.0 / self.detector.gain
+            self.ranges = self.detector.ranges(low, high, current)
+            self.full_scale = math.pow(10, self.ranges[1]) * per_amp
+        if fixed_range is not None:
+            self.full_scale = math.pow(10, fixed_range) * per_amp
+        if dwell != 0:
+            self.noise_scale *= DEFAULT_DWELL / dwell
+
+    @classmethod
+    def stack(cls, configurations):
+        """
+        Returns one configuration with a noise scale and full scale per item of configurations,
+        which must share their emission and units.
+        """
+        stacked = cls.__new__(cls)
+        stacked.__dict__.update(configurations[0].__dict__)
+        stacked.noise_scale = np.array([configuration.noise_scale for configuration in configurations])
+        stacked.full_scale = np.array([configuration.full_scale for configuration in configurations])
+        return stacked
+
+    def scaled(self, signals):
+        """ Returns signals in Pascal scaled by emission and converted to range units. """
+        return signals * self.emission_factor * self.unit_scale
+
+    def readings(self, signals, noise_block):
+        """
+        Returns the readings, in range units, of signals in Pascal with the unscaled noise_block added.
+        Readings beyond the full scale of the highest range saturate.
+        """
+        values = self.scaled(signals) + noise_block * self.noise_scale
+        return np.clip(values, -self.full_scale, self.full_scale)
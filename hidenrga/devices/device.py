@@ -21,10 +21,12 @@ from collections import OrderedDict
 from lewis.core.logging import has_log
 from lewis.core.statemachine import State
 from lewis.devices import StateMachineDevice
-from numpy.random import normal
+from collections import deque
+import numpy as np
+import functools
+import os
 import time
 import threading
-import math
 import sys
 from enum import Enum
 
@@ -37,15 +39,87 @@ try:
     from . import scanner  # "emulator" case
 except ImportError:
     import scanner  # "__main__" case
+
+try:
+    from . import spectra  # "emulator" case
+except ImportError:
+    import spectra  # "__main__" case
+
+try:
+    from . import peakshape  # "emulator" case
+except ImportError:
+    import peakshape  # "__main__" case
+
+try:
+    from . import trend  # "emulator" case
+except ImportError:
+    import trend  # "__main__" case
+
+try:
+    from . import accumulation  # "emulator" case
+except ImportError:
+    import accumulation  # "__main__" case
+
+try:
+    from . import detector  # "emulator" case
+except ImportError:
+    import detector  # "__main__" case
+
+try:
+    from . import history  # "emulator" case
+except ImportError:
+    import history  # "__main__" case
+
+try:
+    from . import logqueue  # "emulator" case
+except ImportError:
+    import logqueue  # "__main__" case
     
-class DefaultState(State):
+class IdleState(State):
+    """
+    Not scanning, no interlock tripped.
+    """
+    NAME = 'Idle'
+
+
+class ScanningState(State):
+    """
+    A scan is running.
+    """
+    NAME = 'Scanning'
+
+
+class PausedState(State):
+    """
+    A scan is waiting at the end of a cycle.
+    """
+    NAME = 'Paused'
+
+
+class TrippedState(State):
+    """
+    An interlock has tripped. Scans stop at the point they reached.
     """
-    Device is in default state.
+    NAME = 'Tripped'
+
+    def on_entry(self, dt):
+        self._context._degas = 0
+
+
+class DegasState(State):
     """
-    NAME = 'Default'
+    The ion source is being degassed; scans cannot start until it has finished.
+    """
+    NAME = 'Degas'
+
+    def in_state(self, dt):
+        self._context._degas = max(0, self._context._degas - dt)
 
 
 class SimulatedHidenRGA(StateMachineDevice):
+    TRIP_LOG_INTERVAL = 1.0  # Seconds within which further trips are counted rather than logged
+    CYCLE_BACKLOG = 16  # Completed cycles kept for iter_cycles() consumers that fall behind
+
     class StopOptions(Enum):
         SCAN = 0
         STOP = 1
@@ -72,26 +146,102 @@ class SimulatedHidenRGA(StateMachineDevice):
             try:
                 self._device.log.info("Starting thread")
                 cycle = 0
+                cycles_done = 0
                 self._device._stopping = self._device.StopOptions.SCAN
-                # Cache these values as they will be overwritten
-                mass = self._device.mass
-                electron_energy = self._device.electron_energy
                 start_time = time.monotonic()
+                scan = self._device.current_scan
+                # Every row of a cycle is cached, so later cycles of a steady chamber only add noise.
+                self._device.spectra.reserve(self._device.plan_rows(scan))
+                # An accumulating scan keeps the running statistics of each row across cycles.
+                self._device._accumulators = {} if scan.accumulate > 1 else None
+                completed = True
                 while self._device.cycles == 0 or cycle < self._device.cycles:
-                    if not self._device.scan(start_time):
+                    # The scan moves its own cursor, never the user-set mass and electron energy.
+                    # Axes that are not scanned take the user-set values at the start of each cycle.
+                    cursor = scanner.ScanCursor(self._device.mass, self._device.electron_energy)
+                    self._device._cursor = cursor
+                    self._device._cycle_rows = []
+                    completed = self._device.scan(start_time, scan, cursor)
+                    self._device.publish_cycle(cycles_done)
+                    cycles_done += 1
+                    if not completed:
                         break
                     if self._device._stopping == self._device.StopOptions.STOP:
                         break
                     if self._device.cycles != 0:
                         cycle += 1
+                if completed and self._device._accumulators:
+                    # Report a block cut short by the end of the scan.
+                    elapsed = int((time.monotonic() - start_time) * 1000.0)
+                    for row in scan.rows:
+                        accumulator = self._device._accumulators.get(row)
+                        if accumulator is not None and accumulator.count != 0:
+                            self._device.queue_accumulated(scan, row, accumulator, elapsed)
             except Exception as Error:
                 self._device.log.error(str(Error))
                 
-            # Restore these values
-            self._device.mass = mass
-            self._device.electron_energy = electron_energy
+            self._device._cursor = None
+            with self._device._cycle_published:
+                # Wakes iter_cycles() consumers, which stop once the scan has ended.
+                self._device._cycle_published.notify_all()
             self._device.log.info("Exiting thread")
 
+    class ProcessScanThread(threading.Thread):
+        def __init__(self, device, name):
+            super().__init__()
+            self._device = device
+            self.name = name
+
+        def run(self):
+            """
+            Thread method to move data acquired by the acquisition process into the scan queues
+            """
+            try:
+                self._device._acquisition.pump(self._device.scans, self._device.TripError)
+            except Exception as Error:
+                self._device.log.error(str(Error))
+
+    class TrendThread(threading.Thread):
+        PERIOD = 0.01  # Samples that have fallen due are generated as a block this often
+
+        def __init__(self, device, name):
+            super().__init__(daemon=True)
+            self._device = device
+            self.name = name
+
+        def run(self):
+            """
+            Thread method to sample the trend mass at the trend rate
+            """
+            device = self._device
+            try:
+                device.log.info("Starting trend of mass " + str(device.trend_mass) + " at " +
+                                str(device.trend_rate) + " Hz")
+                channels = (scanner.MIDChannel(device.trend_mass),)
+                rate = float(device.trend_rate)
+                produced = 0
+                start_time = time.monotonic()
+                while not device._trend_stop.is_set():
+                    due = int((time.monotonic() - start_time) * rate) + 1 - produced
+                    if due > 0:
+                        TripError = device.trip_error()
+                        if TripError is not None:
+                            device.log.warning("Stopping trend due to trip")
+                            device._trend_trip = TripError
+                            break
+                        cursor = scanner.ScanCursor(device.trend_mass, device.electron_energy)
+                        signal = device.acquisition_configuration("Faraday").scaled(
+                            device.noiseless_mid(channels, device.gas_state, cursor)[0])
+                        # Each sample integrates for one sample period; default 100 mS dwell time
+                        noise = np.random.normal(-device._noise, device._noise, due) * rate / 10
+                        times = (produced + np.arange(due)) / rate
+                        device._trend_buffer.extend(times, signal + noise)
+                        produced += due
+                    device._trend_stop.wait(self.PERIOD)
+            except Exception as Error:
+                device.log.error(str(Error))
+            device.log.info("Exiting trend thread")
+
     class Logical:
         def __init__(self):
             self._groups = {}
@@ -200,19 +350,46 @@ class SimulatedHidenRGA(StateMachineDevice):
         def scan_table(self):
             return self._scan_table
         
-    def __init__(self):
+    def __init__(self, acquisition_process=False):
+        logqueue.configure()
         super().__init__()
         self._scan_thread = None
+        self._cursor = None
+        self._accumulators = None
+        self._acquisition = None
         self._gasses = gasses.Gasses()
+        self._spectra = spectra.SpectrumCache()
+        self._acquisition_configurations = {}
+        self._history = None
+        self._live = None
+        self._change_listeners = []
+        self._cycle_rows = None
+        self._completed_cycles = deque(maxlen=self.CYCLE_BACKLOG)
+        self._cycle_sequence = 0
+        self._cycle_published = threading.Condition()
+        self._trend_thread = None
+        self._trend_stop = threading.Event()
+        self._trend_buffer = trend.TrendBuffer()
+        self._trend_trip = None
         self._current_gas = None
         self._name = "HAL RC RGA 101X #17995"
         self._release = "Release 10.11.0, 2022-11-28, 131720"
         self._configuration = "WRD17995#cnfa.xml, 2023-03-16, 08:01, HAL10, Internal RGA 201 R10.11.0, 6d6ef24f"
-        self._logical = self.Logical()
         self._initialize_data()
+        self._gasses.energy_range = (self._min_electron_energy, self._max_electron_energy)
+        self._gasses.mass_range = (self._min_mass, self._max_mass)
+        self._gasses.peak_shape = self._peak_shape
+        self.acquisition_process = acquisition_process
+        self.history_dir = os.environ.get("HIDENRGA_HISTORY_DIR")
+        self.live_name = os.environ.get("HIDENRGA_LIVE_NAME")
 
     def __del__(self):
+        self.stop_trend()
         self.join(None)
+        if self._acquisition is not None:
+            self._acquisition.close()
+        if self._live is not None:
+            self._live.close()
         
     def _initialize_data(self):
         self.connected = True
@@ -240,6 +417,10 @@ class SimulatedHidenRGA(StateMachineDevice):
         self._ptrip = False
         self._overtemp = False
         self._inhibit = False
+        self._trip_code = self.interlock()[0]
+        self._trip_logged = -self.TRIP_LOG_INTERVAL
+        self._trips_suppressed = 0
+        self._degas = 0
         self._zero = False
         self._mode = 1
         self._dwell = 100
@@ -248,6 +429,12 @@ class SimulatedHidenRGA(StateMachineDevice):
         self._settle = 100
         self._settlemode = True
         self._noise = 1E-12  # In Amps
+        self._signal_surface = False
+        self._trend_mass = 4
+        self._trend_rate = 1000  # Samples per second
+        self._trend_output_rate = 10  # Decimated rows per second
+        self._trend_decimation = "mean"
+        self._peak_shape = peakshape.PeakShape()
         self._total_pressure = 0
         self._low = -12
         self._high = -5
@@ -258,6 +445,248 @@ class SimulatedHidenRGA(StateMachineDevice):
         self._masstable = "0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0"
         self._terse = True
 
+    @property
+    def acquisition_process(self):
+        """
+        True if scans are acquired by a child process rather than a thread of this process.
+        """
+        return self._acquisition is not None
+
+    @acquisition_process.setter
+    def acquisition_process(self, acquisition_process):
+        if acquisition_process == self.acquisition_process:
+            return
+        if self.stat:
+            self.log.error("Cannot change acquisition mode while scanning.")
+            return
+        if acquisition_process:
+            self._acquisition = self._new_acquisition()
+            self.log.info("Acquiring in process " + str(self._acquisition.pid))
+        else:
+            self._acquisition.close()
+            self._acquisition = None
+            self.log.info("Acquiring in thread")
+
+    @property
+    def history_dir(self):
+        """
+        Directory the completed scan cycles are kept in, None if they are not kept.
+        Set from HIDENRGA_HISTORY_DIR when the device is created.
+        """
+        if self._history is None:
+            return None
+        return self._history.directory
+
+    @history_dir.setter
+    def history_dir(self, history_dir):
+        if self.stat:
+            self.log.error("Cannot change the history directory while scanning.")
+            return
+        if self._history is not None:
+            self._history.close()
+            self._history = None
+        if history_dir:
+            self._history = history.HistoryStore(history_dir)
+            self.log.info("Keeping %d cycles of history in %s", len(self._history), history_dir)
+
+    @property
+    def live_name(self):
+        """
+        Name of the shared-memory segment the latest cycle and the status flags are published in,
+        None if they are not. Set from HIDENRGA_LIVE_NAME when the device is created.
+        """
+        if self._live is None:
+            return None
+        return self._live.name
+
+    @live_name.setter
+    def live_name(self, live_name):
+        if self.stat:
+            self.log.error("Cannot change the live spectrum segment while scanning.")
+            return
+        if self._live is not None:
+            self._live.close()
+            self._live = None
+        if live_name:
+            self._live = self._new_live(live_name)
+            self._export_status()
+            self.log.info("Publishing the live spectrum in shared memory " + live_name)
+
+    @staticmethod
+    def _new_live(name):
+        # Imported on first use, as most instances do not publish one.
+        try:
+            from . import live  # "emulator" case
+        except ImportError:
+            import live  # "__main__" case
+        return live.LiveSpectrum.create(name)
+
+    def _export_status(self):
+        if self._live is not None:
+            self._live.status(self._emok, self._filok, self._ptrip, self._total_pressure)
+
+    def history_read(self, sequence):
+        """
+        Returns a cycle of the history as {column: read-only array}, negative sequences counting back
+        from the latest, or None if it is not held. The arrays are views of the store, so they are
+        not suited to lewis-control; use history_cycle() there.
+        """
+        if self._history is None:
+            return None
+        return self._history.read(sequence)
+
+    def history_find(self, start, end):
+        """
+        Returns the sequence numbers of the cycles of the history between start and end, in seconds since the epoch.
+        """
+        if self._history is None:
+            return []
+        return list(self._history.find(start, end))
+
+    def history_cycle(self, sequence):
+        """
+        Returns a cycle of the history with its columns as lists, for lewis-control, or None if it is not held.
+        """
+        if self._history is None:
+            return None
+        entry = self._history.entry(sequence)
+        cycle = self._history.read(sequence)
+        if cycle is None:
+            return None
+        result = {name: column.tolist() for name, column in cycle.items()}
+        result.update(cycle=int(entry["cycle"]), start=float(entry["start"]), end=float(entry["end"]))
+        return result
+
+    def cycle_row(self, points, readings, count, tripped, started, gas_version):
+        """
+        Collects a row, or MID cycle, of the cycle being scanned. readings, which is not copied, holds
+        count readings; a tripped row ends with a NaN value carrying the trip code.
+        """
+        if self._cycle_rows is None:
+            return
+        length = count
+        values = readings
+        trips = np.zeros(count + 1 if tripped else count, dtype=np.int32)
+        if tripped:
+            length += 1
+            values = np.append(readings[:count], np.nan)
+            trips[-1] = self._trip_code or 0
+        elif len(readings) != count:
+            values = readings[:count]
+        # Points are evenly spaced by the dwell time.
+        times = started + np.arange(length) * ((time.time() - started) / max(length - 1, 1))
+        self._cycle_rows.append((points[:length], values, trips, times, np.full(length, gas_version)))
+
+    def publish_cycle(self, cycle):
+        """
+        Makes the rows collected for one cycle the latest cycle, and appends them to the history if it is kept.
+        """
+        rows = self._cycle_rows
+        self._cycle_rows = None
+        if not rows:
+            return
+        if len(rows) == 1:
+            columns = list(rows[0])
+        else:
+            columns = [np.concatenate(column) for column in zip(*rows)]
+        points, values, trips, times, gas_versions = columns
+        if self._history is not None:
+            self._history.append(cycle, times[0], times[-1], points, values, trips, times, gas_versions)
+        if self._live is not None:
+            self._live.publish(self._cycle_sequence, cycle, points, values, trips, times[-1])
+        tripped = trips != 0
+        for column in columns + [tripped]:
+            column.flags.writeable = False
+        with self._cycle_published:
+            self._completed_cycles.append(scanner.Cycle(self._cycle_sequence, cycle, points, values, trips, tripped,
+                                                        times, gas_versions))
+            self._cycle_sequence += 1
+            self._cycle_published.notify_all()
+
+    def latest_cycle(self):
+        """
+        Returns the latest completed scan cycle as a scanner.Cycle of read-only arrays, None before the first.
+        The arrays are shared with every other consumer rather than copied.
+        Cycles are only published here when scans are acquired by a thread of this process.
+        """
+        with self._cycle_published:
+            if not self._completed_cycles:
+                return None
+            return self._completed_cycles[-1]
+
+    def iter_cycles(self, timeout=None):
+        """
+        Yields each scan cycle as it completes, from the next one on, as latest_cycle() returns them.
+        A consumer that falls more than CYCLE_BACKLOG cycles behind skips the oldest. Stops when the scan
+        has ended and every cycle has been yielded, or when none completes within timeout seconds.
+        """
+        with self._cycle_published:
+            sequence = self._cycle_sequence
+        while True:
+            with self._cycle_published:
+                if sequence == self._cycle_sequence and self.stat:
+                    self._cycle_published.wait(timeout)
+                pending = [cycle for cycle in self._completed_cycles if cycle.sequence >= sequence]
+            if not pending:
+                return
+            for cycle in pending:
+                yield cycle
+            sequence = pending[-1].sequence + 1
+
+    def acquisition_configuration(self, scan_input, dwell=None, fixed_range=None):
+        """
+        Returns the acquisition configuration of scan_input, resolved once until a parameter it depends on changes.
+        dwell is a MID channel's own dwell time, fixed_range its range.
+        """
+        configurations = self._acquisition_configurations
+        key = (scan_input, dwell, fixed_range)
+        configuration = configurations.get(key)
+        if configuration is None:
+            configuration = detector.Configuration(scan_input, self._emission, self._range_units,
+                                                   self._dwell if dwell is None else dwell,
+                                                   self._low, self._high, self._current, fixed_range)
+            configurations[key] = configuration
+        return configuration
+
+    def mid_acquisition_configuration(self, scan):
+        """
+        Returns the configurations of the MID channels of scan, stacked to apply to a whole cycle at once.
+        """
+        configurations = self._acquisition_configurations
+        key = (scan.scan_input, scan.mid_channels)
+        configuration = configurations.get(key)
+        if configuration is None:
+            configuration = detector.Configuration.stack(
+                [self.acquisition_configuration(channel.scan_input or scan.scan_input, channel.dwell, channel.range)
+                 for channel in scan.mid_channels])
+            # The points of a published cycle.
+            configuration.masses = np.array([channel.mass for channel in scan.mid_channels], dtype=float)
+            configurations[key] = configuration
+        return configuration
+
+    def _reconfigure(self):
+        """
+        Drops the acquisition configurations, so they are resolved again from the changed parameters.
+        """
+        # Replaced rather than cleared: one the scan thread is resolving from the old parameters goes with it.
+        self._acquisition_configurations = {}
+
+    @staticmethod
+    def _new_acquisition():
+        # Imported on first use: only acquisition process mode needs multiprocessing and shared memory.
+        try:
+            from . import acquisition  # "emulator" case
+        except ImportError:
+            import acquisition  # "__main__" case
+        return acquisition.AcquisitionProcess()
+
+    def _acquisition_update(self):
+        """
+        Mirrors the parameters the scan depends on into the acquisition process, if used.
+        """
+        if self._acquisition is not None and not self._acquisition.update(self):
+            self.log.error("Acquisition process " + str(self._acquisition.pid) + " has exited.")
+
     def sdel_all(self):
         self._scans = {}
         self._current_scan = None
@@ -266,19 +695,37 @@ class SimulatedHidenRGA(StateMachineDevice):
         """
         Returns: states and their names
         """
-        return {DefaultState.NAME: DefaultState()}
+        return {state.NAME: state() for state in (IdleState, ScanningState, PausedState, TrippedState, DegasState)}
 
     def _get_initial_state(self):
         """
         Returns: the name of the initial state
         """
-        return DefaultState.NAME
+        return IdleState.NAME
 
     def _get_transition_handlers(self):
         """
         Returns: the state transitions
         """
-        return OrderedDict()
+        tripped = lambda: self._trip_code is not None
+        return OrderedDict([
+            ((IdleState.NAME, TrippedState.NAME), tripped),
+            ((ScanningState.NAME, TrippedState.NAME), tripped),
+            ((PausedState.NAME, TrippedState.NAME), tripped),
+            ((DegasState.NAME, TrippedState.NAME), tripped),
+            ((TrippedState.NAME, IdleState.NAME), lambda: self._trip_code is None),
+            ((IdleState.NAME, ScanningState.NAME), lambda: self.stat),
+            ((IdleState.NAME, DegasState.NAME), lambda: self._degas > 0),
+            ((DegasState.NAME, IdleState.NAME), lambda: self._degas == 0),
+            ((ScanningState.NAME, IdleState.NAME), lambda: not self.stat),
+            ((PausedState.NAME, IdleState.NAME), lambda: not self.stat),
+            ((ScanningState.NAME, PausedState.NAME), lambda: self.wait),
+            ((PausedState.NAME, ScanningState.NAME), lambda: not self.wait)])
+
+    @property
+    def state(self):
+        """ Name of the current state of the device's state machine. """
+        return self._csm.state
 
     @property
     def name(self):
@@ -293,20 +740,26 @@ class SimulatedHidenRGA(StateMachineDevice):
     def configuration(self):
         return self._configuration
         
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def logical():
+        """ The logical device tables, built on first use and shared by every device of the process. """
+        return SimulatedHidenRGA.Logical()
+
     @property
     def scan_table(self):
-        return self._logical.scan_table
+        return self.logical().scan_table
         
     @property
     def logical_all(self):
-        return self._logical.all
+        return self.logical().all
         
     @property
     def logical_groups(self):
-        return self._logical.groups
+        return self.logical().groups
         
     def logical_group(self, group):
-        return self._logical.groups[group]
+        return self.logical().groups[group]
         
     @property
     def terse(self):
@@ -315,6 +768,21 @@ class SimulatedHidenRGA(StateMachineDevice):
     @terse.setter
     def terse(self, terse):
         self._terse = terse
+        self._changed("terse")
+
+    def add_change_listener(self, listener):
+        """
+        Calls listener with the name of each of terse, range_units and masstable when it is set.
+        The stream interface drops the replies it has cached that depend on it.
+        """
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        self._change_listeners.remove(listener)
+
+    def _changed(self, name):
+        for listener in self._change_listeners:
+            listener(name)
     
     @property
     def align(self):
@@ -332,6 +800,7 @@ class SimulatedHidenRGA(StateMachineDevice):
     @masstable.setter
     def masstable(self, masstable):
         self._masstable = masstable
+        self._changed("masstable")
 
     @property
     def data_queue(self):
@@ -363,13 +832,16 @@ class SimulatedHidenRGA(StateMachineDevice):
                         other_scan.time_queue.get()
                         other_scan.time_queue.task_done()
                     other_value = other_scan.data_queue.get()
-                    print(other_scan.scan_output + " set to " + str(other_scan_point) + " at " + str(other_value))
+                    self.log.debug("%s set to %s at %s", other_scan.scan_output, other_scan_point, other_value)
                     other_scan.data_queue.task_done()
                     other_scan.scan_queue.task_done()
         value = current_scan.data_queue.get()
         if isinstance(value, self.TripError):
             return_string += "*P" + str(value.code) + "*"
         else:
+            deviation = None
+            if isinstance(value, scanner.Averaged):
+                value, deviation = value
             if (report & 4) != 0:
                 return_string += str(scan_point)
                 return_string += ":"
@@ -378,6 +850,9 @@ class SimulatedHidenRGA(StateMachineDevice):
                     return_string += " "
                 return_string += str(value)
                 return_string += ","
+            if (report & 2) != 0 and deviation is not None:
+                # Bit 1, standard deviation of an accumulated value.
+                return_string += " " + str(deviation) + ","
         current_scan.data_queue.task_done()
         if (report & 4) != 0:
             if scan_point >= current_scan.stop:
@@ -393,6 +868,36 @@ class SimulatedHidenRGA(StateMachineDevice):
         current_scan.scan_queue.task_done()
         return return_string
         
+    def next_mid_record(self, current_scan):
+        """
+        Formats one cycle of a MID scan, with a single elapsed time for the cycle.
+        """
+        record = current_scan.data_queue.get()
+        report = current_scan.report
+        return_string = "["
+        if (report & 16) != 0:
+            return_string += "/" + str(record.elapsed) + "/"
+        return_string += "{"
+        for channel, value in zip(record.channels, record.values):
+            if (report & 4) != 0:
+                return_string += str(channel.mass)
+                return_string += ":"
+            if (report & 1) != 0:
+                if value >= 0:
+                    return_string += " "
+                return_string += str(value)
+                return_string += ","
+        if record.trip is not None:
+            return_string += "*P" + str(record.trip.code) + "*"
+        else:
+            return_string += "}]"
+            if self._scan_thread is not None:
+                self._scan_thread.join(0)
+            if self._scan_thread is None:
+                return_string += "!"
+        current_scan.data_queue.task_done()
+        return return_string
+
     def data(self, all=False):
         """
         Retrieves all currently queued data values.
@@ -405,14 +910,22 @@ class SimulatedHidenRGA(StateMachineDevice):
                 current_scan = scan
                 break
         if current_scan.data_queue.empty() and not self.stat:
+            # An outer scan queues its value after its inner row has run, and that value is only
+            # taken when a later inner point is reported, so the last ones are left behind.
+            for scan in self._scans.values():
+                scan.clear_queues()
             return "*C110*"     # No more data available
             
         while not current_scan.data_queue.empty():
-            return_string += self.next_data_point(current_scan)
-            point += 1
+            if current_scan.mid_channels:
+                return_string += self.next_mid_record(current_scan)
+                point += len(current_scan.mid_channels)
+            else:
+                return_string += self.next_data_point(current_scan)
+                point += 1
             if not all and point >= self.points:
                 break
-        self.log.debug("return_string " + return_string)
+        self.log.debug("return_string %s", return_string)
         return return_string
 
     @property
@@ -430,6 +943,8 @@ class SimulatedHidenRGA(StateMachineDevice):
     @emok.setter
     def emok(self, emok):
         self._emok = emok
+        self._update_trip()
+        self._acquisition_update()
 
     @property
     def filok(self):
@@ -440,6 +955,8 @@ class SimulatedHidenRGA(StateMachineDevice):
         self._filok = filok
         if not filok:
             self._emok = False
+        self._update_trip()
+        self._acquisition_update()
 
     @property
     def ptrip(self):
@@ -452,6 +969,8 @@ class SimulatedHidenRGA(StateMachineDevice):
     @overtemp.setter
     def overtemp(self, overtemp):
         self._overtemp = overtemp
+        self._update_trip()
+        self._acquisition_update()
 
     @property
     def inhibit(self):
@@ -460,6 +979,12 @@ class SimulatedHidenRGA(StateMachineDevice):
     @inhibit.setter
     def inhibit(self, inhibit):
         self._inhibit = inhibit
+        self._update_trip()
+        self._acquisition_update()
+
+    @property
+    def scans(self):
+        return self._scans
 
     @property
     def current_scan(self):
@@ -579,6 +1104,7 @@ class SimulatedHidenRGA(StateMachineDevice):
     @cycles.setter
     def cycles(self, cycles):
         self._cycles = cycles
+        self._acquisition_update()
 
     @property
     def interval(self):
@@ -595,6 +1121,8 @@ class SimulatedHidenRGA(StateMachineDevice):
     @low.setter
     def low(self, low):
         self._low = low
+        self._reconfigure()
+        self._acquisition_update()
 
     @property
     def high(self):
@@ -603,6 +1131,8 @@ class SimulatedHidenRGA(StateMachineDevice):
     @high.setter
     def high(self, high):
         self._high = high
+        self._reconfigure()
+        self._acquisition_update()
 
     @property
     def current(self):
@@ -613,6 +1143,8 @@ class SimulatedHidenRGA(StateMachineDevice):
     @current.setter
     def current(self, current):
         self._current = current
+        self._reconfigure()
+        self._acquisition_update()
        
     @property
     def range_units(self):
@@ -621,6 +1153,9 @@ class SimulatedHidenRGA(StateMachineDevice):
     @range_units.setter
     def range_units(self, range_units):
         self._range_units = range_units
+        self._changed("range_units")
+        self._reconfigure()
+        self._acquisition_update()
 
     def range_min(self, logical_device):
         if logical_device == "Faraday_range":
@@ -661,6 +1196,7 @@ class SimulatedHidenRGA(StateMachineDevice):
     @mass.setter
     def mass(self, mass):
         self._mass = mass
+        self._acquisition_update()
         
     @property
     def electron_energy(self):
@@ -669,6 +1205,17 @@ class SimulatedHidenRGA(StateMachineDevice):
     @electron_energy.setter
     def electron_energy(self, electron_energy):
         self._electron_energy = electron_energy
+        self._acquisition_update()
+
+    @property
+    def scanning_at(self):
+        """
+        Read-only (mass, electron energy) the scan is currently at, or None when not scanning.
+        """
+        cursor = self._cursor
+        if cursor is None:
+            return None
+        return scanner.ScanPosition(cursor.mass, cursor.electron_energy)
         
     @property
     def enable(self):
@@ -689,6 +1236,8 @@ class SimulatedHidenRGA(StateMachineDevice):
             self._emok = True
         else:
             self._emok = self._emission == 0
+        self._update_trip()
+        self._acquisition_update()
         
     @property
     def F2(self):
@@ -701,6 +1250,8 @@ class SimulatedHidenRGA(StateMachineDevice):
             self._emok = True
         else:
             self._emok = self._emission == 0
+        self._update_trip()
+        self._acquisition_update()
         
     @property
     def emission(self):
@@ -709,6 +1260,8 @@ class SimulatedHidenRGA(StateMachineDevice):
     @emission.setter
     def emission(self, emission):
         self._emission = emission
+        self._reconfigure()
+        self._acquisition_update()
         
     @property
     def mode(self):
@@ -726,6 +1279,29 @@ class SimulatedHidenRGA(StateMachineDevice):
     def report(self, report):
         self._current_scan.report = report
 
+    @property
+    def accumulate(self):
+        return self._current_scan.accumulate
+
+    @accumulate.setter
+    def accumulate(self, accumulate):
+        if accumulate < 0:
+            self.log.error("Accumulate " + str(accumulate) + " cycles is negative.")
+            return
+        self._current_scan.accumulate = accumulate
+
+    @property
+    def accumulate_method(self):
+        return self._current_scan.accumulate_method
+
+    @accumulate_method.setter
+    def accumulate_method(self, accumulate_method):
+        if accumulate_method not in accumulation.METHODS:
+            self.log.error("Accumulate method " + str(accumulate_method) + " is not one of " +
+                           ", ".join(accumulation.METHODS))
+            return
+        self._current_scan.accumulate_method = accumulate_method
+
     @property
     def dwell(self):
         return self._dwell
@@ -733,6 +1309,8 @@ class SimulatedHidenRGA(StateMachineDevice):
     @dwell.setter
     def dwell(self, dwell):
         self._dwell = dwell
+        self._reconfigure()
+        self._acquisition_update()
 
     @property
     def dwellmode(self):
@@ -765,6 +1343,7 @@ class SimulatedHidenRGA(StateMachineDevice):
     @noise.setter
     def noise(self, noise):
         self._noise = noise
+        self._acquisition_update()
 
     @property
     def current_gas(self):
@@ -782,7 +1361,7 @@ class SimulatedHidenRGA(StateMachineDevice):
         if self._current_gas is None:
             self.log.error("No gas selected.")
             return
-        return self._gasses.gas(self._current_gas).partial_pressure
+        return self._gasses.state.partial_pressure(self._current_gas)
 
     @current_gas_pressure.setter
     def current_gas_pressure(self, partial_pressure):
@@ -790,27 +1369,44 @@ class SimulatedHidenRGA(StateMachineDevice):
             self.log.error("No gas selected.")
             return
             
-        self._total_pressure += partial_pressure - self._gasses.gas(self._current_gas).partial_pressure
+        gas_state = self._gasses.set_partial_pressure(self._current_gas, partial_pressure)
+        self._total_pressure = gas_state.total_pressure
         if self._total_pressure > 1E-2: # NB, Pascal units
             self.log.warning("Total pressure caused trip at " + str(self._total_pressure))
             self._ptrip = True
             self._emission = 0
             self._scan_input = "Faraday"
+            self._reconfigure()
         elif self._ptrip:
             self.log.info("Pressure trip cleared with " + str(self._total_pressure))
             self._ptrip = False
+        self._update_trip()
+        if self._acquisition is not None:
+            self._acquisition.send("gas", gas_state)
+            self._acquisition.update(self)
         
-        self._gasses.gas(self._current_gas).partial_pressure = partial_pressure
-        self.log.info(str(self._current_gas) + " pressure set to " + str(self._gasses.gas(self._current_gas).partial_pressure) + " total now " + str(self._total_pressure))
+        self.log.info("%s pressure set to %s total now %s", self._current_gas,
+                      gas_state.partial_pressure(self._current_gas), self._total_pressure)
         
     @property
     def total_pressure(self):
         return self._total_pressure
+
+    @property
+    def active_species(self):
+        """ Names of the gases with a non-zero partial pressure, for diagnostics. """
+        return sorted(self._gasses.active_species())
+
+    @property
+    def gas_state(self):
+        return self._gasses.state
         
     def join(self, timeout):
-        if self._scan_thread is not None:
-            self._scan_thread.join(timeout)
-            if not self._scan_thread.is_alive():
+        # Stream interface and lewis-control threads may both join, so only clear the thread that was joined.
+        scan_thread = self._scan_thread
+        if scan_thread is not None:
+            scan_thread.join(timeout)
+            if not scan_thread.is_alive() and self._scan_thread is scan_thread:
                 self.log.info("Thread has exitied.")
                 self._scan_thread = None
 
@@ -818,17 +1414,36 @@ class SimulatedHidenRGA(StateMachineDevice):
         """
         Starts threaded data acquisition.
         """
+        if self.trending:
+            # The trend thread uses the spectrum cache, which only one thread may use.
+            self.log.error("Cannot scan while trending.")
+            return
+        if self._degas > 0:
+            self.log.error("Cannot scan while degassing.")
+            return
         if self._scan_thread is not None:
             self.log.warning("Thread was still active, stopping.")
             self._scan_thread.join(None)
             self._scan_thread = None
         
         if current_scan not in self._scans:
-            self._scans[current_scan] = Scanner()
+            self._scans[current_scan] = scanner.Scanner("mass")
         self._current_scan = self._scans[current_scan]
-        self._scan_thread = self.ScanThread(self, "scan_thread")
+        if self._current_scan.accumulate > 1 and (self._current_scan.mid_channels or
+                                                  self._current_scan.scan_input not in detector.DETECTORS):
+            self.log.error("Only SEM and Faraday row scans can accumulate.")
+            return
         for name, scan in self._scans.items():
             scan.clear_queues()
+        if self._acquisition is None:
+            self._scan_thread = self.ScanThread(self, "scan_thread")
+        else:
+            if not self._acquisition.alive:
+                self.log.error("Acquisition process " + str(self._acquisition.pid) + " has exited, restarting.")
+                self._acquisition.close()
+                self._acquisition = self._new_acquisition()
+            self._scan_thread = self.ProcessScanThread(self, "scan_thread")
+            self._acquisition.start(self, current_scan)
         self._scan_thread.start()
 
     @property
@@ -851,6 +1466,8 @@ class SimulatedHidenRGA(StateMachineDevice):
             self._stopping = self.StopOptions.STOP
             timeout = 0
         self._nowait.set()
+        if self._acquisition is not None:
+            self._acquisition.send("stop", abort)
         self.join(timeout)
 
     @property
@@ -865,6 +1482,8 @@ class SimulatedHidenRGA(StateMachineDevice):
         else:
             self.log.info("Continue scanning at end of cycle.")
             self._nowait.set()
+        if self._acquisition is not None:
+            self._acquisition.send("wait", wait)
         
     @property
     def current_row_start(self):
@@ -896,117 +1515,471 @@ class SimulatedHidenRGA(StateMachineDevice):
     def current_row_step(self, current_row_step):
         self.current_scan.current_row_step = current_row_step
         
-    def scan_value(self, data_point):
+    @staticmethod
+    def read_only(signals):
+        """
+        Returns signals as a read-only array, as the spectrum cache shares them.
+        """
+        signals = np.array(signals, dtype=float)
+        signals.flags.writeable = False
+        return signals
+
+    def noiseless_row(self, scan, row, data_points, gas_state, cursor):
+        """
+        Returns the signal in Pascal at every point of row without noise, from the spectrum cache if nothing it depends on has changed.
+        """
+        fixed_mass = None if scan.scan_output == "mass" else cursor.mass
+        fixed_electron_energy = None if scan.scan_output == "electron-energy" else cursor.electron_energy
+        signal_surface = self._signal_surface
+        key = (scan.scan_output, row.start, row.step, data_points, self._gasses.species_version,
+               gas_state.version, self._gasses.peak_shape, fixed_mass, fixed_electron_energy, signal_surface)
+
+        def build():
+            scan_points = self.row_scan_points(row, data_points)
+            if signal_surface:
+                surface = self._gasses.surface(gas_state)
+                if scan.scan_output == "mass":
+                    signals = surface.sample(scan_points, fixed_electron_energy)
+                elif scan.scan_output == "electron-energy":
+                    signals = surface.sample(fixed_mass, scan_points)
+                else:
+                    signals = surface.sample(np.full(data_points, fixed_mass), fixed_electron_energy)
+            elif scan.scan_output == "mass":
+                signals = [self._gasses.signal(mass, fixed_electron_energy, gas_state) for mass in scan_points]
+            elif scan.scan_output == "electron-energy":
+                signals = self._gasses.energy_signals(fixed_mass, scan_points, gas_state)
+            else:
+                signals = [self._gasses.signal(fixed_mass, fixed_electron_energy, gas_state)] * data_points
+            return self.read_only(signals)
+
+        return self._spectra.get(key, build)
+
+    @property
+    def peak_shape(self):
+        """ The peak shape, set from resolution, delta_m and peak_tailing. """
+        return self._peak_shape
+
+    @peak_shape.setter
+    def peak_shape(self, peak_shape):
+        self._peak_shape = peak_shape
+        self._gasses.peak_shape = peak_shape
+        self._acquisition_update()
+
+    @property
+    def resolution(self):
+        return self._peak_shape.resolution
+
+    @resolution.setter
+    def resolution(self, resolution):
+        self.peak_shape = self._peak_shape._replace(resolution=float(resolution))
+
+    @property
+    def delta_m(self):
+        return self._peak_shape.delta_m
+
+    @delta_m.setter
+    def delta_m(self, delta_m):
+        self.peak_shape = self._peak_shape._replace(delta_m=float(delta_m))
+
+    @property
+    def peak_tailing(self):
+        """ Height of the low mass tail relative to the peak, 0 for symmetric peaks. """
+        return self._peak_shape.tailing
+
+    @peak_tailing.setter
+    def peak_tailing(self, peak_tailing):
+        self.peak_shape = self._peak_shape._replace(tailing=float(peak_tailing))
+
+    @property
+    def signal_surface(self):
+        """
+        True to sample signals from an interpolated mass x electron energy surface of the gas state,
+        which is much faster for 2-D maps and accurate to about 1% of the largest peak.
+        """
+        return self._signal_surface
+
+    @signal_surface.setter
+    def signal_surface(self, signal_surface):
+        self._signal_surface = signal_surface
+        self._acquisition_update()
+
+    @property
+    def spectra(self):
+        """ The noiseless spectrum cache, for diagnostics. """
+        return self._spectra
+
+    def interlock(self):
+        """
+        Returns the trip code and reason of the first interlock that is tripped, or None, None.
+        """
+        if self._inhibit:
+            return 111, "inhibit is set"
+        if self._ptrip:
+            return 112, "ptrip is set"
+        if not self._filok:
+            return 113, "filok is not set"
+        if not self._emok:
+            return 114, "emok is not set"
+        if self._overtemp:
+            return 115, "overtemp is set"
+        return None, None
+
+    def _update_trip(self):
+        """
+        Re-evaluates the interlocks after one of them has changed. A trip is logged once when it
+        latches, and trips that latch again within TRIP_LOG_INTERVAL are counted rather than logged.
         """
-        Acquires one data sample.
+        self._export_status()
+        code, reason = self.interlock()
+        if code == self._trip_code:
+            return
+        self._trip_code = code
+        if code is None:
+            self.log.info("Trip cleared")
+            return
+        now = time.monotonic()
+        if now - self._trip_logged < self.TRIP_LOG_INTERVAL:
+            self._trips_suppressed += 1
+            return
+        suppressed = ""
+        if self._trips_suppressed != 0:
+            suppressed = " after " + str(self._trips_suppressed) + " unlogged trips"
+        self.log.warning("Tripped, " + reason + suppressed)
+        self._trip_logged = now
+        self._trips_suppressed = 0
+
+    def trip_error(self):
         """
-        scan_point = self.current_row_start + self.current_row_step * data_point
+        Returns the TripError for the first interlock that is tripped, or None.
+        The interlocks are only evaluated when one of them changes.
+        """
+        if self._trip_code is None:
+            return None
+        return self.TripError(self._trip_code)
+
+    @property
+    def degas(self):
+        """ Seconds of ion source degas remaining, 0 when not degassing. """
+        return self._degas
+
+    @degas.setter
+    def degas(self, degas):
+        if self.stat:
+            self.log.error("Cannot degas while scanning.")
+            return
+        if degas > 0 and self._trip_code is not None:
+            self.log.error("Cannot degas while tripped.")
+            return
+        self._degas = max(0, degas)
+
+    def noiseless_mid(self, channels, gas_state, cursor):
+        """
+        Returns the signal in Pascal at every MID channel without noise, from the spectrum cache if nothing it depends on has changed.
+        """
+        signal_surface = self._signal_surface
+        key = ("MID", channels, self._gasses.species_version, gas_state.version, self._gasses.peak_shape,
+               cursor.electron_energy, signal_surface)
+
+        def build():
+            masses = np.array([channel.mass for channel in channels], dtype=float)
+            if signal_surface:
+                signals = self._gasses.surface(gas_state).sample(masses, cursor.electron_energy)
+            else:
+                signals = np.array([self._gasses.signal(mass, cursor.electron_energy, gas_state) for mass in masses])
+            return self.read_only(signals)
+
+        return self._spectra.get(key, build)
+
+    @property
+    def trend_mass(self):
+        return self._trend_mass
+
+    @trend_mass.setter
+    def trend_mass(self, trend_mass):
+        self._trend_mass = trend_mass
+
+    @property
+    def trend_rate(self):
+        """ Samples per second taken in trend mode. """
+        return self._trend_rate
+
+    @trend_rate.setter
+    def trend_rate(self, trend_rate):
+        if trend_rate <= 0:
+            self.log.error("Trend rate must be positive, not " + str(trend_rate))
+            return
+        self._trend_rate = trend_rate
+
+    @property
+    def trend_output_rate(self):
+        """ Rows per second returned by trend_data() after decimation. """
+        return self._trend_output_rate
+
+    @trend_output_rate.setter
+    def trend_output_rate(self, trend_output_rate):
+        if trend_output_rate <= 0:
+            self.log.error("Trend output rate must be positive, not " + str(trend_output_rate))
+            return
+        self._trend_output_rate = trend_output_rate
+
+    @property
+    def trend_decimation(self):
+        """ How each block of samples is reduced: "mean", "minmax" or "last". """
+        return self._trend_decimation
+
+    @trend_decimation.setter
+    def trend_decimation(self, trend_decimation):
+        if trend_decimation not in trend.DECIMATIONS:
+            self.log.error("Unknown trend decimation " + str(trend_decimation))
+            return
+        self._trend_decimation = trend_decimation
+
+    @property
+    def trending(self):
+        return self._trend_thread is not None and self._trend_thread.is_alive()
+
+    @property
+    def trend_lost(self):
+        """ Samples overwritten before they were read. """
+        return self._trend_buffer.lost
+
+    @property
+    def trend_trip(self):
+        """ Code of the trip that stopped the trend, 0 if none. """
+        return 0 if self._trend_trip is None else self._trend_trip.code
+
+    def start_trend(self):
+        """
+        Starts sampling trend_mass at trend_rate into the trend buffer.
+        """
+        if self.stat:
+            self.log.error("Cannot trend while scanning.")
+            return
+        self.stop_trend()
+        self._trend_buffer.clear()
+        self._trend_trip = None
+        self._trend_stop.clear()
+        self._trend_thread = self.TrendThread(self, "trend_thread")
+        self._trend_thread.start()
+
+    def stop_trend(self):
+        if self._trend_thread is not None:
+            self._trend_stop.set()
+            self._trend_thread.join()
+            self._trend_thread = None
+
+    def trend_data(self):
+        """
+        Returns the trend samples since the last call, decimated to trend_output_rate, as
+        [seconds, mean], [seconds, min, max] or [seconds, last] rows. Samples that do not
+        fill a whole block are kept for the next call.
+        """
+        factor = max(1, int(round(float(self._trend_rate) / self._trend_output_rate)))
+        times, values = self._trend_buffer.take(factor)
+        return trend.decimate(times, values, factor, self._trend_decimation).tolist()
+
+    @property
+    def mid_channels(self):
+        """
+        The MID channels of the current scan as [mass, dwell, input, range] lists. Set an empty list for a row scan.
+        """
+        if self.current_scan is None:
+            return []
+        return [list(channel) for channel in self._current_scan.mid_channels]
+
+    @mid_channels.setter
+    def mid_channels(self, channels):
+        if self.current_scan is None:
+            self.current_scan = 'Ascans'
+        self._current_scan.mid_channels = channels
+
+    def scan_mid(self, start_time, scan, cursor):
+        """
+        Scans one cycle of a MID scan, queueing it as a single MIDRecord.
+        """
+        channels = scan.mid_channels
+        gas_state = self._gasses.state
+        signals = self.noiseless_mid(channels, gas_state, cursor)
+        noise_block = np.random.normal(-self._noise, self._noise, len(channels))
+        configuration = self.mid_acquisition_configuration(scan)
+        block = configuration.readings(signals, noise_block)
+        readings = block.tolist()
+        started = time.time()
+        elapsed = int((time.monotonic() - start_time) * 1000.0)
+        values = []
+        TripError = None
+        for index, channel in enumerate(channels):
+            if self._stopping == self.StopOptions.ABORT:
+                self.log.warning("Scan aborted by IOC")
+                return False
+            dwell = self._dwell if channel.dwell is None else channel.dwell
+            if self._wake.wait(dwell / 1000.0):
+                self._wake.clear()
+            cursor.mass = channel.mass
+            TripError = self.trip_error()
+            if TripError is not None:
+                break
+            values.append(readings[index])
+        scan.data_queue.put(scanner.MIDRecord(elapsed, channels, values, TripError))
+        self.cycle_row(configuration.masses, block, len(values), TripError is not None, started, gas_state.version)
+        if TripError is not None:
+            self.log.warning("Aborting scan due to trip")
+            return False
+        self._nowait.wait()
+        return True
+
+    def scan_value(self, scan, row, data_point, readings, cursor, configuration, values=None):
+        """
+        Acquires one data sample at the cursor position.
+        readings holds the row's detector readings, noise included, None if the input is not a detector;
+        configuration is the scan input's acquisition configuration.
+        When accumulating, the sample goes into values rather than the queues, unless it trips.
+        """
+        scan_point = row.start + row.step * data_point
         if self._wake.wait(self._dwell / 1000.0):
             self._wake.clear()
-        if self.current_scan.scan_output == "electron-energy":
-            self.electron_energy = scan_point
+        if scan.scan_output == "electron-energy":
+            cursor.electron_energy = scan_point
             
-        if self.current_scan.scan_output == "mass":
-            self.mass = scan_point
-        
-        signal = 0
-        noise = 0
-        if self.current_scan.scan_input == "SEM" or self.current_scan.scan_input == "Faraday":
-            pascal_to_torr = 0.00750062
-            pascal_to_amps = 1E-5
-            signal = self._gasses.signal(self.mass, self.electron_energy)
-            # NB, The Hiden device uses Torr as the output unit.
-            # But this project uses Pascal (the SI unit) as the unit wherever possible.
-            signal *= self.emission / 500  # Default 500 uA emission
-            if self.range_units == 'Torr':
-                signal *= pascal_to_torr
-            if self.range_units == 'Amps':
-                signal *= pascal_to_amps
-            noise = normal(-self._noise, self._noise)
-            if self.current_scan.scan_input == "SEM":
-                # Much lower noise in SEM mode.
-                noise /= 1000
-            if self.dwell != 0:
-                # Default 100 mS dwell time
-                noise = noise * 100 / self.dwell
-
-        if self.current_scan.scan_input[1:len(self.current_scan.scan_input)] == "scans":
-            # Is multi-variant scan.
-            other_scan = self._scans[self.current_scan.scan_input]
+        if scan.scan_output == "mass":
+            cursor.mass = scan_point
+        
+        value = 0
+        if readings is not None:
+            value = readings[data_point]
+
+        if configuration.nested:
+            other_scan = self._scans[scan.scan_input]
             if other_scan.scan_output == "electron-energy":
-                signal = self.electron_energy
+                value = cursor.electron_energy
             if other_scan.scan_output == "mass":
-                signal = self.mass
+                value = cursor.mass
         
-        TripError = None
-        if self._inhibit:
-            self.log.warning("inhibit is set")
-            TripError = self.TripError(111)
-        elif self._ptrip:
-            self.log.warning("ptrip is set")
-            TripError = self.TripError(112)
-        elif not self._filok:
-            self.log.warning("filok is not set")
-            TripError = self.TripError(113)
-        elif not self._emok:
-            self.log.warning("emok is not set")
-            TripError = self.TripError(114)
-        elif self._overtemp:
-            self.log.warning("overtemp is set")
-            TripError = self.TripError(115)
-            
+        TripError = self.trip_error()
+        if TripError is None and values is not None:
+            values[data_point] = value
+            return True
         if TripError is None:
             # Bit 0, return input value. NB, not neccecarily used for report.
-            self.current_scan.data_queue.put(signal + noise)
+            scan.data_queue.put(value)
         else:
             # Send trip error
-            self.current_scan.data_queue.put(TripError)
+            scan.data_queue.put(TripError)
         
         # Bit 2, output value. NB, not neccecarily used for report.
-        self.current_scan.scan_queue.put(scan_point)
+        scan.scan_queue.put(scan_point)
         return TripError is None
     
-    def scan_row(self, start_time):
+    @staticmethod
+    def row_scan_points(row, data_points):
+        """ The scan point of each of the data_points of row. """
+        return row.start + row.step * np.arange(data_points)
+
+    @staticmethod
+    def row_points(row):
         """
-        Scans the current row.
+        Number of points in row. The stop value is the last point; the row does not include a further step.
         """
-        data_point = 0
-        
-        value_tolerance = sys.float_info.epsilon * (1 + self.current_row_stop)
-        
-        # Row current_row_stop is set as the last point, but does not include the last step
-        current_row_length = self.current_row_stop + self.current_row_step - self.current_row_start
-        
+        value_tolerance = sys.float_info.epsilon * (1 + row.stop)
+        current_row_length = row.stop + row.step - row.start
         if abs(current_row_length) < value_tolerance:
-            data_points = 1
-            self.log.info("Zero row length, setting 1 point with " + str(self.current_row_step) + " step")
-        else:
-            data_points = int(0.5 + float(current_row_length) / self.current_row_step)
-            self.log.info("Finite row length, setting " + str(data_points) + " points")
+            return 1
+        return int(0.5 + float(current_row_length) / row.step)
+
+    def plan_rows(self, scan):
+        """
+        Number of noiseless rows one cycle of scan uses, counting a nested scan once per outer point.
+        """
+        if scan.mid_channels:
+            return 1
+        rows = 0
+        configuration = self.acquisition_configuration(scan.scan_input)
+        for row in scan.rows:
+            if configuration.detector is not None:
+                rows += 1
+            if configuration.nested and scan.scan_input in self._scans:
+                rows += self.row_points(row) * self.plan_rows(self._scans[scan.scan_input])
+        return rows
+
+    def scan_row(self, start_time, scan, row, cursor):
+        """
+        Scans one row of scan.
+        """
+        data_point = 0
+        # One consistent set of partial pressures for the whole row.
+        gas_state = self._gasses.state
+        data_points = self.row_points(row)
+        self.log.debug("Row of %d points with %s step", data_points, row.step)
+        configuration = self.acquisition_configuration(scan.scan_input)
+        signals = None
+        if configuration.detector is not None:
+            # The axis that is not scanned stays where it is for the whole row.
+            signals = self.noiseless_row(scan, row, data_points, gas_state, cursor)
+        noise_block = np.random.normal(-self._noise, self._noise, data_points)
+        block = None
+        readings = None
+        started = time.time()
+        if signals is not None:
+            block = configuration.readings(signals, noise_block)
+            readings = block.tolist()
         elapsed = int((time.monotonic() - start_time) * 1000.0)
-        # Bit 4, elapsed time in ms. NB, not neccecarily used for report.
-        self.current_scan.time_queue.put(elapsed)
+        accumulator = None
+        values = None
+        if self._accumulators is not None:
+            accumulator = self._accumulators.get(row)
+            if accumulator is None:
+                accumulator = accumulation.Accumulator(scan.accumulate, scan.accumulate_method)
+                self._accumulators[row] = accumulator
+            values = np.zeros(data_points)
+        else:
+            # Bit 4, elapsed time in ms. NB, not neccecarily used for report.
+            scan.time_queue.put(elapsed)
         while data_point < data_points:
             if data_points == 1:
-                self.log.info("Data point")
+                self.log.debug("Data point")
             if self._stopping == self.StopOptions.ABORT:
                 self.log.warning("Scan aborted by IOC")
                 return False
-            if self.current_scan.scan_input[1:len(self.current_scan.scan_input)] == "scans":
+            if configuration.nested:
                 # Is multi-variant scan.
-                present_scan = self._current_scan  # Cache current scan reference
-                self._current_scan = self._scans[self.current_scan.scan_input]
-                self.scan(start_time)  # Recursive!
-                self._current_scan = present_scan
-            if not self.scan_value(data_point):
+                self.scan(start_time, self._scans[scan.scan_input], cursor)  # Recursive!
+            if not self.scan_value(scan, row, data_point, readings, cursor, configuration, values):
+                if values is not None and data_point == 0:
+                    # The reader takes the elapsed time with a row's first point.
+                    scan.time_queue.put(elapsed)
+                if block is not None:
+                    self.cycle_row(self.row_scan_points(row, data_points), block, data_point, True, started,
+                                   gas_state.version)
                 self.log.warning("Aborting scan due to trip")
                 return False
             data_point += 1
+        if block is not None:
+            self.cycle_row(self.row_scan_points(row, data_points), block, data_points, False, started,
+                           gas_state.version)
+        if accumulator is not None:
+            accumulator.add(values)
+            if accumulator.complete:
+                self.queue_accumulated(scan, row, accumulator, elapsed)
         return True
+
+    def queue_accumulated(self, scan, row, accumulator, elapsed):
+        """
+        Queues the mean and standard deviation of every point of row over the accumulator's block of cycles.
+        """
+        means, deviations = accumulator.take()
+        scan.time_queue.put(elapsed)
+        for data_point, (mean, deviation) in enumerate(zip(means.tolist(), deviations.tolist())):
+            scan.data_queue.put(scanner.Averaged(mean, deviation))
+            scan.scan_queue.put(row.start + row.step * data_point)
             
-    def scan(self, start_time):
-        for self.current_row, item in enumerate(self._current_scan.rows):
-            if not self.scan_row(start_time):
+    def scan(self, start_time, scan, cursor):
+        """
+        Scans all rows of scan. Client changes to the current scan and row do not affect it.
+        """
+        if scan.mid_channels:
+            return self.scan_mid(start_time, scan, cursor)
+        for row in scan.rows:
+            if not self.scan_row(start_time, scan, row, cursor):
                 return False
         self._nowait.wait()
         return True
@@ -1,9 +1,31 @@
+import collections
+import copy
+import functools
+import json
 import numpy as np
+import os
 import pprint
+import re
+import threading
+from types import MappingProxyType
+
+try:
+    from . import peakshape  # "emulator" case
+except ImportError:
+    import peakshape  # "__main__" case
 
 import logging
-logging.basicConfig(level=logging.INFO, filename='gasses.log', format='%(asctime)s [%(levelname)5s] %(name)s: %(message)s', filemode="w")
-LOG = logging.getLogger(__name__)
+LOG = logging.getLogger("hidenrga.gasses")
+
+def ionisation_efficiency(electron_energy, ionisation_energy):
+    """ This curve is probably about right. Takes scalars or arrays. """
+    # https://pubs.aip.org/aip/jcp/article/154/11/114104/315339/The-efficient-calculation-of-electron-impact
+    over_threshold = np.maximum(np.subtract(electron_energy, ionisation_energy), 0)
+    # Zero below the threshold, including at zero and negative electron energies.
+    efficiency = np.where(over_threshold > 0,
+                          3 * over_threshold / np.power(np.maximum(electron_energy, ionisation_energy), 1.2), 0)
+    return efficiency[()]
+
 
 class GasSpecies:
 
@@ -11,7 +33,6 @@ class GasSpecies:
         self._name = name
         self._mass = 0
         self._ionisation_energy = ionisation_energy
-        self._partial_pressure = 0
 
     @property
     def name(self):
@@ -29,102 +50,544 @@ class GasSpecies:
     def ionisation_energy(self):
         return self._ionisation_energy
 
-    @property
-    def partial_pressure(self):
-        return self._partial_pressure
-
-    @partial_pressure.setter
-    def partial_pressure(self, partial_pressure):
-        self._partial_pressure = partial_pressure
-
     def ionisation_efficiency(self, electron_energy):
-        """ This curve is probably about right """
-        # https://pubs.aip.org/aip/jcp/article/154/11/114104/315339/The-efficient-calculation-of-electron-impact
         if electron_energy < self._ionisation_energy:
             return 0
-        over_threshold = electron_energy - self._ionisation_energy
+        return ionisation_efficiency(electron_energy, self._ionisation_energy)
 
-        return 3 * over_threshold / pow(electron_energy, 1.2)
 
-    def signal(self, mass, electron_energy):
-        if self._partial_pressure == 0:
-            return 0
-        sigma = 0.25  # Clear between peaks to ~12%
-        gaussian = np.exp(-np.power((mass - self._mass)/sigma, 2.)/2.)
-        
-        signal = self._partial_pressure * self.ionisation_efficiency(electron_energy) * gaussian
-        return signal
+class GasState:
+    """
+    Immutable snapshot of the partial pressures, in Pascal.
+    Gasses replaces the whole snapshot on every change, so a reader holding
+    one sees a consistent set of pressures without locking.
+    """
 
+    def __init__(self, version, partial_pressures):
+        self._version = version
+        self._partial_pressures = MappingProxyType(partial_pressures)
+        self._total_pressure = sum(partial_pressures.values())
 
-class Gasses:
+    def __reduce__(self):
+        return (GasState, (self._version, dict(self._partial_pressures)))
+
+    @property
+    def version(self):
+        return self._version
 
-    def __init__(self):
-        self._masses = []         # List of masses
-        self._masses_map = {}     # Dict of mass index to species name
-        self._species = {}        # Dict of species name to species
-        # https://en.wikipedia.org/wiki/Ionization_energies_of_the_elements_(data_page)
-        self.insert(1, GasSpecies("H", 13.59844))
-        self.insert(4, GasSpecies("He", 24.58738))
-        self.insert(14, GasSpecies("N", 14.53414))
-        self.insert(16, GasSpecies("O", 13.61806))
-        self.insert(19, GasSpecies("F", 17.42282))
-        self.insert(40, GasSpecies("A", 15.75962))
-
-        self.insert(2, GasSpecies("H2", 15.425927)) # https://webbook.nist.gov/cgi/cbook.cgi?ID=C1333740&Mask=20
-        self.insert(4, GasSpecies("D2", 15.46658))  # https://webbook.nist.gov/cgi/cbook.cgi?ID=C7782390&Mask=20
-        self.insert(18, GasSpecies("H2O", 12.6223)) # https://webbook.nist.gov/cgi/cbook.cgi?ID=C7732185&Mask=20
-        self.insert(28, GasSpecies("N2", 15.581))   # https://webbook.nist.gov/cgi/cbook.cgi?ID=C7727379&Mask=20
-        self.insert(28, GasSpecies("CO", 14.0142))  # https://webbook.nist.gov/cgi/cbook.cgi?ID=C630080&Mask=20
-        self.insert(32, GasSpecies("O2", 12.0697))  # https://webbook.nist.gov/cgi/cbook.cgi?ID=C7782447&Mask=20
-        self.insert(38, GasSpecies("F2", 15.697))   # https://webbook.nist.gov/cgi/inchi?ID=C7782414&Mask=20
-        self.insert(44, GasSpecies("CO2", 13.778))  # https://webbook.nist.gov/cgi/cbook.cgi?ID=C124389&Mask=20
+    @property
+    def partial_pressures(self):
+        return self._partial_pressures
+
+    @property
+    def total_pressure(self):
+        return self._total_pressure
+
+    def partial_pressure(self, name):
+        return self._partial_pressures.get(name, 0)
+
+
+LIBRARY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "gasses.json")
+MIN_ABUNDANCE = 1E-4  # Peaks weaker than this, relative to a species' base peak, are dropped
+
+# Peaks as parallel arrays sorted by mass: (peak mass, species index, intensity, ionisation energy).
+# Row i is the only non-zero of row i of the sparse peak x species cracking matrix.
+Peaks = collections.namedtuple("Peaks", "masses species intensities ionisation_energies")
+Library = collections.namedtuple("Library", "species peaks")
+# The peaks of the species present in a snapshot, as a subset of Peaks in mass order.
+ActivePeaks = collections.namedtuple("ActivePeaks",
+                                     "state peaks names positions masses species ionisation_energies weights")
+
+
+def isotopologues(fragment, isotopes):
+    """
+    Returns {m/z: fraction} for a fragment formula such as "CO2" or "Ar++".
+    """
+    charge = fragment.count("+") or 1
+    distribution = {0: 1.0}
+    for element, count in re.findall(r"([A-Z][a-z]?)(\d*)", fragment.rstrip("+")):
+        for atom in range(int(count or 1)):
+            combined = {}
+            for mass, fraction in distribution.items():
+                for isotope_mass, abundance in isotopes[element]:
+                    combined[mass + isotope_mass] = combined.get(mass + isotope_mass, 0) + fraction * abundance
+            distribution = {mass: fraction for mass, fraction in combined.items() if fraction >= MIN_ABUNDANCE / 100}
+    return {mass / charge: fraction for mass, fraction in distribution.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def load_library(path=LIBRARY):
+    """
+    Reads and compiles a gas library file. Compiled once per file and shared by every Gasses that uses it.
+    """
+    with open(path) as library_file:
+        description = json.load(library_file)
+    isotopes = description["isotopes"]
+    species = []
+    masses, species_indices, intensities, ionisation_energies = [], [], [], []
+    for index, entry in enumerate(description["species"]):
+        lines = {}
+        for fragment, intensity in entry["fragments"].items():
+            for mass, fraction in isotopologues(fragment, isotopes).items():
+                lines[mass] = lines.get(mass, 0) + intensity * fraction
+        base_mass = max(lines, key=lines.get)
+        base_intensity = lines[base_mass]
+        gas_species = GasSpecies(entry["name"], entry["ionisation_energy"])
+        gas_species.mass = base_mass
+        species.append(gas_species)
+        for mass in sorted(lines):
+            if lines[mass] / base_intensity >= MIN_ABUNDANCE:
+                masses.append(mass)
+                species_indices.append(index)
+                intensities.append(lines[mass] / base_intensity)
+                ionisation_energies.append(gas_species.ionisation_energy)
+    masses = np.asarray(masses, dtype=float)
+    order = np.argsort(masses, kind="stable")
+    peaks = Peaks(masses[order], np.asarray(species_indices, dtype=np.intp)[order],
+                  np.asarray(intensities)[order], np.asarray(ionisation_energies)[order])
+    LOG.info("Loaded %d species, %d peaks from %s", len(species), len(masses), path)
+    return Library(tuple(species), peaks)
+
+
+class Gasses:
+    """
+    The gas library. Peaks are held as parallel NumPy arrays sorted by peak mass, so that
+    the peaks near a mass are found with searchsorted and summed without a Python loop.
+    The library file is read on first use.
+    """
+    ENERGY_STEP = 0.1  # Electron energy grid of the ionisation efficiency tables, in eV
+
+    def __init__(self, library=LIBRARY):
+        self._library = library
+        self._species = None      # Dict of species name to species
+        self._species_names = []  # Species name by species index
+        self._species_index = {}  # Dict of species name to species index
+        # Replaced as a whole on insert, so a reader never sees arrays of different lengths.
+        self._peaks = None
+        self._peak_positions = (None, None)  # (peaks, positions of each species' peaks)
+        self._active = None  # ActivePeaks of the last snapshot used
+        self._species_version = 0  # Incremented whenever species are added or replaced
+        self._energy_range = (6.0, 100.0)
+        self._mass_range = (1.0, 200.0)
+        self._surface = None
+        self._peak_shape = peakshape.PeakShape()
+        self._kernels = (None, None, None)  # (peaks, peak shape, kernels)
+        self._efficiency_table = (None, None, None)  # (species version, energy range, species x energy table)
+        self._state = GasState(0, {})
+        self._write_lock = threading.Lock()  # Serialises writers only
+
+    def _loaded(self):
+        """ Returns the peaks, loading the library if this is the first use. """
+        if self._peaks is None:
+            with self._write_lock:
+                if self._peaks is None:
+                    library = load_library(self._library)
+                    self._species_names = [gas_species.name for gas_species in library.species]
+                    self._species_index = {name: index for index, name in enumerate(self._species_names)}
+                    # The compiled library is shared, but each Gasses may change its own species.
+                    self._species = {gas_species.name: copy.copy(gas_species) for gas_species in library.species}
+                    self._peaks = library.peaks
+        return self._peaks
 
     def insert(self, mass, gas_species):
-        index = np.searchsorted(self._masses, mass, side='right')
-        self._masses.insert(index, mass)
-        if index in self._masses_map:
-            for key in range(len(self._masses_map), index, -1):
-                self._masses_map[key] = self._masses_map[key-1]
-        self._masses_map[index] = gas_species.name
-        gas_species.mass = mass
-        self._species[gas_species.name] = gas_species
+        self.insert_many([(mass, gas_species)])
+
+    def insert_many(self, peaks):
+        """
+        Adds single peak (mass, species) entries in one sorted merge. Peaks of equal mass keep their insertion order.
+        """
+        self._loaded()
+        with self._write_lock:
+            masses = []
+            species_indices = []
+            ionisation_energies = []
+            for mass, gas_species in peaks:
+                if gas_species.name not in self._species_index:
+                    self._species_index[gas_species.name] = len(self._species_names)
+                    self._species_names.append(gas_species.name)
+                gas_species.mass = mass
+                self._species[gas_species.name] = gas_species
+                masses.append(mass)
+                species_indices.append(self._species_index[gas_species.name])
+                ionisation_energies.append(gas_species.ionisation_energy)
+            if not masses:
+                return
+            self._species_version += 1
+            peak_masses = np.concatenate((self._peaks.masses, np.asarray(masses, dtype=float)))
+            order = np.argsort(peak_masses, kind="stable")
+            self._peaks = Peaks(peak_masses[order],
+                                np.concatenate((self._peaks.species, species_indices)).astype(np.intp)[order],
+                                np.concatenate((self._peaks.intensities, np.ones(len(masses))))[order],
+                                np.concatenate((self._peaks.ionisation_energies, ionisation_energies))[order])
 
     @property
     def species(self):
+        self._loaded()
         return self._species
 
     @property
     def masses_map(self):
-        return self._masses_map
+        """ Dict of peak index to species name, for debugging. """
+        return {index: self._species_names[species] for index, species in enumerate(self._loaded().species)}
 
     def gas(self, name):
         if name not in self.species:
             return None
         return self._species[name]
 
-    def signal(self, mass, electron_energy):
-        total_signal = 0
-        width = 0.75
-        index_left = np.searchsorted(self._masses, mass-width, side='left')
-        index_right = np.searchsorted(self._masses, mass+width, side='right')
-        # [1, 2, 4, 4, 14, 16, 18, 18, 19, 28, 28, 32, 38, 44]
-        if index_right >= len(self._masses_map):
-            index_right = len(self._masses_map)-1
-            
-        index = index_left
-        while index <= index_right:
-            species_name = self._masses_map[index]
-            species = self._species[species_name]
-            if abs(species.mass-mass) < width and species.partial_pressure != 0:
-                signal_value = species.signal(mass, electron_energy)
-                LOG.debug("Species " + species.name + " species mass " + str(species.mass) + " mass " + str(mass) + " electron energy " + str(electron_energy) + " signal " + str(signal_value))
-                total_signal += signal_value
-            index += 1
-        return total_signal
+    @property
+    def state(self):
+        """ The current snapshot. Take it once and use it for a whole row or cycle. """
+        return self._state
+
+    def set_partial_pressure(self, name, partial_pressure):
+        """
+        Publishes a new snapshot with the partial pressure of one species changed.
+        """
+        with self._write_lock:
+            partial_pressures = dict(self._state.partial_pressures)
+            if partial_pressure == 0:
+                partial_pressures.pop(name, None)
+            else:
+                partial_pressures[name] = partial_pressure
+            self._state = GasState(self._state.version + 1, partial_pressures)
+        return self._state
+
+    def replace_state(self, state):
+        """ Publishes a snapshot taken from another Gasses, e.g. in the acquisition process. """
+        with self._write_lock:
+            self._state = state
+
+    def _species_peaks(self, peaks):
+        """
+        Positions of each species' peaks in the peak arrays, by species index. Rebuilt when the peaks change.
+        """
+        cached_peaks, species_peaks = self._peak_positions
+        if cached_peaks is not peaks:
+            order = np.argsort(peaks.species, kind="stable")
+            counts = np.bincount(peaks.species, minlength=len(self._species_names))
+            species_peaks = np.split(order, np.cumsum(counts)[:-1])
+            self._peak_positions = (peaks, species_peaks)
+        return species_peaks
+
+    def active(self, state=None, peaks=None):
+        """
+        The peaks of the species present in the snapshot, with their heights at full ionisation efficiency
+        (the rows of the cracking matrix times the partial pressure vector). Updated from the last result
+        by adding or removing only the species whose partial pressure has crossed zero.
+        """
+        if state is None:
+            state = self._state
+        if peaks is None:
+            peaks = self._loaded()
+        previous = self._active
+        if previous is not None and previous.state is state and previous.peaks is peaks:
+            return previous
+        species_peaks = self._species_peaks(peaks)
+        names = frozenset(name for name in state.partial_pressures if name in self._species_index)
+        if previous is not None and previous.peaks is peaks:
+            positions = previous.positions
+            removed = previous.names - names
+            if removed:
+                positions = positions[~np.isin(positions, np.concatenate(
+                    [species_peaks[self._species_index[name]] for name in removed]))]
+            added = names - previous.names
+        else:
+            positions = np.empty(0, dtype=np.intp)
+            added = names
+        if added:
+            new = np.sort(np.concatenate([species_peaks[self._species_index[name]] for name in added]))
+            positions = np.insert(positions, np.searchsorted(positions, new), new)
+        species = peaks.species[positions]
+        pressures = np.array([state.partial_pressure(self._species_names[index]) for index in species])
+        weights = peaks.intensities[positions] * pressures if len(positions) else np.empty(0)
+        active = ActivePeaks(state, peaks, names, positions, peaks.masses[positions], species,
+                             peaks.ionisation_energies[positions], weights)
+        self._active = active
+        return active
+
+    def active_species(self, state=None):
+        """ Names of the species present in the snapshot, for diagnostics. """
+        return self.active(state).names
+
+    @property
+    def species_version(self):
+        """ Changes whenever species are added or replaced, so results derived from the library can be cached. """
+        return self._species_version
+
+    @property
+    def energy_range(self):
+        """ (minimum, maximum) electron energy covered by the ionisation efficiency tables. """
+        return self._energy_range
+
+    @energy_range.setter
+    def energy_range(self, energy_range):
+        minimum, maximum = energy_range
+        self._energy_range = (float(minimum), float(maximum))
+
+    @property
+    def mass_range(self):
+        """ (minimum, maximum) mass covered by signal surfaces. """
+        return self._mass_range
+
+    @mass_range.setter
+    def mass_range(self, mass_range):
+        minimum, maximum = mass_range
+        self._mass_range = (float(minimum), float(maximum))
+
+    @property
+    def peak_shape(self):
+        return self._peak_shape
+
+    @peak_shape.setter
+    def peak_shape(self, peak_shape):
+        self._peak_shape = peak_shape
+
+    def kernels(self, peaks=None):
+        """
+        The peak shape's kernel parameters for every peak, rebuilt when the peaks or shape change.
+        """
+        if peaks is None:
+            peaks = self._loaded()
+        cached_peaks, cached_shape, kernels = self._kernels
+        peak_shape = self._peak_shape
+        if cached_peaks is not peaks or cached_shape != peak_shape:
+            kernels = peak_shape.kernels(peaks.masses)
+            self._kernels = (peaks, peak_shape, kernels)
+        return peak_shape, kernels
+
+    def surface(self, state=None):
+        """
+        The SignalSurface of the given snapshot, replaced when the snapshot, species or ranges change.
+        """
+        if state is None:
+            state = self._state
+        surface = self._surface
+        if surface is None or not surface.matches(state, self._species_version, self._mass_range, self._energy_range,
+                                                  self._peak_shape):
+            surface = SignalSurface(self, state)
+            self._surface = surface
+        return surface
+
+    def efficiency_table(self):
+        """
+        Ionisation efficiency of each species (rows) at each grid electron energy (columns),
+        rebuilt on first use after a species or the energy range changes.
+        """
+        self._loaded()
+        species_version, energy_range, table = self._efficiency_table
+        if species_version != self._species_version or energy_range != self._energy_range:
+            species_version, energy_range = self._species_version, self._energy_range
+            minimum, maximum = energy_range
+            energies = minimum + self.ENERGY_STEP * np.arange(int(np.ceil((maximum - minimum) / self.ENERGY_STEP)) + 1)
+            ionisation_energies = np.array([self._species[name].ionisation_energy for name in self._species_names])
+            table = ionisation_efficiency(energies[np.newaxis, :], ionisation_energies[:, np.newaxis])
+            self._efficiency_table = (species_version, energy_range, table)
+            LOG.info("Built ionisation efficiency table of %d species by %d energies", table.shape[0], table.shape[1])
+        return energy_range[0], table
+
+    def efficiencies(self, electron_energy, species, ionisation_energies):
+        """
+        Ionisation efficiency of the given species indices at the electron energy, interpolated from the table.
+        Energies outside the table are calculated from the ionisation energies instead.
+        electron_energy may be an array, which broadcasts against the species.
+        """
+        minimum, table = self.efficiency_table()
+        if np.ndim(electron_energy) != 0:
+            position = (np.asarray(electron_energy, dtype=float) - minimum) / self.ENERGY_STEP
+            index = np.clip(position, 0, table.shape[1] - 2).astype(np.intp)
+            fraction = position - index
+            efficiencies = table[species, index] * (1 - fraction) + table[species, index + 1] * fraction
+            inside = (position >= 0) & (position <= table.shape[1] - 1)
+            if not inside.all():
+                efficiencies = np.where(inside, efficiencies, ionisation_efficiency(electron_energy, ionisation_energies))
+            return efficiencies
+        position = (electron_energy - minimum) / self.ENERGY_STEP
+        if position < 0 or position > table.shape[1] - 1:
+            return ionisation_efficiency(electron_energy, ionisation_energies)
+        index = min(int(position), table.shape[1] - 2)
+        fraction = position - index
+        return table[species, index] * (1 - fraction) + table[species, index + 1] * fraction
+
+    def spectrum(self, electron_energy, state=None):
+        """
+        Returns (masses, heights) of the line spectrum, summing the peaks of all species at each mass.
+        """
+        if state is None:
+            state = self._state
+        active = self.active(state)
+        heights = active.weights * self.efficiencies(electron_energy, active.species, active.ionisation_energies)
+        masses, starts = np.unique(active.masses, return_index=True)
+        if len(masses) == 0:
+            return masses, heights
+        return masses, np.add.reduceat(heights, starts)
+
+    def signal(self, mass, electron_energy, state=None):
+        if state is None:
+            state = self._state
+        peaks = self._loaded()
+        peak_shape, kernels = self.kernels(peaks)
+        active = self.active(state, peaks)
+        # Only present peaks whose truncated kernel reaches the mass contribute.
+        index_left = np.searchsorted(active.masses, mass - kernels.max_above, side='right')
+        index_right = np.searchsorted(active.masses, mass + kernels.max_below, side='left')
+        if index_left == index_right:
+            return 0
+        window = slice(index_left, index_right)
+        positions = active.positions[window]
+        efficiencies = self.efficiencies(electron_energy, active.species[window], active.ionisation_energies[window])
+        profiles = peak_shape.profile(mass - active.masses[window], kernels.sigmas[positions],
+                                      kernels.below[positions], kernels.above[positions])
+        signals = active.weights[window] * efficiencies * profiles
+        if LOG.isEnabledFor(logging.DEBUG):
+            for species, signal_value in zip(active.species[window], signals):
+                LOG.debug("Species %s mass %s electron energy %s signal %s", self._species_names[species], mass,
+                          electron_energy, signal_value)
+        return float(signals.sum())
+
+    def energy_signals(self, mass, electron_energies, state=None):
+        """
+        Signal at one mass for each of an array of electron energies, as for an electron energy scan.
+        The peak profiles are evaluated once; only the efficiencies depend on the energy.
+        """
+        if state is None:
+            state = self._state
+        electron_energies = np.asarray(electron_energies, dtype=float)
+        peaks = self._loaded()
+        peak_shape, kernels = self.kernels(peaks)
+        active = self.active(state, peaks)
+        index_left = np.searchsorted(active.masses, mass - kernels.max_above, side='right')
+        index_right = np.searchsorted(active.masses, mass + kernels.max_below, side='left')
+        if index_left == index_right:
+            return np.zeros(electron_energies.shape)
+        window = slice(index_left, index_right)
+        positions = active.positions[window]
+        profiles = peak_shape.profile(mass - active.masses[window], kernels.sigmas[positions],
+                                      kernels.below[positions], kernels.above[positions])
+        efficiencies = self.efficiencies(electron_energies[..., np.newaxis], active.species[window],
+                                         active.ionisation_energies[window])
+        return efficiencies @ (active.weights[window] * profiles)
 
     @property
     def masses(self):
-        return self._masses
+        return self._loaded().masses
+
+
+class SignalSurface:
+    """
+    Signal of one gas snapshot over a mass x electron energy grid, sampled by bilinear interpolation.
+    The grid is built lazily in chunks of mass; chunks are kept up to max_bytes, least recently used first out,
+    which by default holds every chunk of the mass range.
+    The energy axis is that of the ionisation efficiency table.
+    """
+    MASS_STEP = 0.01
+    CHUNK_POINTS = 100  # Mass steps per chunk
+    MAX_BYTES = 256 * 2**20
+
+    def __init__(self, gasses, state, max_bytes=MAX_BYTES):
+        self._gasses = gasses
+        self._state = state
+        self._species_version = gasses.species_version
+        self._mass_range = gasses.mass_range
+        self._energy_range = gasses.energy_range
+        self._peak_shape, self._kernels = gasses.kernels()
+        self._peaks = gasses._loaded()
+        self._minimum_energy, self._table = gasses.efficiency_table()
+        minimum, maximum = self._mass_range
+        self._mass_points = int(np.ceil((maximum - minimum) / self.MASS_STEP)) + 1
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._builds = 0
+        self._chunks = collections.OrderedDict()
+
+    def matches(self, state, species_version, mass_range, energy_range, peak_shape):
+        return (state is self._state and species_version == self._species_version and
+                mass_range == self._mass_range and energy_range == self._energy_range and
+                peak_shape == self._peak_shape)
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def chunks(self):
+        """ Number of chunks currently built. """
+        return len(self._chunks)
+
+    @property
+    def nbytes(self):
+        """ Memory held by the chunks currently built. """
+        return self._bytes
+
+    @property
+    def builds(self):
+        """ Number of chunks built, including rebuilds after eviction, for diagnostics. """
+        return self._builds
+
+    def _chunk(self, index):
+        """
+        Signal at CHUNK_POINTS + 1 masses (so the last interval of the chunk can be interpolated)
+        by every table energy. None if no peak with a partial pressure reaches the chunk.
+        """
+        if index in self._chunks:
+            self._chunks.move_to_end(index)
+            return self._chunks[index]
+        active = self._gasses.active(self._state, self._peaks)
+        masses = self._mass_range[0] + self.MASS_STEP * (index * self.CHUNK_POINTS + np.arange(self.CHUNK_POINTS + 1))
+        kernels = self._kernels
+        window = slice(np.searchsorted(active.masses, masses[0] - kernels.max_above, side='right'),
+                       np.searchsorted(active.masses, masses[-1] + kernels.max_below, side='left'))
+        chunk = None
+        if window.start < window.stop:
+            positions = active.positions[window]
+            offsets = masses[:, np.newaxis] - active.masses[window][np.newaxis, :]
+            profiles = self._peak_shape.profile(offsets, kernels.sigmas[positions],
+                                                kernels.below[positions], kernels.above[positions])
+            chunk = (profiles * active.weights[window]) @ self._table[active.species[window]]
+            self._bytes += chunk.nbytes
+        self._builds += 1
+        self._chunks[index] = chunk
+        while self._bytes > self._max_bytes and len(self._chunks) > 1:
+            _, evicted = self._chunks.popitem(last=False)
+            if evicted is not None:
+                self._bytes -= evicted.nbytes
+        return chunk
+
+    def sample(self, masses, electron_energies):
+        """
+        Returns the signal at each (mass, electron energy) pair; the arguments broadcast against each other.
+        Points outside the surface are calculated directly.
+        """
+        masses, electron_energies = np.broadcast_arrays(np.asarray(masses, dtype=float),
+                                                        np.asarray(electron_energies, dtype=float))
+        shape = masses.shape
+        masses, electron_energies = np.atleast_1d(masses, electron_energies)
+        mass_positions = (masses - self._mass_range[0]) / self.MASS_STEP
+        energy_positions = (electron_energies - self._minimum_energy) / self._gasses.ENERGY_STEP
+        inside = ((mass_positions >= 0) & (mass_positions <= self._mass_points - 1) &
+                  (energy_positions >= 0) & (energy_positions <= self._table.shape[1] - 1))
+        mass_indices = np.minimum(mass_positions.astype(np.intp), self._mass_points - 2)
+        energy_indices = np.minimum(energy_positions.astype(np.intp), self._table.shape[1] - 2)
+        mass_fractions = mass_positions - mass_indices
+        energy_fractions = energy_positions - energy_indices
+        chunk_indices = mass_indices // self.CHUNK_POINTS
+        signals = np.zeros(masses.shape)
+        for index in np.unique(chunk_indices[inside]):
+            chunk = self._chunk(int(index))
+            if chunk is None:
+                continue
+            selected = inside & (chunk_indices == index)
+            rows = mass_indices[selected] - index * self.CHUNK_POINTS
+            columns = energy_indices[selected]
+            mass_fraction = mass_fractions[selected]
+            energy_fraction = energy_fractions[selected]
+            signals[selected] = ((chunk[rows, columns] * (1 - energy_fraction) +
+                                  chunk[rows, columns + 1] * energy_fraction) * (1 - mass_fraction) +
+                                 (chunk[rows + 1, columns] * (1 - energy_fraction) +
+                                  chunk[rows + 1, columns + 1] * energy_fraction) * mass_fraction)
+        for position in zip(*np.nonzero(~inside)):
+            signals[position] = self._gasses.signal(masses[position], electron_energies[position], self._state)
+        return signals.reshape(shape)[()]
 
 
 if __name__ == "__main__":
@@ -136,32 +599,25 @@ if __name__ == "__main__":
         print(name, species.mass, species.ionisation_energy, species.ionisation_efficiency(70))
     pprint.pprint(gasses.masses)
 
-    H2 = gasses.gas("H2")
-    H2.partial_pressure = 1E-5  # NB, Pascal units
-
-    He = gasses.gas("He")
-    He.partial_pressure = 1E-5  # NB, Pascal units
-
-    D2 = gasses.gas("D2")
-    D2.partial_pressure = 1E-5  # NB, Pascal units
-
-    H2O = gasses.gas("H2O")
-    H2O.partial_pressure = 2E-5  # NB, Pascal units
-    
-    CO = gasses.gas("CO")
-    CO.partial_pressure = 1E-6  # NB, Pascal units
-
-    CO2 = gasses.gas("CO2")
-    CO.partial_pressure = 2E-6  # NB, Pascal units
-
-    N2 = gasses.gas("N2")
-    N2.partial_pressure = 8E-5  # NB, Pascal units
-
-    O2 = gasses.gas("O2")
-    O2.partial_pressure = 2E-5  # NB, Pascal units
+    # NB, Pascal units
+    gasses.set_partial_pressure("H2", 1E-5)
+    gasses.set_partial_pressure("He", 1E-5)
+    gasses.set_partial_pressure("D2", 1E-5)
+    gasses.set_partial_pressure("H2O", 2E-5)
+    gasses.set_partial_pressure("CO", 1E-6)
+    gasses.set_partial_pressure("CO2", 2E-6)
+    gasses.set_partial_pressure("N2", 8E-5)
+    gasses.set_partial_pressure("O2", 2E-5)
+    state = gasses.state
 
     for mass in np.arange(17.25, 18.76, 0.01):
-        print("mass " + str(mass) + " signal " + str(gasses.signal(mass, 70)))
+        print("mass " + str(mass) + " signal " + str(gasses.signal(mass, 70, state)))
 
-    for ee in range(15, 40):
-        print("energy " + str(ee) + " D2 signal " + str(D2.signal(D2.mass, ee)) + " He signal " + str(He.signal(He.mass, ee)))
+    D2 = gasses.gas("D2")
+    He = gasses.gas("He")
+    # D2 and He share mass 4, so show the height of each species' peak as well as their sum.
+    electron_energies = np.arange(15, 40)
+    signals = gasses.energy_signals(He.mass, electron_energies, state)
+    for ee, signal in zip(electron_energies, signals):
+        print("energy " + str(ee) + " D2 peak " + str(state.partial_pressure("D2") * D2.ionisation_efficiency(ee)) +
+              " He peak " + str(state.partial_pressure("He") * He.ionisation_efficiency(ee)) + " signal " + str(signal))
@@ -0,0 +1,164 @@
+##################################################
+#
+# Memory-mapped scan history for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Keeps every completed scan cycle in a directory of memory-mapped files, one per
+column, so history survives the instance for post-mortem analysis and a day long
+soak run uses a fixed amount of disk and page cache rather than RAM.
+
+Columns and the rolling index of cycles are rings of fixed capacity. A cycle is
+never split across the end of a column, so reading one back is a view of the
+files. The header counts what has been written; it is updated after the data,
+so a reader in another process never sees a cycle before it is complete.
+"""
+import os
+
+import numpy as np
+
+COLUMNS = (("point", "f8"), ("value", "f8"), ("trip", "i4"), ("time", "f8"), ("cycle", "i8"), ("gas_version", "i8"))
+INDEX = np.dtype([("cycle", "i8"), ("first", "i8"), ("count", "i8"), ("start", "f8"), ("end", "f8")])
+# Header words
+CAPACITY, INDEX_CAPACITY, POINTS, CYCLES = range(4)
+
+
+class HistoryStore:
+    """
+    Rolling store of scan cycles in directory. Reopening a directory with the same capacities
+    carries on from the cycles already in it; otherwise it is started afresh.
+    """
+
+    def __init__(self, directory, capacity=1 << 20, index_capacity=1 << 14):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        header_path = os.path.join(directory, "header.i8")
+        mode = "w+"
+        if os.path.exists(header_path) and os.path.getsize(header_path) == 4 * 8:
+            header = np.memmap(header_path, dtype="i8", mode="r+")
+            if header[CAPACITY] == capacity and header[INDEX_CAPACITY] == index_capacity:
+                mode = "r+"
+            del header
+        self._header = np.memmap(header_path, dtype="i8", mode=mode, shape=(4,))
+        self._columns = {name: np.memmap(os.path.join(directory, name + "." + dtype), dtype=dtype, mode=mode,
+                                         shape=(capacity,))
+                         for name, dtype in COLUMNS}
+        self._index = np.memmap(os.path.join(directory, "index.bin"), dtype=INDEX, mode=mode,
+                                shape=(index_capacity,))
+        if mode == "w+":
+            self._header[:] = (capacity, index_capacity, 0, 0)
+            self._header.flush()
+        self._capacity = capacity
+        self._index_capacity = index_capacity
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def capacity(self):
+        """ Points held before the oldest cycles are overwritten. """
+        return self._capacity
+
+    def sequences(self):
+        """
+        Returns the range of sequence numbers of the cycles held, oldest first.
+        """
+        cycles = int(self._header[CYCLES])
+        written = int(self._header[POINTS])
+        first = max(0, cycles - self._index_capacity)
+        # Cycles whose points have since been overwritten are gone too.
+        while first < cycles and self._index[first % self._index_capacity]["first"] < written - self._capacity:
+            first += 1
+        return range(first, cycles)
+
+    def __len__(self):
+        return len(self.sequences())
+
+    def append(self, cycle, start, end, points, values, trips, times, gas_versions):
+        """
+        Appends one cycle of equal length columns and returns its sequence number.
+        A cycle longer than the store keeps only its last points.
+        """
+        count = min(len(points), self._capacity)
+        first = int(self._header[POINTS])
+        if first % self._capacity + count > self._capacity:
+            # Start at the beginning rather than split the cycle.
+            first += self._capacity - first % self._capacity
+        offset = first % self._capacity
+        for name, column in (("point", points), ("value", values), ("trip", trips), ("time", times),
+                             ("gas_version", gas_versions)):
+            self._columns[name][offset:offset + count] = column[len(column) - count:]
+        self._columns["cycle"][offset:offset + count] = cycle
+        sequence = int(self._header[CYCLES])
+        self._index[sequence % self._index_capacity] = (cycle, first, count, start, end)
+        self._header[POINTS] = first + count
+        self._header[CYCLES] = sequence + 1
+        return sequence
+
+    def entry(self, sequence):
+        """
+        Returns the index entry of a cycle, None if it is no longer held.
+        """
+        if sequence < 0:
+            sequence += int(self._header[CYCLES])
+        if sequence not in self.sequences():
+            return None
+        return self._index[sequence % self._index_capacity]
+
+    def read(self, sequence):
+        """
+        Returns {column: read-only view} of a cycle, negative sequences counting back from the latest,
+        or None if it is no longer held. The views are only valid until the store wraps over them.
+        """
+        entry = self.entry(sequence)
+        if entry is None:
+            return None
+        offset = int(entry["first"]) % self._capacity
+        count = int(entry["count"])
+        cycle = {}
+        for name, column in self._columns.items():
+            view = column[offset:offset + count].view(np.ndarray)
+            view.flags.writeable = False
+            cycle[name] = view
+        return cycle
+
+    def find(self, start, end):
+        """
+        Returns the sequence numbers of the cycles that overlap the time range start to end, in seconds since the epoch.
+        """
+        sequences = self.sequences()
+        if not sequences:
+            return range(0)
+        positions = np.arange(sequences.start, sequences.stop) % self._index_capacity
+        entries = self._index[positions]
+        # Cycles are appended in time order.
+        first = int(np.searchsorted(entries["end"], start, side="left"))
+        last = int(np.searchsorted(entries["start"], end, side="right"))
+        return range(sequences.start + first, sequences.start + max(first, last))
+
+    def flush(self):
+        for column in self._columns.values():
+            column.flush()
+        self._index.flush()
+        self._header.flush()
+
+    def close(self):
+        self.flush()
+        self._columns = {}
+        self._index = None
+        self._header = None
@@ -0,0 +1,201 @@
+##################################################
+#
+# Shared-memory live spectrum for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Publishes the latest scan cycle and the status flags of an instance in a named
+shared-memory segment, so dashboards on the same host can read them without a
+connection to the instance.
+
+    spectrum = LiveSpectrum.open("hidenrga1")
+    while True:
+        version = spectrum.begin()
+        peak = spectrum.values.max()
+        if not spectrum.changed(version):
+            break
+
+The instance is the only writer. A version counter in the header is odd while
+it writes and is incremented again when it has finished, as in a seqlock, so a
+reader uses the arrays in place and retries if the version has moved on.
+snapshot() does that and returns a copy.
+"""
+from collections import namedtuple
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+import threading
+import time
+
+import numpy as np
+
+# Header words
+VERSION, CAPACITY, COUNT, SEQUENCE, CYCLE, EMOK, FILOK, PTRIP, TIME, TOTAL_PRESSURE = range(10)
+_HEADER = 10 * 8
+
+Snapshot = namedtuple("Snapshot", ["version", "sequence", "cycle", "time", "emok", "filok", "ptrip",
+                                   "total_pressure", "points", "values", "trips"])
+# Segments created by this process, which the resource tracker must go on tracking when they are also opened here.
+_created = set()
+
+
+class LiveSpectrum:
+    """
+    The segment called name. create() makes it for the instance to write; open() maps it to read.
+    Time is in seconds since the epoch and total pressure in Pascal; the points and values
+    are those of the latest cycle, the values in range units.
+    """
+
+    def __init__(self, memory, owner):
+        self._memory = memory
+        self._owner = owner
+        self._lock = threading.Lock()
+        self._words = np.ndarray((_HEADER // 8,), np.int64, memory.buf)
+        self._reals = np.ndarray((_HEADER // 8,), np.float64, memory.buf)
+        capacity = int(self._words[CAPACITY])
+        self._points = np.ndarray((capacity,), np.float64, memory.buf, offset=_HEADER)
+        self._values = np.ndarray((capacity,), np.float64, memory.buf, offset=_HEADER + 8 * capacity)
+        self._trips = np.ndarray((capacity,), np.int32, memory.buf, offset=_HEADER + 16 * capacity)
+
+    @classmethod
+    def create(cls, name, capacity=1 << 16):
+        """
+        Creates the segment name for up to capacity points, replacing one left behind by an instance that
+        did not close it.
+        """
+        size = _HEADER + 20 * capacity
+        try:
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created.add(memory.name)
+        words = np.ndarray((_HEADER // 8,), np.int64, memory.buf)
+        words[:] = 0
+        words[CAPACITY] = capacity
+        del words
+        return cls(memory, True)
+
+    @classmethod
+    def open(cls, name):
+        """
+        Maps the segment name for reading. Raises FileNotFoundError if no instance publishes it.
+        """
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 every mapping is tracked, and the tracker would remove the segment
+            # when this process exits.
+            memory = shared_memory.SharedMemory(name=name)
+            if memory.name not in _created:
+                resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, False)
+
+    @property
+    def name(self):
+        return self._memory.name
+
+    @property
+    def capacity(self):
+        return len(self._points)
+
+    def _begin_write(self):
+        self._words[VERSION] += 1
+
+    def _end_write(self):
+        self._words[VERSION] += 1
+
+    def publish(self, sequence, cycle, points, values, trips, end):
+        """
+        Makes points, values and trips the latest cycle. A cycle longer than the segment keeps only its last points.
+        """
+        count = min(len(points), self.capacity)
+        with self._lock:
+            self._begin_write()
+            self._points[:count] = points[len(points) - count:]
+            self._values[:count] = values[len(values) - count:]
+            self._trips[:count] = trips[len(trips) - count:]
+            self._words[COUNT] = count
+            self._words[SEQUENCE] = sequence
+            self._words[CYCLE] = cycle
+            self._reals[TIME] = end
+            self._end_write()
+
+    def status(self, emok, filok, ptrip, total_pressure):
+        with self._lock:
+            self._begin_write()
+            self._words[EMOK] = emok
+            self._words[FILOK] = filok
+            self._words[PTRIP] = ptrip
+            self._reals[TOTAL_PRESSURE] = total_pressure
+            self._end_write()
+
+    def begin(self):
+        """
+        Waits for the writer to finish, if it is writing, and returns the version to pass to changed().
+        """
+        while True:
+            version = int(self._words[VERSION])
+            if version % 2 == 0:
+                return version
+            time.sleep(0)
+
+    def changed(self, version):
+        """ True if the segment was written since begin() returned version, so what was read must be discarded. """
+        return int(self._words[VERSION]) != version
+
+    @property
+    def points(self):
+        """ View of the points of the latest cycle, in place in the segment. """
+        return self._points[:int(self._words[COUNT])]
+
+    @property
+    def values(self):
+        return self._values[:int(self._words[COUNT])]
+
+    @property
+    def trips(self):
+        """ Trip code of each point, non-zero for the NaN value that ends a tripped cycle. """
+        return self._trips[:int(self._words[COUNT])]
+
+    def snapshot(self):
+        """
+        Returns a consistent copy of the segment as a Snapshot.
+        """
+        while True:
+            version = self.begin()
+            count = int(self._words[COUNT])
+            words = self._words.copy()
+            reals = self._reals.copy()
+            points = self._points[:count].copy()
+            values = self._values[:count].copy()
+            trips = self._trips[:count].copy()
+            if not self.changed(version):
+                return Snapshot(version, int(words[SEQUENCE]), int(words[CYCLE]), float(reals[TIME]),
+                                bool(words[EMOK]), bool(words[FILOK]), bool(words[PTRIP]),
+                                float(reals[TOTAL_PRESSURE]), points, values, trips)
+
+    def close(self):
+        """
+        Unmaps the segment; the instance that created it also removes it.
+        """
+        del self._words, self._reals, self._points, self._values, self._trips
+        self._memory.close()
+        if self._owner:
+            _created.discard(self._memory.name)
+            self._memory.unlink()
@@ -0,0 +1,123 @@
+##################################################
+#
+# Queued logging for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Routes the simulator's logging through a queue. Callers only enqueue records; a
+QueueListener thread formats them and writes them out, so a scan never waits on a
+file write and many instances on one host do not contend on synchronous I/O.
+
+Set up from the environment by configure(), which the device calls:
+  HIDENRGA_LOG_FILE    File this instance logs to, e.g. /var/log/hidenPyIoc/hidenrga1.log.
+                       Other processes of the instance log beside it, e.g. hidenrga1.acquisition.log.
+  HIDENRGA_LOG_LEVELS  Per subsystem levels, e.g. "gasses=DEBUG,device=WARNING".
+                       A subsystem is one of SUBSYSTEMS or a logger name.
+Without either, logging is left as lewis configured it.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+from lewis.core.logging import default_log_format
+
+# Logger of each subsystem.
+SUBSYSTEMS = {"device": "lewis.DeviceBase", "states": "lewis.DeviceBase.StateMachine",
+              "interface": "lewis.StreamInterface", "gasses": "hidenrga.gasses"}
+
+_listener = None
+_replaced = []  # The root logger's handlers before start()
+
+
+def parse_levels(levels):
+    """
+    Returns {logger name: level} from a "subsystem=LEVEL,..." string.
+    """
+    parsed = {}
+    for setting in levels.split(","):
+        if not setting.strip():
+            continue
+        name, level = setting.split("=")
+        name = name.strip()
+        parsed[SUBSYSTEMS.get(name, name)] = logging.getLevelName(level.strip().upper())
+    return parsed
+
+
+def start(path=None, levels=None):
+    """
+    Replaces the root logger's handlers with a QueueHandler, writing through a QueueListener
+    to path, or to the handlers it had if path is None. Only the first call in a process has any effect.
+    levels is a {logger name: level} dictionary.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    root = logging.getLogger()
+    _replaced[:] = root.handlers
+    if path is not None:
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter(default_log_format))
+        handlers = [handler]
+    else:
+        handlers = _replaced or [logging.StreamHandler()]
+    records = queue.SimpleQueue()
+    for handler in _replaced:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    for name, level in (levels or {}).items():
+        logging.getLogger(name).setLevel(level)
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop)
+    return _listener
+
+
+def stop():
+    """
+    Writes out the records still queued, stops the listener and gives the root logger its handlers back.
+    """
+    global _listener
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        if handler not in _replaced:
+            handler.close()
+    for handler in _replaced:
+        root.addHandler(handler)
+    _listener = None
+
+
+def configure(process=None):
+    """
+    Starts queued logging if the environment asks for it. process names a process of the
+    instance other than the lewis one, which logs to a file of its own beside the instance's.
+    """
+    path = os.environ.get("HIDENRGA_LOG_FILE")
+    levels = os.environ.get("HIDENRGA_LOG_LEVELS")
+    if path is None and levels is None:
+        return None
+    if path is not None and process is not None:
+        root, extension = os.path.splitext(path)
+        path = root + "." + process + extension
+    return start(path, parse_levels(levels or ""))
@@ -0,0 +1,79 @@
+##################################################
+#
+# Peak shape model for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Shape of a mass peak as set by the quadrupole "resolution" and "delta-m" tuning.
+
+The peak is a Gaussian whose width is scaled by 10^(-delta_m / 100) at every mass and
+by a further 10^(-resolution / 100) per 100 amu, so positive values narrow the peaks
+and negative values broaden them until neighbours overlap. An optional exponential
+tail on the low mass side models the usual quadrupole peak asymmetry.
+
+Each peak is truncated where it falls below CUTOFF of its height, so only the peaks
+whose support covers a mass need to be evaluated.
+"""
+from collections import namedtuple
+import math
+
+import numpy as np
+
+SIGMA = 0.25  # Width at zero resolution and delta-m. Clear between peaks to ~12%
+CUTOFF = math.exp(-4.5)  # Truncate at 3 sigma
+TAIL_LENGTH = 2.0  # Decay length of the low mass tail, in sigmas
+
+# Per peak kernel parameters: sigma, support below and above the peak mass, and the largest supports.
+Kernels = namedtuple("Kernels", "sigmas below above max_below max_above")
+
+
+class PeakShape(namedtuple("PeakShape", "resolution delta_m tailing")):
+    """
+    Immutable, so it can be part of a cache key. tailing is the height of the low mass tail
+    relative to the peak, 0 for a symmetric peak.
+    """
+    __slots__ = ()
+
+    def __new__(cls, resolution=0, delta_m=0, tailing=0):
+        return super().__new__(cls, float(resolution), float(delta_m), float(tailing))
+
+    def sigmas(self, masses):
+        """ Gaussian width of peaks at the given masses. """
+        return SIGMA * np.power(10.0, -(self.delta_m + self.resolution * np.asarray(masses) / 100) / 100)
+
+    def kernels(self, masses):
+        """
+        Precomputes the kernel parameters of peaks at the given masses.
+        """
+        sigmas = self.sigmas(masses)
+        above = 3 * sigmas
+        below = above
+        if self.tailing > CUTOFF:
+            below = np.maximum(above, TAIL_LENGTH * sigmas * math.log(self.tailing / CUTOFF))
+        return Kernels(sigmas, below, above,
+                       float(np.max(below)) if len(masses) else 0.0,
+                       float(np.max(above)) if len(masses) else 0.0)
+
+    def profile(self, offsets, sigmas, below, above):
+        """
+        Relative height of peaks at offsets (scanned mass - peak mass), zero outside each peak's support.
+        The arguments broadcast against each other.
+        """
+        values = np.exp(-np.power(offsets / sigmas, 2.) / 2.)
+        if self.tailing != 0:
+            values = values + np.where(offsets < 0, self.tailing * np.exp(offsets / (TAIL_LENGTH * sigmas)), 0)
+        return np.where((offsets > -below) & (offsets < above), values, 0)
@@ -1,4 +1,47 @@
 import queue
+from collections import namedtuple
+
+# What the scan is currently at, as reported to monitoring clients.
+ScanPosition = namedtuple("ScanPosition", ["mass", "electron_energy"])
+
+# One mass of a Multiple Ion Detection (MID) scan. A dwell of None uses the device dwell;
+# range is the full scale exponent the reading saturates at, None for no limit.
+MIDChannel = namedtuple("MIDChannel", ["mass", "dwell", "scan_input", "range"], defaults=[None, "Faraday", None])
+
+# One cycle of a MID scan, queued as a single data queue entry. values holds one reading per
+# channel acquired before trip, which is None unless the cycle was cut short by a TripError.
+MIDRecord = namedtuple("MIDRecord", ["elapsed", "channels", "values", "trip"])
+
+# One point of an accumulating scan, the mean and standard deviation over a block of cycles.
+Averaged = namedtuple("Averaged", ["mean", "std"])
+
+# One completed scan cycle for in-process consumers, every field but sequence and cycle a read-only array
+# with an item per point: the scan point, reading, trip code, whether it tripped, time and gas state version.
+Cycle = namedtuple("Cycle", ["sequence", "cycle", "points", "values", "trips", "tripped", "times", "gas_versions"])
+
+
+class ScanCursor:
+    """
+    Mass and electron energy the scan engine is acquiring at.
+    Only the scan thread writes it; the device's user-set values are left alone.
+    """
+    __slots__ = ("mass", "electron_energy")
+
+    def __init__(self, mass, electron_energy):
+        self.mass = mass
+        self.electron_energy = electron_energy
+
+
+class BlockQueue(queue.Queue):
+    """
+    Queue that can also take a block of items under a single lock acquisition.
+    """
+
+    def put_many(self, items):
+        with self.not_empty:
+            self.queue.extend(items)
+            self.unfinished_tasks += len(items)
+            self.not_empty.notify_all()
 
 
 class ScannerRow:
@@ -33,15 +76,18 @@ class ScannerRow:
 
 
 class Scanner:
-    def __init__(self, scan_output):
+    def __init__(self, scan_output, time_queue=None, scan_queue=None, data_queue=None):
         self._rows = [ScannerRow()]
         self._current_row = 0
         self._scan_input = "Faraday"
         self._scan_output = scan_output
         self._report = 5
-        self._time_queue = queue.Queue()
-        self._scan_queue = queue.Queue()
-        self._data_queue = queue.Queue()
+        self._mid_channels = ()
+        self._accumulate = 0
+        self._accumulate_method = "sum"
+        self._time_queue = BlockQueue() if time_queue is None else time_queue
+        self._scan_queue = BlockQueue() if scan_queue is None else scan_queue
+        self._data_queue = BlockQueue() if data_queue is None else data_queue
         
     @property
     def rows(self):
@@ -89,6 +135,18 @@ class Scanner:
     def current_row_step(self, step):
         self._rows[self.current_row].step = step
 
+    @property
+    def mid_channels(self):
+        """
+        The masses of a MID scan, which replace the rows when not empty.
+        """
+        return self._mid_channels
+
+    @mid_channels.setter
+    def mid_channels(self, channels):
+        self._mid_channels = tuple(channel if isinstance(channel, MIDChannel) else MIDChannel(*channel)
+                                   for channel in channels)
+
     @property
     def scan_input(self):
         return self._scan_input
@@ -113,6 +171,28 @@ class Scanner:
     def report(self, report):
         self._report = report
         
+    @property
+    def accumulate(self):
+        """
+        Cycles averaged into each reported row, 0 or 1 to report every cycle.
+        """
+        return self._accumulate
+
+    @accumulate.setter
+    def accumulate(self, accumulate):
+        self._accumulate = accumulate
+
+    @property
+    def accumulate_method(self):
+        """
+        "sum" for the mean of each block of cycles, "ema" for an exponential moving average.
+        """
+        return self._accumulate_method
+
+    @accumulate_method.setter
+    def accumulate_method(self, accumulate_method):
+        self._accumulate_method = accumulate_method
+
     def clear_queues(self):
         while not self._time_queue.empty():
             self._time_queue.get()
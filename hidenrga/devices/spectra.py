@@ -0,0 +1,83 @@
+##################################################
+#
+# Noiseless spectrum cache for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Noiseless scan rows are the same every cycle while the chamber is steady, so they
+are computed once and kept in a bounded least recently used cache. Only the noise
+is drawn afresh each cycle.
+"""
+from collections import OrderedDict
+
+
+class SpectrumCache:
+    """
+    Least recently used cache of noiseless row intensities, keyed by everything they depend on.
+    Used only by the scan thread. Rows are used in the same order every cycle, so a capacity
+    smaller than the rows of a cycle would never hit; the scan reserves room for them all.
+    """
+    MAX_CAPACITY = 65536  # Rows, whatever the scan asks for
+
+    def __init__(self, capacity=64):
+        self._capacity = capacity
+        self._default_capacity = capacity
+        self._rows = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def reserve(self, rows):
+        """
+        Sizes the cache for a scan that uses rows rows per cycle, or the initial capacity if that is more.
+        """
+        self._capacity = min(max(self._default_capacity, rows), self.MAX_CAPACITY)
+        while len(self._rows) > self._capacity:
+            self._rows.popitem(last=False)
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def get(self, key, build):
+        """
+        Returns the row for key, calling build() to compute it if it is not cached.
+        """
+        row = self._rows.get(key)
+        if row is not None:
+            self._rows.move_to_end(key)
+            self._hits += 1
+            return row
+        self._misses += 1
+        row = build()
+        self._rows[key] = row
+        if len(self._rows) > self._capacity:
+            self._rows.popitem(last=False)
+        return row
+
+    def clear(self):
+        self._rows.clear()
+
+    def __len__(self):
+        return len(self._rows)
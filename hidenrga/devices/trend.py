@@ -0,0 +1,108 @@
+##################################################
+#
+# Single channel trend buffer for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Trend mode samples one mass at a high rate into a circular buffer. Clients read it
+decimated to the rate they want, as blocks of mean, min/max or last values.
+"""
+import threading
+
+import numpy as np
+
+DECIMATIONS = ("mean", "minmax", "last")
+
+
+class TrendBuffer:
+    """
+    Circular buffer of (time, value) samples with a single reader.
+    When the writer laps the reader, the oldest unread samples are dropped and counted as lost.
+    """
+
+    def __init__(self, capacity=65536):
+        self._capacity = capacity
+        self._times = np.zeros(capacity)
+        self._values = np.zeros(capacity)
+        self._written = 0
+        self._read = 0
+        self._lost = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def lost(self):
+        return self._lost
+
+    def __len__(self):
+        with self._lock:
+            return min(self._written - self._read, self._capacity)
+
+    def extend(self, times, values):
+        with self._lock:
+            count = len(values)
+            if count > self._capacity:
+                times, values = times[-self._capacity:], values[-self._capacity:]
+                self._written += count - self._capacity
+                count = self._capacity
+            start = self._written % self._capacity
+            first = min(count, self._capacity - start)
+            self._times[start:start + first] = times[:first]
+            self._values[start:start + first] = values[:first]
+            self._times[:count - first] = times[first:]
+            self._values[:count - first] = values[first:]
+            self._written += count
+            if self._written - self._read > self._capacity:
+                self._lost += self._written - self._read - self._capacity
+                self._read = self._written - self._capacity
+
+    def take(self, multiple=1):
+        """
+        Removes and returns (times, values) of the unread samples, a whole multiple of multiple of them.
+        """
+        with self._lock:
+            count = (self._written - self._read) // multiple * multiple
+            indices = (self._read + np.arange(count)) % self._capacity
+            self._read += count
+            return self._times[indices], self._values[indices]
+
+    def clear(self):
+        with self._lock:
+            self._read = self._written
+            self._lost = 0
+
+
+def decimate(times, values, factor, method):
+    """
+    Reduces every factor samples to one row: [time, mean], [time, min, max] or [time, last],
+    with the time of the last sample of the block.
+    """
+    if method not in DECIMATIONS:
+        raise ValueError("Unknown decimation " + str(method))
+    blocks = len(values) // factor
+    times = times[:blocks * factor].reshape(blocks, factor)[:, -1]
+    values = values[:blocks * factor].reshape(blocks, factor)
+    if method == "mean":
+        columns = [times, values.mean(axis=1)]
+    elif method == "minmax":
+        columns = [times, values.min(axis=1), values.max(axis=1)]
+    else:
+        columns = [times, values[:, -1]]
+    return np.column_stack(columns)
@@ -5,5 +5,10 @@ __all__ = ['HidenRGAStreamInterface']
 setups = dict(
     scanning=dict(
         device_type=SimulatedHidenRGA,
-    )
+    ),
+    # Scan acquisition in a child process, e.g. lewis -k hidenrga interfaces -s acquisition_process
+    acquisition_process=dict(
+        device_type=SimulatedHidenRGA,
+        parameters=dict(acquisition_process=True),
+    ),
 )
\ No newline at end of file
@@ -0,0 +1,117 @@
+##################################################
+#
+# Protocol session capture for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Records each client connection of the stream interface to a file of its own,
+for hidenrga.tools.replay to play back. A session file is JSON lines: a header
+object, then one [seconds, latency, request, reply] array per request, where
+seconds is from the start of the session and reply is null if none was sent.
+"""
+import itertools
+import json
+import os
+import time
+
+VERSION = 1
+_sessions = itertools.count(1)
+
+
+class SessionRecorder:
+    """
+    Records the requests and replies of one connection to path.
+    """
+
+    def __init__(self, path, port=None):
+        self._path = path
+        self._file = open(path, "w")
+        self._started = time.monotonic()
+        self._request = None
+        self._received = None
+        header = {"version": VERSION, "port": port, "started": time.time()}
+        self._file.write(json.dumps(header) + "\n")
+
+    @property
+    def path(self):
+        return self._path
+
+    def request(self, request):
+        if isinstance(request, bytes):
+            # Latin-1 keeps every byte as it was sent.
+            request = request.decode("latin-1")
+        self._request = request
+        self._received = time.monotonic()
+
+    def reply(self, reply):
+        if self._file is None or self._request is None:
+            return
+        if isinstance(reply, bytes):
+            reply = reply.decode("latin-1")
+        now = time.monotonic()
+        record = [round(self._received - self._started, 6), round(now - self._received, 6), self._request, reply]
+        self._file.write(json.dumps(record) + "\n")
+        self._request = None
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_session(path):
+    """
+    Returns the header and the list of [seconds, latency, request, reply] records of a session file.
+    """
+    with open(path) as session:
+        header = json.loads(session.readline())
+        if header.get("version") != VERSION:
+            raise ValueError(path + " is not a session file of version " + str(VERSION))
+        return header, [json.loads(line) for line in session if line.strip()]
+
+
+def attach(handler, directory):
+    """
+    Records the session of a lewis stream handler into a new file in directory, returning the recorder.
+    Every request the handler reads is followed by the reply it sends, if any, so they are paired here.
+    """
+    # lewis has no hook for this, so the handler's own methods are wrapped.
+    # It sets the interface's handler before the handler has its streams, so only the port is known here.
+    port = handler._stream_server.port
+    name = "session-" + str(port) + "-" + time.strftime("%Y%m%d-%H%M%S") + "-" + str(next(_sessions))
+    recorder = SessionRecorder(os.path.join(directory, name + ".jsonl"), port)
+    get_request = handler._get_request
+    send_reply = handler._send_reply
+    handle_close = handler.handle_close
+
+    def recorded_get_request():
+        request = get_request()
+        recorder.request(request)
+        return request
+
+    async def recorded_send_reply(reply):
+        recorder.reply(reply)
+        await send_reply(reply)
+
+    async def recorded_handle_close():
+        recorder.close()
+        await handle_close()
+
+    handler._get_request = recorded_get_request
+    handler._send_reply = recorded_send_reply
+    handler.handle_close = recorded_handle_close
+    return recorder
@@ -0,0 +1,110 @@
+##################################################
+#
+# Reply cache for Hiden RGA stream interface
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Keeps the replies of commands that answer the same every time, such as
+pget name and lid$ all, encoded and terminated, by the request bytes that
+asked for them. A cached request is answered straight from the read buffer,
+without matching it against the commands or taking the device lock, so an
+IOC that reconnects and reads them all again costs next to nothing.
+
+An entry may depend on device properties; it is dropped when the device
+reports that one of them has been set.
+"""
+from collections import defaultdict
+
+
+class ReplyCache:
+    """
+    Encoded replies, ending with terminator, by request.
+    """
+
+    def __init__(self, terminator):
+        self._terminator = terminator.encode() if isinstance(terminator, str) else terminator
+        self._replies = {}
+        self._dependents = defaultdict(set)
+        self.request = None
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._replies)
+
+    def get(self, request):
+        """ Returns the encoded reply to request, None if it is not cached. """
+        reply = self._replies.get(request)
+        if reply is not None:
+            self.hits += 1
+        return reply
+
+    def put(self, reply, depends=()):
+        """
+        Caches reply to the request being processed, until one of the device properties in depends is set.
+        """
+        if self.request is None or reply is None:
+            return
+        self._replies[self.request] = str(reply).encode() + self._terminator
+        for name in depends:
+            self._dependents[name].add(self.request)
+
+    def invalidate(self, name):
+        """ Drops the replies that depend on the device property name. """
+        for request in self._dependents.pop(name, ()):
+            self._replies.pop(request, None)
+
+    def clear(self):
+        self._replies.clear()
+        self._dependents.clear()
+
+
+def attach(handler, cache, connected):
+    """
+    Answers the requests of a lewis stream handler from cache while connected() is true,
+    and otherwise lets cache know which request the handler is processing.
+    """
+    # lewis has no hook for this either, so the handler's own methods are wrapped.
+    terminator = handler._in_terminator
+    get_request = handler._get_request
+    found_terminator = handler.found_terminator
+
+    def cached_get_request():
+        cache.request = get_request()
+        return cache.request
+
+    async def cached_found_terminator():
+        data = b"".join(handler._buffer)
+        end = data.find(terminator)
+        reply = cache.get(data[:end]) if end != -1 and connected() else None
+        if reply is None:
+            await found_terminator()
+            cache.request = None
+            return
+        handler._readtimer = 0
+        remainder = data[end + len(terminator):]
+        handler._buffer = [remainder] if remainder else []
+        if handler._closing:
+            return
+        try:
+            handler._writer.write(reply)
+            await handler._writer.drain()
+        except OSError as error:
+            handler.log.error("Connection error while sending reply: %s", error)
+            await handler.handle_close()
+
+    handler._get_request = cached_get_request
+    handler.found_terminator = cached_found_terminator
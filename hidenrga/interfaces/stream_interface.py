@@ -22,8 +22,35 @@ from lewis.adapters.stream import Cmd, StreamInterface
 from lewis.utils.command_builder import CmdBuilder
 from lewis.utils.replies import conditional_reply
 from lewis.core.logging import has_log
+import functools
+import os
 import time
 
+try:
+    from . import capture  # "emulator" case
+except ImportError:
+    import capture  # "__main__" case
+
+try:
+    from . import reply_cache  # "emulator" case
+except ImportError:
+    import reply_cache  # "__main__" case
+
+
+def cached_reply(*depends):
+    """
+    Caches the reply of a command by the request that asked for it, until one of the device properties
+    in depends is set. Goes under conditional_reply("connected"), so nothing is cached while disconnected.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args):
+            reply = function(self, *args)
+            self.replies.put(reply, depends)
+            return reply
+        return wrapper
+    return decorator
+
 
 class HidenRGAStreamInterface(StreamInterface):
     """
@@ -84,6 +111,9 @@ class HidenRGAStreamInterface(StreamInterface):
         CmdBuilder("sset_settle").escape("sset settle ").string().build(),
         CmdBuilder("sjob_sset_mode").escape("sjob sset mode ").int().build(),
         CmdBuilder("sset_mode").escape("sset mode ").int().build(),
+        CmdBuilder("sset_mid").escape("sset mid ").string().build(),
+        CmdBuilder("sset_accumulate").escape("sset accumulate ").int().build(),
+        CmdBuilder("sset_accumulate_method").escape("sset accumulate-method ").string().build(),
         CmdBuilder("tdel_all").escape("tdel all").build(),
         CmdBuilder("quit").escape("quit").build(),
         CmdBuilder("sset_state").escape("sset state ").any().build(),
@@ -101,27 +131,83 @@ class HidenRGAStreamInterface(StreamInterface):
         CmdBuilder("luse").escape("luse ").int().build(),
         CmdBuilder("lval").escape("lval ").int().build(),
         CmdBuilder("rbuf").escape("rbuf ").build(),
+        CmdBuilder("rbuf_cycle").escape("rbuf ").int().build(),
+        CmdBuilder("rbuf_between").escape("rbuf ").float().escape(" ").float().build(),
         CmdBuilder("rerr").escape("rerr").build(),
         CmdBuilder("eid_dollar").escape("eid$").int().build(),
+        # Simulator trend mode, not part of the Hiden protocol.
+        CmdBuilder("tset_mass").escape("tset mass ").float().build(),
+        CmdBuilder("tset_rate").escape("tset rate ").float().build(),
+        CmdBuilder("tset_output").escape("tset output ").float().build(),
+        CmdBuilder("tset_decimation").escape("tset decimation ").string().build(),
+        CmdBuilder("tset_state").escape("tset state ").any().build(),
+        CmdBuilder("tdata").escape("tdata").build(),
     }
 
     in_terminator = "\r"
     out_terminator = "\r\n"
-    
+
+    _handler = None
+    _replies = None
+    _replies_device = None
+
+    @property
+    def replies(self):
+        """ The reply cache of the device this interface is bound to. """
+        return self._replies
+
+    def _bind_device(self):
+        super()._bind_device()
+        # A new device starts a new cache, and the old device's changes no longer concern it.
+        if self._replies_device is not None:
+            self._replies_device.remove_change_listener(self._replies.invalidate)
+        self._replies = reply_cache.ReplyCache(self.out_terminator)
+        self._replies_device = self.device
+        self.device.add_change_listener(self._replies.invalidate)
+
+    @property
+    def handler(self):
+        return self._handler
+
+    @handler.setter
+    def handler(self, handler):
+        # lewis sets the handler of each client as it connects.
+        self._handler = handler
+        if handler is None:
+            return
+        capture_dir = os.environ.get("HIDENRGA_CAPTURE_DIR")
+        if capture_dir:
+            os.makedirs(capture_dir, exist_ok=True)
+            recorder = capture.attach(handler, capture_dir)
+            self.log.info("Recording session to %s", recorder.path)
+        else:
+            # A recorded session shows every reply as the commands made it, so it is not answered from the cache.
+            reply_cache.attach(handler, self.replies, lambda: self.device.connected)
+
+    @handler.deleter
+    def handler(self):
+        # lewis deletes the handler when a client disconnects.
+        # With several clients connected, the next disconnect would then raise AttributeError.
+        self._handler = None
+
     @conditional_reply("connected")
+    @cached_reply()
     def get_name(self):
         return self.device.name
         
     @conditional_reply("connected")
+    @cached_reply()
     def get_release(self):
         return self.device.release
 
     @conditional_reply("connected")
+    @cached_reply()
     def get_net_address(self):
         # This is the MAC address of the MSIU
         return "0,1,C0,16,A6,44"
 
     @conditional_reply("connected")
+    @cached_reply()
     def get_configurationid(self):
         return 2
 
@@ -173,8 +259,10 @@ class HidenRGAStreamInterface(StreamInterface):
             self.device.F1 = int(round(val))
         if device == "F2":
             self.device.F2 = int(round(val))
-        #if device == "delta-m":
-            #self.device.delta-m = val
+        if device == "degas":
+            self.device.degas = val
+        if device == "delta-m":
+            self.device.delta_m = val
         if device == "electron-energy":
             self.device.electron_energy = val
         if device == "emission":
@@ -187,8 +275,8 @@ class HidenRGAStreamInterface(StreamInterface):
             #self.device.mode-change-delay = val
         #if device = "multiplier":
             #self.device.multiplier = val
-        #if device = "resolution":
-            #self.device.resolution = val
+        if device == "resolution":
+            self.device.resolution = val
         return "" # OK
         
     @conditional_reply("connected")
@@ -262,6 +350,10 @@ class HidenRGAStreamInterface(StreamInterface):
             retval = "1"
         if device == 'electron-energy':
             retval = str(self.device.electron_energy)
+        if device == 'resolution':
+            retval = str(self.device.resolution)
+        if device == 'delta-m':
+            retval = str(self.device.delta_m)
         if device == 'emok':
             if self.device.emok:
                 retval = "1"
@@ -350,6 +442,10 @@ class HidenRGAStreamInterface(StreamInterface):
             return self.device.high
         if name == 'current':
             return self.device.current
+        if name == 'accumulate':
+            return self.device.accumulate
+        if name == 'mid':
+            return " ".join("{:g}".format(channel[0]) for channel in self.device.mid_channels)
         if name == 'row':
             # NB, Hiden indexes rows starting at 1. I prefer to index from 0.
             return self.device.current_row + 1
@@ -404,6 +500,31 @@ class HidenRGAStreamInterface(StreamInterface):
         self.device.dwellmode = dwellmode
         return ""  # OK
     
+    @conditional_reply("connected")
+    def sset_mid(self, channels):
+        # Space separated channels of mass[,dwell[,input[,range]]], e.g. 18 28,50 44,,SEM or none for a row scan.
+        mid_channels = []
+        if channels.strip() != 'none':
+            for channel in channels.split():
+                fields = channel.split(',')
+                dwell = float(fields[1]) if len(fields) > 1 and fields[1] else None
+                scan_input = fields[2] if len(fields) > 2 and fields[2] else "Faraday"
+                _range = int(fields[3]) if len(fields) > 3 and fields[3] else None
+                mid_channels.append([float(fields[0]), dwell, scan_input, _range])
+        self.device.mid_channels = mid_channels
+        return ""  # OK
+
+    @conditional_reply("connected")
+    def sset_accumulate(self, accumulate):
+        # Cycles averaged into each reported row; report bit 1 adds the standard deviation of each point.
+        self.device.accumulate = accumulate
+        return ""  # OK
+
+    @conditional_reply("connected")
+    def sset_accumulate_method(self, accumulate_method):
+        self.device.accumulate_method = accumulate_method
+        return ""  # OK
+
     @conditional_reply("connected")
     def sset_settle(self, settle):
         # Either e.g. 100 (time in ms) or eg 100% (percent of default value)
@@ -467,6 +588,7 @@ class HidenRGAStreamInterface(StreamInterface):
         return ""  # OK
 
     @conditional_reply("connected")
+    @cached_reply("masstable")
     def pget_masstable(self):
         return self.device.masstable
         return ""  # OK
@@ -508,6 +630,7 @@ class HidenRGAStreamInterface(StreamInterface):
         return ""  # OK
 
     @conditional_reply("connected")
+    @cached_reply("terse", "range_units")
     def lmin(self, logical_device):
         if logical_device == "mass":
             return self.device.min_mass
@@ -518,6 +641,7 @@ class HidenRGAStreamInterface(StreamInterface):
         return 0
     
     @conditional_reply("connected")
+    @cached_reply("terse", "range_units")
     def lmax(self, logical_device):
         if logical_device.isnumeric():
             logical_index = int(logical_device)
@@ -533,10 +657,12 @@ class HidenRGAStreamInterface(StreamInterface):
         return 0
     
     @conditional_reply("connected")
+    @cached_reply()
     def lres(self, logical_device):
         return 0.001
         
     @conditional_reply("connected")
+    @cached_reply()
     def lid_hash(self, logical_device):
         if logical_device not in self.device.logical_all:
             self.log.warning("device not found")
@@ -544,6 +670,7 @@ class HidenRGAStreamInterface(StreamInterface):
         return self.device.logical_all.index(logical_device)
     
     @conditional_reply("connected")
+    @cached_reply()
     def lid_dollar(self, logical_device):
         return_value = '"'
         if logical_device == "all":
@@ -578,6 +705,7 @@ class HidenRGAStreamInterface(StreamInterface):
     
         
     @conditional_reply("connected")
+    @cached_reply()
     def luse(self, logical_index):
         return self.logical_device(logical_index)
     
@@ -591,12 +719,14 @@ class HidenRGAStreamInterface(StreamInterface):
         return str(err_no)
 
     @conditional_reply("connected")
+    @cached_reply()
     def lunt(self, logical_device):
         if logical_device == "mode":
             return 1   # RGA
         return ""
         
     @conditional_reply("connected")
+    @cached_reply()
     def lval(self, logical_index):
         logical_device = self.logical_device(logical_index)
             
@@ -654,8 +784,107 @@ class HidenRGAStreamInterface(StreamInterface):
         return "0, 0,0,0,0,0,0,0,0, 0,0,"
     
     @conditional_reply("connected")
-    def rbuf(self):
+    def tset_mass(self, mass):
+        self.device.trend_mass = mass
+        return ""  # OK
+
+    @conditional_reply("connected")
+    def tset_rate(self, rate):
+        """
+        Sets the trend sampling rate, in samples per second.
+        """
+        self.device.trend_rate = rate
+        return ""  # OK
+
+    @conditional_reply("connected")
+    def tset_output(self, output_rate):
+        """
+        Sets the rate, in rows per second, that tdata decimates the trend samples to.
+        """
+        self.device.trend_output_rate = output_rate
+        return ""  # OK
+
+    @conditional_reply("connected")
+    def tset_decimation(self, decimation):
+        """
+        Sets how each block of trend samples is reduced to a row: mean, minmax or last.
+        """
+        self.device.trend_decimation = decimation
         return ""  # OK
+
+    @conditional_reply("connected")
+    def tset_state(self, state=''):
+        if state == 'Run:':
+            self.device.start_trend()
+        if state == 'Stop:':
+            self.device.stop_trend()
+        return ""  # OK
+
+    @conditional_reply("connected")
+    def tdata(self):
+        """
+        Returns the trend rows since the last tdata as {<seconds>: <value>[ <value>],...}.
+        Rows have a single mean or last value, or the min and max values of the block.
+        """
+        rows = self.device.trend_data()
+        if not rows:
+            if self.device.trend_trip != 0:
+                return "*P" + str(self.device.trend_trip) + "*"
+            if not self.device.trending:
+                return "*C110*"     # No more data available
+        return_string = "{"
+        for row in rows:
+            return_string += str(round(row[0], 6)) + ":"
+            for value in row[1:]:
+                if value >= 0:
+                    return_string += " "
+                return_string += str(value)
+            return_string += ","
+        return return_string + "}"
+
+    def history_string(self, sequences):
+        """
+        Returns cycles of the scan history as [{<point>: <value>,...}] each, with *P<code>* where a cycle tripped.
+        """
+        return_string = ""
+        for sequence in sequences:
+            cycle = self.device.history_read(sequence)
+            if cycle is None:
+                continue
+            return_string += "[{"
+            for point, value, trip in zip(cycle["point"].tolist(), cycle["value"].tolist(), cycle["trip"].tolist()):
+                if trip != 0:
+                    return_string += "*P" + str(trip) + "*"
+                    continue
+                return_string += str(point) + ":"
+                if value >= 0:
+                    return_string += " "
+                return_string += str(value) + ","
+            return_string += "}]"
+        if not return_string:
+            return "*C110*"     # No more data available
+        return return_string
+
+    @conditional_reply("connected")
+    def rbuf(self):
+        """
+        Returns the latest completed cycle of the scan history.
+        """
+        return self.history_string([-1])
+
+    @conditional_reply("connected")
+    def rbuf_cycle(self, sequence):
+        """
+        Returns one cycle of the scan history by sequence number, negative counting back from the latest.
+        """
+        return self.history_string([sequence])
+
+    @conditional_reply("connected")
+    def rbuf_between(self, start, end):
+        """
+        Returns the cycles of the scan history between start and end, in seconds since the epoch.
+        """
+        return self.history_string(self.device.history_find(start, end))
     
     @has_log
     def handle_error(self, request, error):
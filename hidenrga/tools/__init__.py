@@ -0,0 +1 @@
+# Tools for exercising simulated Hiden RGA instances from outside the lewis process.
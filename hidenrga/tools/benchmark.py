@@ -0,0 +1,295 @@
+##################################################
+#
+# Benchmark suite for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Measures the simulator hot paths and emits the results as JSON.
+
+    python -m hidenrga.tools.benchmark --output results.json
+    python -m hidenrga.tools.benchmark --baseline baseline.json --tolerance 0.25
+
+With --baseline, each result is compared with the stored value of the same name
+and the exit status is 1 if any result has regressed by more than the tolerance.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from ..devices import SimulatedHidenRGA
+from ..devices import gasses
+from .instances import LocalInstance
+from .stream_client import StreamClient
+
+SEED = 12345
+GAS_MIX = {"H2": 1E-5, "He": 4E-5, "H2O": 2E-5, "N2": 8E-4, "CO": 1E-6, "O2": 2E-4, "CO2": 2E-6}
+
+
+def result(name, value, unit, higher_is_better):
+    return {"name": name, "value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def new_device():
+    np.random.seed(SEED)
+    device = SimulatedHidenRGA()
+    device.F1 = True
+    for name, pressure in GAS_MIX.items():
+        device.current_gas = name
+        device.current_gas_pressure = pressure
+    device.dwell = 0
+    return device
+
+
+def set_row(device, row, start, stop, step):
+    device.current_row = row
+    device.current_row_start = start
+    device.current_row_stop = stop
+    device.current_row_step = step
+
+
+def configure_scan(device, kind, points):
+    """ Configures an Ascans of roughly the given number of points per cycle. """
+    device.current_scan = "Ascans"
+    device.report = 0b10101
+    if kind == "mass":
+        device.scan_output = "mass"
+        set_row(device, 0, 1, 1 + 0.1 * (points - 1), 0.1)
+    elif kind == "energy":
+        device.mass = 4
+        device.scan_output = "electron-energy"
+        step = 90.0 / points
+        set_row(device, 0, 10, 10 + step * (points - 1), step)
+    elif kind == "nested":
+        # Ascans drives the electron energy, Bscans does a mass scan at each energy.
+        outer = 10
+        device.scan_output = "electron-energy"
+        device.scan_input = "Bscans"
+        set_row(device, 0, 20, 20 + 5 * (outer - 1), 5)
+        device.current_scan = "Bscans"
+        device.report = 0b10101
+        device.scan_output = "mass"
+        inner = max(1, points // outer)
+        set_row(device, 0, 1, 1 + 0.1 * (inner - 1), 0.1)
+        device.current_scan = "Ascans"
+    else:
+        raise ValueError("Unknown scan kind " + kind)
+
+
+def queued_points(device):
+    return sum(scan.data_queue.qsize() for scan in device.scans.values())
+
+
+def bench_scan(kind, points, cycles, repeat, signal_surface=False):
+    best = None
+    for attempt in range(repeat):
+        device = new_device()
+        device.signal_surface = signal_surface
+        configure_scan(device, kind, points)
+        device.cycles = cycles
+        start = time.perf_counter()
+        device.start("Ascans")
+        device.join(None)
+        elapsed = time.perf_counter() - start
+        rate = queued_points(device) / elapsed
+        best = rate if best is None else max(best, rate)
+    name = kind + "_surface" if signal_surface else kind
+    return result("scan." + name + ".points_per_second", best, "points/s", True)
+
+
+MID_MASSES = [2, 4, 18, 28, 32, 44]
+
+
+def bench_mid(cycles, repeat):
+    best = None
+    for attempt in range(repeat):
+        device = new_device()
+        device.current_scan = "Ascans"
+        device.report = 0b10101
+        device.mid_channels = [[mass] for mass in MID_MASSES]
+        device.cycles = cycles
+        start = time.perf_counter()
+        device.start("Ascans")
+        device.join(None)
+        elapsed = time.perf_counter() - start
+        rate = device.scans["Ascans"].data_queue.qsize() * len(MID_MASSES) / elapsed
+        best = rate if best is None else max(best, rate)
+    return result("scan.mid.points_per_second", best, "points/s", True)
+
+
+def populated_gasses(species_count):
+    library = gasses.Gasses()
+    for name, pressure in GAS_MIX.items():
+        library.set_partial_pressure(name, pressure)
+    random = np.random.RandomState(SEED)
+    peaks = [(float(random.randint(1, 200)), gasses.GasSpecies("X" + str(index), random.uniform(10, 25)))
+             for index in range(len(library.species), species_count)]
+    library.insert_many(peaks)
+    for mass, species in peaks:
+        library.set_partial_pressure(species.name, random.uniform(1E-8, 1E-5))
+    return library
+
+
+def bench_gas_signal(species_count, repeat):
+    library = populated_gasses(species_count)
+    masses = np.arange(1, 200, 0.1)
+    best = None
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        for mass in masses:
+            library.signal(mass, 70)
+        elapsed = (time.perf_counter() - start) / len(masses)
+        best = elapsed if best is None else min(best, elapsed)
+    return result("gasses.signal.species_" + str(species_count) + ".seconds_per_call", best, "s", False)
+
+
+def bench_data(backlog, all, repeat):
+    best = None
+    for attempt in range(repeat):
+        device = new_device()
+        configure_scan(device, "mass", backlog)
+        device.start("Ascans")
+        device.join(None)
+        points = queued_points(device)
+        start = time.perf_counter()
+        while device.data(all) != "*C110*":
+            pass
+        elapsed = (time.perf_counter() - start) / points
+        best = elapsed if best is None else min(best, elapsed)
+    command = "data_all" if all else "data"
+    return result(command + ".backlog_" + str(backlog) + ".seconds_per_point", best, "s", False)
+
+
+SETUP_COMMANDS = ["lset F1 1", "sset scan Ascans", "sset output mass", "sset start 1", "sset stop 50",
+                  "sset step 1", "sset report 21", "sset dwell 0", "sset cycles 0"]
+ROUND_TRIP_COMMANDS = ["pget name", "lget electron-energy", "lid$ all", "data"]
+
+
+def bench_round_trip(count):
+    results = []
+    with LocalInstance() as instance:
+        with StreamClient(instance.host, instance.port) as client:
+            for command in SETUP_COMMANDS:
+                client.command(command)
+            client.command("sjob lget Ascans")
+            for command in ROUND_TRIP_COMMANDS:
+                latencies = []
+                for attempt in range(count):
+                    start = time.perf_counter()
+                    client.command(command)
+                    latencies.append(time.perf_counter() - start)
+                name = "round_trip." + command.replace(" ", "_")
+                results.append(result(name + ".p50", float(np.percentile(latencies, 50)), "s", False))
+                results.append(result(name + ".p95", float(np.percentile(latencies, 95)), "s", False))
+            client.command("sset state Abort:")
+    return results
+
+
+def bench_import(repeat):
+    """ Seconds a fresh interpreter takes to import the simulator, as each lewis launch does. """
+    timings = []
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import hidenrga.devices, hidenrga.interfaces"], check=True)
+        timings.append(time.perf_counter() - start)
+    return result("startup.import", min(timings), "s", False)
+
+
+def run(arguments):
+    results = [bench_import(arguments.repeat)]
+    for kind in ["mass", "energy", "nested"]:
+        results.append(bench_scan(kind, arguments.points, arguments.cycles, arguments.repeat))
+    results.append(bench_scan("nested", arguments.points, arguments.cycles, arguments.repeat, True))
+    results.append(bench_mid(arguments.points * arguments.cycles // len(MID_MASSES), arguments.repeat))
+    for species_count in arguments.species:
+        results.append(bench_gas_signal(species_count, arguments.repeat))
+    for backlog in arguments.backlog:
+        results.append(bench_data(backlog, False, arguments.repeat))
+        results.append(bench_data(backlog, True, arguments.repeat))
+    if not arguments.no_network:
+        results.extend(bench_round_trip(arguments.round_trips))
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "settings": {key: value for key, value in vars(arguments).items()
+                     if key not in ("output", "baseline", "tolerance")},
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Returns the list of results that are worse than the baseline by more than tolerance (a fraction).
+    """
+    stored = {item["name"]: item for item in baseline["results"]}
+    regressions = []
+    for item in report["results"]:
+        reference = stored.get(item["name"])
+        if reference is None or reference["value"] == 0:
+            continue
+        change = item["value"] / reference["value"] - 1
+        if item["higher_is_better"]:
+            change = -change
+        item["baseline"] = reference["value"]
+        item["change"] = change
+        if change > tolerance:
+            regressions.append(item)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hiden RGA simulator benchmarks")
+    parser.add_argument("--points", type=int, default=500, help="points per scan cycle")
+    parser.add_argument("--cycles", type=int, default=4, help="cycles per scan benchmark")
+    parser.add_argument("--species", type=int, nargs="+", default=[14, 100, 1000], help="gas library sizes")
+    parser.add_argument("--backlog", type=int, nargs="+", default=[100, 1000, 10000], help="data backlog sizes")
+    parser.add_argument("--round-trips", type=int, default=200, help="requests per round trip benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="best of n repeats")
+    parser.add_argument("--no-network", action="store_true", help="skip the TCP round trip benchmarks")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed fractional regression")
+    arguments = parser.parse_args(argv)
+
+    report = run(arguments)
+    regressions = []
+    if arguments.baseline is not None:
+        with open(arguments.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), arguments.tolerance)
+        report["regressions"] = [item["name"] for item in regressions]
+
+    if arguments.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print("")
+    else:
+        with open(arguments.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    for item in regressions:
+        print("REGRESSION " + item["name"] + " " + str(item["value"]) + " " + item["unit"] +
+              " baseline " + str(item["baseline"]) + " (" + str(round(100 * item["change"])) + "% worse)",
+              file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+##################################################
+#
+# Persistent control client for Hiden RGA simulator instances
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Talks to the lewis control server of one or many instances over connections
+that are kept open, sending any number of property sets and method calls to
+each instance in one JSON-RPC batch, i.e. one round trip.
+
+    with ControlConnection("localhost", 10000) as device:
+        device.set("current_gas", "He")
+        with device.batch() as batch:
+            batch.set("current_gas", "N2")
+            batch.set("current_gas_pressure", 8E-4)
+            total = batch.get("total_pressure")
+        print(batch.results[total])
+
+ControlFleet sends a batch to several instances at once, and the Async
+classes do the same from asyncio code. From the command line, as
+lewis-control but with several items, and instances, per call:
+
+    python -m hidenrga.tools.control -r localhost:10000 current_gas=He current_gas_pressure=4E-5 total_pressure
+    python -m hidenrga.tools.control -r localhost:10000 -r localhost:10001 --script < scenario.txt
+
+name=value sets a property, name gets a property or calls a method without
+arguments and name(a,b) calls a method. Values are read as JSON where they
+can be, so 1E-5 is a number and He a string. With --script, each line of
+standard input is a batch of items, and a line 'sleep <seconds>' waits.
+Without items, the API of the object is listed.
+"""
+import argparse
+import asyncio
+import builtins
+import itertools
+import json
+import re
+import shlex
+import sys
+import time
+
+from lewis.core.control_client import ProtocolException, RemoteException
+import zmq
+import zmq.asyncio
+
+TIMEOUT = 3000  # ms, as lewis-control
+
+
+class Batch:
+    """
+    Calls to send to an instance in one round trip. Each of call, get and set returns the index of its
+    result in results, which is filled in when the batch has been executed.
+    """
+
+    def __init__(self, connection=None):
+        self._connection = connection
+        self._calls = []
+        self.results = None
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None and self._connection is not None:
+            self.results = self._connection.execute(self)
+
+    @property
+    def calls(self):
+        """ The (method, args) of each call, in order. """
+        return list(self._calls)
+
+    def call(self, method, *args):
+        self._calls.append((method, args))
+        return len(self._calls) - 1
+
+    def get(self, name):
+        return self.call(name + ":get")
+
+    def set(self, name, value):
+        return self.call(name + ":set", value)
+
+
+def requests(prefix, batch, ids):
+    """ Returns the JSON-RPC batch request of batch, numbering the calls from ids. """
+    return [{"method": prefix + method, "params": list(args), "jsonrpc": "2.0", "id": next(ids)}
+            for method, args in batch.calls]
+
+
+def result(response):
+    """
+    Returns the result of one JSON-RPC response, raising the error it carries as lewis-control does:
+    as the server's exception type if it is a builtin, otherwise as a RemoteException.
+    """
+    if "result" in response:
+        return response["result"]
+    error = response.get("error")
+    if error is None:
+        raise ProtocolException("JSON-RPC response has neither a result nor an error.")
+    if "data" not in error:
+        raise ProtocolException(error["message"])
+    exception_type = error["data"]["type"]
+    if not hasattr(builtins, exception_type):
+        raise RemoteException(exception_type, error["data"]["message"])
+    raise getattr(builtins, exception_type)(error["data"]["message"])
+
+
+def results(sent, responses):
+    """
+    Returns the results of responses in the order of the requests sent. The first error is raised
+    once every result has been read; the calls after it were still made.
+    """
+    if isinstance(responses, dict):
+        # A batch the server could not parse at all is answered with a single error.
+        result(responses)
+    by_id = {response.get("id"): response for response in responses}
+    values = []
+    error = None
+    for request in sent:
+        response = by_id.get(request["id"])
+        try:
+            if response is None:
+                raise ProtocolException("No JSON-RPC response to request " + str(request["id"]) + ".")
+            values.append(result(response))
+        except Exception as exception:
+            values.append(None)
+            error = error or exception
+    if error is not None:
+        raise error
+    return values
+
+
+def _socket(context, host, port, timeout):
+    socket = context.socket(zmq.REQ)
+    # As lewis-control: a request that timed out does not leave the socket waiting for its reply.
+    socket.setsockopt(zmq.REQ_CORRELATE, 1)
+    socket.setsockopt(zmq.REQ_RELAXED, 1)
+    socket.setsockopt(zmq.SNDTIMEO, timeout)
+    socket.setsockopt(zmq.RCVTIMEO, timeout)
+    socket.setsockopt(zmq.LINGER, 0)
+    socket.connect("tcp://" + host + ":" + str(port))
+    return socket
+
+
+class ControlConnection:
+    """
+    A connection to the lewis control server of one instance, for the calls of one exposed object.
+    """
+    _context = zmq.Context
+
+    def __init__(self, host="localhost", port=10000, exposed="device", timeout=TIMEOUT):
+        self._address = host + ":" + str(port)
+        self._prefix = exposed + "."
+        self._api = exposed + ":api"
+        self._ids = itertools.count(1)
+        self._socket = _socket(self._context.instance(), host, port, timeout)
+        self._sent = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def address(self):
+        return self._address
+
+    def batch(self):
+        """ Returns a Batch that is executed on this connection at the end of its with block. """
+        return Batch(self)
+
+    def send(self, batch):
+        """ Sends batch without waiting for its results, which receive() returns. """
+        self._sent = requests(self._prefix, batch, self._ids)
+        if not self._sent:
+            return
+        try:
+            self._socket.send_json(self._sent)
+        except zmq.error.Again:
+            raise ProtocolException("Timeout sending to the control server at " + self._address + ".")
+
+    def receive(self):
+        if not self._sent:
+            return []
+        try:
+            responses = self._socket.recv_json()
+        except zmq.error.Again:
+            raise ProtocolException("Timeout waiting for the control server at " + self._address + ".")
+        return results(self._sent, responses)
+
+    def execute(self, batch):
+        """ Makes the calls of batch in one round trip and returns their results. """
+        self.send(batch)
+        return self.receive()
+
+    def call(self, method, *args):
+        batch = Batch()
+        batch.call(method, *args)
+        return self.execute(batch)[0]
+
+    def get(self, name):
+        return self.call(name + ":get")
+
+    def set(self, name, value):
+        self.call(name + ":set", value)
+
+    def api(self):
+        """ Returns the class name and the methods of the exposed object, properties as <name>:get and :set. """
+        self._socket.send_json({"method": self._api, "params": [], "jsonrpc": "2.0", "id": next(self._ids)})
+        return result(self._socket.recv_json())
+
+    def close(self):
+        self._socket.close()
+
+
+class ControlFleet:
+    """
+    Connections to several instances. A batch is sent to every instance before any result is waited for,
+    so the round trips overlap.
+    """
+
+    def __init__(self, addresses, exposed="device", timeout=TIMEOUT):
+        self._connections = [ControlConnection(host, port, exposed, timeout) for host, port in addresses]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._connections)
+
+    @property
+    def connections(self):
+        return list(self._connections)
+
+    def execute(self, batch):
+        """ Makes the calls of batch on every instance and returns a list of their results per instance. """
+        return self.execute_each([batch] * len(self._connections))
+
+    def execute_each(self, batches):
+        """ Makes the calls of one batch per instance, in the order of the connections. """
+        for connection, batch in zip(self._connections, batches):
+            connection.send(batch)
+        return [connection.receive() for connection in self._connections]
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+
+
+class AsyncControlConnection(ControlConnection):
+    """
+    ControlConnection for asyncio code: execute, call, get, set and api are coroutines.
+    """
+    _context = zmq.asyncio.Context
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def batch(self):
+        """ Returns a Batch, to be passed to execute(). """
+        return Batch()
+
+    async def execute(self, batch):
+        if not len(batch):
+            return []
+        sent = requests(self._prefix, batch, self._ids)
+        try:
+            await self._socket.send_json(sent)
+            responses = await self._socket.recv_json()
+        except zmq.error.Again:
+            raise ProtocolException("Timeout waiting for the control server at " + self._address + ".")
+        return results(sent, responses)
+
+    async def call(self, method, *args):
+        batch = Batch()
+        batch.call(method, *args)
+        return (await self.execute(batch))[0]
+
+    async def get(self, name):
+        return await self.call(name + ":get")
+
+    async def set(self, name, value):
+        await self.call(name + ":set", value)
+
+    async def api(self):
+        await self._socket.send_json({"method": self._api, "params": [], "jsonrpc": "2.0", "id": next(self._ids)})
+        return result(await self._socket.recv_json())
+
+
+class AsyncControlFleet(ControlFleet):
+    """
+    ControlFleet for asyncio code: execute and execute_each are coroutines.
+    """
+
+    def __init__(self, addresses, exposed="device", timeout=TIMEOUT):
+        self._connections = [AsyncControlConnection(host, port, exposed, timeout) for host, port in addresses]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    async def execute(self, batch):
+        return await self.execute_each([batch] * len(self._connections))
+
+    async def execute_each(self, batches):
+        return list(await asyncio.gather(*[connection.execute(batch)
+                                           for connection, batch in zip(self._connections, batches)]))
+
+
+def parse_value(text):
+    """ Returns text as JSON if it is JSON, otherwise as the string itself. """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_item(item, methods):
+    """
+    Returns the (method, args) of a command line item: name=value, name(a,b) or name.
+    methods is the API of the exposed object, which decides whether a bare name is a property.
+    """
+    call = re.fullmatch(r"([\w.]+)\((.*)\)", item)
+    if call is not None:
+        name, arguments = call.groups()
+        return name, [parse_value(argument) for argument in arguments.split(",")] if arguments else []
+    if "=" in item:
+        name, value = item.split("=", 1)
+        return name + ":set", [parse_value(value)]
+    if item + ":get" in methods:
+        return item + ":get", []
+    return item, []
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port)
+
+
+def run_items(fleet, items, methods):
+    """ Executes items as one batch on every instance of fleet, printing what the gets and calls returned. """
+    batch = Batch()
+    for item in items:
+        method, args = parse_item(item, methods)
+        batch.call(method, *args)
+    for connection, values in zip(fleet.connections, fleet.execute(batch)):
+        for item, value in zip(items, values):
+            if value is not None:
+                prefix = connection.address + " " if len(fleet) > 1 else ""
+                print(prefix + item + " = " + json.dumps(value))
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Persistent, batched control client for Hiden RGA simulators")
+    parser.add_argument("-r", "--rpc-host", action="append", default=[],
+                        help="host:port of an instance's control server, may be repeated (default localhost:10000)")
+    parser.add_argument("-o", "--object", default="device", help="exposed object, e.g. device or simulation")
+    parser.add_argument("-t", "--timeout", type=int, default=TIMEOUT, help="ms to wait for the control server")
+    parser.add_argument("--script", action="store_true", help="read a batch of items per line of standard input")
+    parser.add_argument("items", nargs="*", help="name=value, name or name(a,b)")
+    arguments = parser.parse_args(argv)
+
+    addresses = [parse_address(address) for address in arguments.rpc_host or ["localhost:10000"]]
+    with ControlFleet(addresses, arguments.object, arguments.timeout) as fleet:
+        api = fleet.connections[0].api()
+        methods = set(api["methods"])
+        if not arguments.items and not arguments.script:
+            print(api["class"])
+            for method in sorted(methods):
+                print("    " + method)
+            return 0
+        if arguments.items:
+            run_items(fleet, arguments.items, methods)
+        if arguments.script:
+            for line in sys.stdin:
+                items = shlex.split(line, comments=True)
+                if not items:
+                    continue
+                if items[0] == "sleep" and len(items) == 2:
+                    time.sleep(float(items[1]))
+                    continue
+                run_items(fleet, items, methods)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+##################################################
+#
+# Pre-warmed fork server for Hiden RGA simulator instances
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Imports lewis, NumPy and the simulator and builds the gas library and logical
+tables once, then forks instances that are ready to serve. Each instance is the
+same lewis simulation that lewislog.sh starts, on the same ports:
+instance n listens on 5024+n with its lewis control server on 9999+n.
+
+    python -m hidenrga.tools.forkserver --instances 50 --timing
+    python -m hidenrga.tools.forkserver --control 9998 --log-dir /var/log/hidenPyIoc/
+
+With --control, instances are started and stopped on request over a TCP
+connection to localhost, one command per line:
+    start <n>    fork instance n and reply when it accepts connections
+    stop <n>     stop instance n
+    list         the running instances and their process ids
+    quit         stop every instance and the server
+Without it, the server runs until interrupted and then stops its instances.
+
+Forking needs a POSIX host; on Windows use lewis.bat.
+"""
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sys
+import time
+
+DEVICE_PORT = 5024
+RPC_PORT = 9999
+HOST = "localhost"
+
+
+def warm():
+    """
+    Does everything an instance would do before it constructs its device, returning the
+    seconds each step took. The device itself is not constructed here: it starts threads,
+    which do not survive a fork.
+    """
+    timings = {}
+    for module in ["numpy", "lewis.scripts.run", "hidenrga.devices", "hidenrga.interfaces"]:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings["import." + module] = time.perf_counter() - start
+    from lewis.core.devices import DeviceRegistry
+    from hidenrga.devices import SimulatedHidenRGA
+    from hidenrga.devices import gasses
+    start = time.perf_counter()
+    DeviceRegistry("hidenrga").device_builder("interfaces")
+    timings["registry"] = time.perf_counter() - start
+    start = time.perf_counter()
+    gasses.load_library()
+    timings["gas_library"] = time.perf_counter() - start
+    start = time.perf_counter()
+    SimulatedHidenRGA.logical()
+    timings["logical"] = time.perf_counter() - start
+    return timings
+
+
+def lewis_arguments(instance):
+    """ The lewis command line of instance, as in lewislog.sh. """
+    return ["-k", "hidenrga", "interfaces", "-r", HOST + ":" + str(RPC_PORT + instance),
+            "-p", "stream: {bind_address: " + HOST + ", port: " + str(DEVICE_PORT + instance) + "}"]
+
+
+def wait_ready(port, timeout):
+    """ Waits until port accepts connections, returning False on timeout. """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((HOST, port), 0.1).close()
+            return True
+        except OSError:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+
+
+class ForkServer:
+    """
+    The instances forked from this process, by instance number.
+    """
+
+    def __init__(self, log_dir=None):
+        self._log_dir = log_dir
+        self._children = {}
+
+    @property
+    def children(self):
+        return dict(self._children)
+
+    def spawn(self, instance):
+        """
+        Forks instance and returns its process id. The child runs the lewis simulation and never returns.
+        """
+        if instance in self._children:
+            return self._children[instance]
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid != 0:
+            self._children[instance] = pid
+            return pid
+        status = 0
+        try:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.environ["HIDENRGA_LIVE_NAME"] = "hidenrga" + str(instance)
+            if self._log_dir is not None:
+                os.environ["HIDENRGA_LOG_FILE"] = os.path.join(self._log_dir, "hidenrga" + str(instance) + ".log")
+                os.environ["HIDENRGA_HISTORY_DIR"] = os.path.join(self._log_dir, "history" + str(instance))
+                output = os.open(os.path.join(self._log_dir, "lewis_emulator" + str(instance) + ".log"),
+                                 os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+                os.dup2(output, 1)
+                os.dup2(output, 2)
+                os.close(output)
+            from lewis.scripts.run import run_simulation
+            run_simulation(lewis_arguments(instance))
+        except BaseException:
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def start(self, instance, timeout=10.0):
+        """
+        Forks instance and returns the seconds until it accepts connections, or None if it never did.
+        """
+        start = time.perf_counter()
+        self.spawn(instance)
+        if not wait_ready(DEVICE_PORT + instance, timeout):
+            return None
+        return time.perf_counter() - start
+
+    def stop(self, instance, timeout=5.0):
+        """
+        Interrupts instance, as Ctrl+C would, and reaps it. Returns False if it was not running.
+        """
+        pid = self._children.pop(instance, None)
+        if pid is None:
+            return False
+        try:
+            os.kill(pid, signal.SIGINT)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + timeout
+        while os.waitpid(pid, os.WNOHANG) == (0, 0):
+            if time.monotonic() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                break
+            time.sleep(0.01)
+        return True
+
+    def stop_all(self):
+        for instance in list(self._children):
+            self.stop(instance)
+
+    def command(self, line):
+        """
+        Carries out one control command, returning the reply and whether to quit.
+        """
+        words = line.split()
+        if not words:
+            return "", False
+        try:
+            if words[0] == "start" and len(words) == 2:
+                ready = self.start(int(words[1]))
+                if ready is None:
+                    return "error instance " + words[1] + " did not start", False
+                return "started " + words[1] + " " + str(self._children[int(words[1])]) + " " + \
+                    str(round(ready, 3)), False
+            if words[0] == "stop" and len(words) == 2:
+                if not self.stop(int(words[1])):
+                    return "error instance " + words[1] + " is not running", False
+                return "stopped " + words[1], False
+            if words[0] == "list" and len(words) == 1:
+                return " ".join(str(instance) + ":" + str(pid) for instance, pid in sorted(self._children.items())), False
+            if words[0] == "quit" and len(words) == 1:
+                return "bye", True
+        except ValueError:
+            pass
+        return "error unknown command " + line.strip(), False
+
+    def serve(self, port):
+        """
+        Answers control commands from one connection at a time until told to quit.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((HOST, port))
+            listener.listen()
+            while True:
+                connection, address = listener.accept()
+                with connection, connection.makefile("rw", newline="\n") as stream:
+                    for line in stream:
+                        reply, finished = self.command(line)
+                        stream.write(reply + "\n")
+                        stream.flush()
+                        if finished:
+                            return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-warmed fork server for Hiden RGA simulator instances")
+    parser.add_argument("--instances", type=int, default=0, help="instances 1..n to start straight away")
+    parser.add_argument("--control", type=int, help="serve start/stop/list/quit commands on this localhost port")
+    parser.add_argument("--log-dir", help="directory for each instance's logs, as lewislog.sh writes them")
+    parser.add_argument("--timing", action="store_true", help="report import, warm up and startup times")
+    arguments = parser.parse_args(argv)
+    if not hasattr(os, "fork"):
+        parser.error("forking is not available on this platform")
+
+    start = time.perf_counter()
+    timings = warm()
+    warmed = time.perf_counter() - start
+    if arguments.timing:
+        for name, seconds in timings.items():
+            print("%-32s %8.1f ms" % (name, 1000 * seconds))
+        print("%-32s %8.1f ms" % ("warm up", 1000 * warmed))
+
+    # Stop the instances on kill as well as on Ctrl+C, so none are left behind.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = ForkServer(arguments.log_dir)
+    try:
+        start = time.perf_counter()
+        for instance in range(1, arguments.instances + 1):
+            server.spawn(instance)
+        ready = []
+        for instance in range(1, arguments.instances + 1):
+            if wait_ready(DEVICE_PORT + instance, 10.0):
+                ready.append(time.perf_counter() - start)
+            else:
+                print("Instance " + str(instance) + " did not start", file=sys.stderr)
+        if arguments.timing and ready:
+            print("%-32s %8.1f ms" % ("first instance ready", 1000 * ready[0]))
+            print("%-32s %8.1f ms" % (str(len(ready)) + " instances ready", 1000 * ready[-1]))
+        sys.stdout.flush()
+        if arguments.control is not None:
+            server.serve(arguments.control)
+        else:
+            while True:
+                signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+##################################################
+#
+# In-process simulated Hiden RGA instances for tools and benchmarks
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+from lewis.core.simulation import Simulation
+import socket
+import threading
+import time
+
+from ..devices import SimulatedHidenRGA
+from ..interfaces import HidenRGAStreamInterface
+
+
+def free_port(host="localhost"):
+    """ Returns a TCP port that is currently free on host. """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind((host, 0))
+        return probe.getsockname()[1]
+
+
+class LocalInstance:
+    """
+    Runs a lewis simulation of the RGA in a background thread of this process.
+    Equivalent to 'lewis -k hidenrga interfaces -p "stream: {...}"' as run by lewislog.sh.
+    """
+
+    def __init__(self, host="localhost", port=None, rpc_port=None):
+        self._host = host
+        self._port = free_port(host) if port is None else port
+        control_server = None
+        if rpc_port is not None:
+            control_server = host + ":" + str(rpc_port)
+        self._device = SimulatedHidenRGA()
+        interface = HidenRGAStreamInterface()
+        interface.device = self._device
+        adapter = interface.adapter(options={"bind_address": host, "port": self._port})
+        adapter.interface = interface
+        self._simulation = Simulation(device=self._device, adapters=[adapter], control_server=control_server)
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def host(self):
+        return self._host
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def device(self):
+        return self._device
+
+    def start(self, timeout=10.0):
+        self._thread = threading.Thread(target=self._simulation.start, name="lewis-" + str(self._port), daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                socket.create_connection((self._host, self._port), 0.1).close()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.01)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.device.stop(True)
+        self._simulation.stop()
+        self._thread.join(5)
+        self._thread = None
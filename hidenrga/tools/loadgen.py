@@ -0,0 +1,227 @@
+##################################################
+#
+# Multi-client protocol load generator for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Replays IOC sessions against one or more simulated instances and reports
+the achieved request rate, latency percentiles and error counts.
+
+    python -m hidenrga.tools.loadgen --target localhost:5025 --target localhost:5026 --rate 10
+    python -m hidenrga.tools.loadgen --spawn 20 --connections 2 --duration 60
+
+The first connection to each instance plays the IOC that owns the scan: it
+sets the scan up and starts it with 'sjob lget'. Further connections to the
+same instance only do the discovery and then poll 'data', as a second
+client would. Starting the scan from several connections would just make
+them restart each other's scans.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .instances import LocalInstance
+from .stream_client import StreamClient
+
+DISCOVERY_COMMANDS = ["pget name", "pget release", "lid$ groups", "lid$ all", "lget emok", "lget filok", "lget ptrip"]
+SCAN_COMMANDS = ["lset F1 1", "sjob sdel all", "sset scan Ascans", "sset row 1", "sset output mass",
+                 "sset start 1", "sset stop 50", "sset step 1", "sset input Faraday", "sset report 21",
+                 "sset dwell 1", "sset cycles 0", "sjob lget Ascans"]
+STOP_COMMANDS = ["sset state Abort:"]
+ERROR_REPLY = "An error occurred"
+PERCENTILES = [50, 90, 99]
+
+
+class Session(threading.Thread):
+    """
+    One client connection. Keeps its own statistics, so no locking is needed.
+    """
+
+    def __init__(self, host, port, owner, rate, duration, start_barrier):
+        super().__init__(name="session-" + host + ":" + str(port))
+        self.daemon = True
+        self._host = host
+        self._port = port
+        self._owner = owner
+        self._period = 1.0 / rate
+        self._duration = duration
+        self._start_barrier = start_barrier
+        self.latencies = {}
+        self.errors = {}
+        self.requests = 0
+        self.setup_requests = 0  # Sent before the timed polling phase
+
+    def _error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def _command(self, client, command):
+        start = time.perf_counter()
+        reply = client.command(command)
+        elapsed = time.perf_counter() - start
+        self.requests += 1
+        key = command.split(" ")[0] if command.startswith("sset") else command
+        self.latencies.setdefault(key, []).append(elapsed)
+        if reply.startswith(ERROR_REPLY):
+            self._error("error reply")
+        return reply
+
+    def _setup(self, client):
+        for command in DISCOVERY_COMMANDS:
+            self._command(client, command)
+        if self._owner:
+            for command in SCAN_COMMANDS:
+                self._command(client, command)
+        self.setup_requests = self.requests
+
+    def _poll(self, client):
+        start = time.monotonic()
+        deadline = start
+        while deadline - start < self._duration:
+            self._command(client, "data")
+            deadline += self._period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if self._owner:
+            for command in STOP_COMMANDS:
+                self._command(client, command)
+
+    def run(self):
+        client = None
+        try:
+            client = StreamClient(self._host, self._port)
+            self._setup(client)
+        except OSError:
+            self._error("connection")
+            if client is not None:
+                client.close()
+            client = None
+        finally:
+            self._start_barrier.wait()
+        if client is None:
+            return
+        with client:
+            try:
+                self._poll(client)
+            except OSError:
+                self._error("connection")
+
+
+def summarise(sessions, elapsed):
+    latencies = {}
+    errors = {}
+    requests = 0
+    setup_requests = 0
+    for session in sessions:
+        # Only the requests made while the clock was running count towards the rate.
+        requests += session.requests - session.setup_requests
+        setup_requests += session.setup_requests
+        for key, values in session.latencies.items():
+            latencies.setdefault(key, []).extend(values)
+        for key, count in session.errors.items():
+            errors[key] = errors.get(key, 0) + count
+    commands = {}
+    for key, values in sorted(latencies.items()):
+        values = np.array(values)
+        summary = {"count": len(values), "max": float(values.max())}
+        for percentile in PERCENTILES:
+            summary["p" + str(percentile)] = float(np.percentile(values, percentile))
+        commands[key] = summary
+    data_polls = latencies.get("data", [])
+    return {
+        "sessions": len(sessions),
+        "elapsed": elapsed,
+        "requests": requests,
+        "setup_requests": setup_requests,
+        "request_rate": requests / elapsed if elapsed > 0 else 0,
+        "data_rate": len(data_polls) / elapsed if elapsed > 0 else 0,
+        "errors": errors,
+        "commands": commands,
+    }
+
+
+def parse_target(target):
+    host, _, port = target.rpartition(":")
+    return host or "localhost", int(port)
+
+
+def run(targets, connections, rate, duration):
+    barrier = threading.Barrier(len(targets) * connections + 1)
+    sessions = []
+    for host, port in targets:
+        for connection in range(connections):
+            sessions.append(Session(host, port, connection == 0, rate, duration, barrier))
+    for session in sessions:
+        session.start()
+    # Time the polling phase only, once every session has finished its setup.
+    barrier.wait()
+    start = time.monotonic()
+    for session in sessions:
+        session.join()
+    return summarise(sessions, time.monotonic() - start)
+
+
+def print_report(report):
+    print("sessions " + str(report["sessions"]) + ", " + str(report["requests"]) + " requests in " +
+          "{:.1f}".format(report["elapsed"]) + " s, " + "{:.1f}".format(report["request_rate"]) + " requests/s, " +
+          "{:.1f}".format(report["data_rate"]) + " data polls/s, " +
+          str(report["setup_requests"]) + " setup requests untimed")
+    for key, count in sorted(report["errors"].items()):
+        print("errors " + key + ": " + str(count))
+    for key, summary in report["commands"].items():
+        print("{:24s} n={:<7d} ".format(key, summary["count"]) +
+              " ".join("p{}={:.2f}ms".format(percentile, 1000 * summary["p" + str(percentile)]) for percentile in PERCENTILES) +
+              " max={:.2f}ms".format(1000 * summary["max"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hiden RGA simulator load generator")
+    parser.add_argument("--target", action="append", default=[], help="host:port of a simulated instance, may be repeated")
+    parser.add_argument("--spawn", type=int, default=0, help="start this many instances in this process")
+    parser.add_argument("--connections", type=int, default=1, help="connections per instance")
+    parser.add_argument("--rate", type=float, default=5.0, help="data polls per second per connection")
+    parser.add_argument("--duration", type=float, default=10.0, help="polling time in seconds")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    arguments = parser.parse_args(argv)
+
+    targets = [parse_target(target) for target in arguments.target]
+    instances = [LocalInstance() for spawn in range(arguments.spawn)]
+    for instance in instances:
+        instance.start()
+        targets.append((instance.host, instance.port))
+    if not targets:
+        parser.error("no --target given and nothing to --spawn")
+    try:
+        report = run(targets, arguments.connections, arguments.rate, arguments.duration)
+    finally:
+        for instance in instances:
+            instance.stop()
+
+    if arguments.json:
+        json.dump(report, sys.stdout, indent=2)
+        print("")
+    else:
+        print_report(report)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
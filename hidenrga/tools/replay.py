@@ -0,0 +1,115 @@
+##################################################
+#
+# Protocol session replay for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+"""
+Plays a session recorded by the stream interface back to an instance and
+compares the replies with the recorded ones.
+
+    HIDENRGA_CAPTURE_DIR=/tmp/sessions ./lewislog.sh 1
+    python -m hidenrga.tools.replay /tmp/sessions/session-5025-*.jsonl --ignore "^data" --ignore "^tdata"
+    python -m hidenrga.tools.replay session.jsonl --target localhost:5025 --speed 1
+
+Without --target, each session is played to a fresh in-process instance.
+By default requests are sent as fast as the replies come back; with --speed,
+at the recorded times scaled by it. The exit status is 1 if any reply differed.
+Replies that depend on noise or time, such as data, can be left out of the
+comparison with --ignore.
+"""
+import argparse
+import difflib
+import json
+import re
+import sys
+import time
+
+from ..interfaces.capture import read_session
+from .instances import LocalInstance
+from .stream_client import StreamClient
+
+
+def replay(client, records, speed=None, ignore=()):
+    """
+    Sends the requests of records through client and returns
+    (replies, differences, seconds), where differences lists (index, request, recorded, replayed).
+    """
+    replies = []
+    differences = []
+    started = time.monotonic()
+    for index, (seconds, latency, request, recorded) in enumerate(records):
+        if speed:
+            delay = started + seconds / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        client.send(request)
+        # A request without a recorded reply got none, so there is nothing to wait for.
+        reply = client.receive() if recorded is not None else None
+        replies.append(reply)
+        if reply != recorded and not any(pattern.search(request) for pattern in ignore):
+            differences.append((index, request, recorded, reply))
+    return replies, differences, time.monotonic() - started
+
+
+def report(path, records, differences, seconds, context):
+    lines = [path + ": " + str(len(records)) + " requests in " + str(round(seconds, 3)) + " s, " +
+             str(len(differences)) + " differing replies"]
+    for index, request, recorded, reply in differences[:context]:
+        lines.append("#" + str(index) + " " + request)
+        lines.extend("    " + line for line in difflib.unified_diff(
+            [str(recorded)], [str(reply)], "recorded", "replayed", lineterm="", n=0))
+    if len(differences) > context:
+        lines.append("... " + str(len(differences) - context) + " more")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded Hiden RGA simulator sessions")
+    parser.add_argument("sessions", nargs="+", help="session files recorded with HIDENRGA_CAPTURE_DIR")
+    parser.add_argument("--target", help="host:port of a running instance, instead of a fresh one per session")
+    parser.add_argument("--speed", type=float, help="play at the recorded times divided by this, e.g. 1")
+    parser.add_argument("--ignore", action="append", default=[], help="regex of requests whose replies are not compared")
+    parser.add_argument("--context", type=int, default=10, help="differences shown per session")
+    parser.add_argument("--output", help="write JSON results to this file")
+    arguments = parser.parse_args(argv)
+    ignore = [re.compile(pattern) for pattern in arguments.ignore]
+
+    results = []
+    for path in arguments.sessions:
+        header, records = read_session(path)
+        if arguments.target is None:
+            with LocalInstance() as instance:
+                with StreamClient(instance.host, instance.port) as client:
+                    replies, differences, seconds = replay(client, records, arguments.speed, ignore)
+        else:
+            host, port = arguments.target.rsplit(":", 1)
+            with StreamClient(host, int(port)) as client:
+                replies, differences, seconds = replay(client, records, arguments.speed, ignore)
+        print(report(path, records, differences, seconds, arguments.context))
+        results.append({"session": path, "requests": len(records), "seconds": seconds,
+                        "recorded_seconds": records[-1][0] if records else 0,
+                        "differences": [{"index": index, "request": request, "recorded": recorded, "replayed": reply}
+                                        for index, request, recorded, reply in differences]})
+
+    if arguments.output is not None:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    return 1 if any(result["differences"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+##################################################
+#
+# Minimal stream protocol client for Hiden RGA simulator
+#
+# Author : P.J. L. Heesterman (Capgemini Engineering)
+#
+# Copyright (c) : 2023 ITER Organization,
+#                 CS 90 046
+#                 13067 St. Paul-lez-Durance Cedex
+#                 France
+#
+# This file is part of ITER CODAC software.
+# For the terms and conditions of redistribution or use of this software
+# refer to the file ITER-LICENSE.TXT located in the top level directory
+# of the distribution package.
+#
+# This file is part implemenation of RGA-SDM-01 "Hardware simulator"
+#
+##################################################
+import socket
+
+# Must match HidenRGAStreamInterface.in_terminator and out_terminator
+IN_TERMINATOR = b"\r"
+OUT_TERMINATOR = b"\r\n"
+
+
+class StreamClient:
+    """
+    Blocking client speaking the Hiden ASCII protocol, as an IOC would.
+    """
+
+    def __init__(self, host="localhost", port=5025, timeout=5.0):
+        self._socket = socket.create_connection((host, port), timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def send(self, command):
+        self._socket.sendall(command.encode() + IN_TERMINATOR)
+
+    def receive(self):
+        """ Returns the next reply, without terminator. """
+        while True:
+            end = self._buffer.find(OUT_TERMINATOR)
+            if end >= 0:
+                reply = self._buffer[:end]
+                self._buffer = self._buffer[end + len(OUT_TERMINATOR):]
+                return reply.decode()
+            chunk = self._socket.recv(65536)
+            if not chunk:
+                raise ConnectionError("Connection closed by simulator")
+            self._buffer += chunk
+
+    def command(self, command):
+        self.send(command)
+        return self.receive()
@@ -8,5 +8,8 @@ set /A DEVICE_PORT=5024 + %Instance%
 set logdir=/var/log/hidenPyIoc/
 if not exist %logdir% set logdir=../../main/epics/var/log
 set CurrentDir=%~dp0
+set HIDENRGA_LOG_FILE=%logdir%hidenrga%Instance%.log
+set HIDENRGA_HISTORY_DIR=%logdir%history%Instance%
+set HIDENRGA_LIVE_NAME=hidenrga%Instance%
 %LewisPath%lewis.exe -k hidenrga interfaces -r localhost:%RPC_PORT% -p "stream: {bind_address: localhost, port: %DEVICE_PORT%}" -a %CurrentDir% > %logdir%lewis_emulator%Instance%.log 2>&1
 if %errorlevel% equ 130 time /t
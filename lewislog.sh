@@ -9,6 +9,8 @@ DEVICE_PORT=5024+$Instance
 
 CurrentDir=$(dirname "$0")
 export PYTHONPATH=$CurrentDir
+# The latest spectrum and status flags, for dashboards on this host to read from shared memory.
+export HIDENRGA_LIVE_NAME=hidenrga$Instance
 
 LogDir='/var/log/hidenPyIoc/'
 if [ ! -d $LogDir ] || [ ! -w $LogDir ]; then
@@ -20,5 +22,9 @@ if [ ! -d $LogDir ] || [ ! -w $LogDir ]; then
     # Can't write to local log dir either. Leave at stdout and stderr.
     lewis -k hidenrga interfaces -r localhost:$RPC_PORT -p "stream: {bind_address: localhost, port: $DEVICE_PORT}"
 else
+    # The simulator's own log, written from a queue so scans never wait on the file.
+    export HIDENRGA_LOG_FILE="$LogDir"hidenrga$Instance.log
+    # Every completed scan cycle, kept on disk for post-mortem analysis.
+    export HIDENRGA_HISTORY_DIR="$LogDir"history$Instance
     lewis -k hidenrga interfaces -r localhost:$RPC_PORT -p "stream: {bind_address: localhost, port: $DEVICE_PORT}" > "$LogDir"lewis_emulator$Instance.log 2>&1
 fi
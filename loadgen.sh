@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# Replays IOC polling load, e.g. ./loadgen.sh --target localhost:5025 --connections 4 --rate 10
+CurrentDir=$(dirname "$0")
+export PYTHONPATH="$CurrentDir"
+
+python3 -m hidenrga.tools.loadgen "$@"
@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# Replays recorded sessions and diffs the replies, e.g. ./replay.sh sessions/*.jsonl --ignore "^data"
+CurrentDir=$(dirname "$0")
+export PYTHONPATH="$CurrentDir"
+
+python3 -m hidenrga.tools.replay "$@"